@@ -1,5 +1,5 @@
 import os
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, jsonify, request, make_response, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import json
@@ -34,6 +34,20 @@ def handle_options_request():
         response.headers.add('Access-Control-Max-Age', '3600')
         return response
 
+# Tag LLM metrics recorded while handling a request with its route
+from app.services.llm_metrics import set_metric_tags, reset_metric_tags
+
+@app.before_request
+def tag_llm_metrics():
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g.llm_metric_tags = set_metric_tags(route=f"{request.method} {rule}")
+
+@app.teardown_request
+def untag_llm_metrics(exc):
+    token = g.pop('llm_metric_tags', None)
+    if token is not None:
+        reset_metric_tags(token)
+
 # Import routes after app initialization to avoid circular imports
 from app.routes import auth_routes, game_routes, therapy_routes, caregiver_routes, llm_routes, supabase_proxy
 
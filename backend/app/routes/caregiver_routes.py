@@ -20,9 +20,26 @@ from app.services.caregiver_service import (
     add_progress_entry
 )
 from app.services.agent_service import get_caregiver_agent
+from app.services.feature_store import get_patient_features
+from app.services.report_service import get_cognitive_report
+from app.services.conversation_service import (
+    create_conversation,
+    get_conversations,
+    get_messages,
+    resume_session,
+    record_messages
+)
 
 bp = Blueprint('caregiver', __name__, url_prefix='/api/caregiver')
 
+# Instructions for AI care recommendations, sent ahead of the patient's data
+RECOMMENDATION_INSTRUCTIONS = """When asked for care recommendations, provide them in these categories:
+1. Care approaches
+2. Communication strategies
+3. Cognitive exercises
+4. Lifestyle adjustments
+5. Warning signs to watch for"""
+
 @bp.route('/patients/<caregiver_id>', methods=['GET'])
 def patients(caregiver_id):
     """Get all patients associated with a caregiver."""
@@ -151,6 +168,7 @@ def analyze_patient(patient_id):
         patient_data["game_history"] = get_patient_progress(patient_id)
         patient_data["reported_symptoms"] = get_mood_tracking(patient_id)
         patient_data["medications"] = get_medications(patient_id)
+        patient_data["performance_features"] = get_patient_features(patient_id)
         
         # Get caregiver agent and analyze patient data
         agent = get_caregiver_agent()
@@ -163,6 +181,18 @@ def analyze_patient(patient_id):
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Cognitive Report (precomputed nightly)
+@bp.route('/cognitive-report/<patient_id>', methods=['GET'])
+def cognitive_report(patient_id):
+    """Get the cognitive report for a patient, served from the nightly batch when available."""
+    try:
+        report = get_cognitive_report(patient_id)
+        if not report:
+            return jsonify({"status": "error", "message": "No game history for patient"}), 404
+        return jsonify({"status": "success", "report": report})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # AI-Generated Daily Care Plan
 @bp.route('/daily-plan/<patient_id>', methods=['POST'])
 def generate_daily_plan(patient_id):
@@ -219,7 +249,8 @@ def create_note():
         agent = get_caregiver_agent()
         note_analysis = agent.ask(
             f"Analyze this caregiver note and provide insights or recommendations: {content}",
-            "You are analyzing a caregiver's note about a patient. Provide concise, practical insights or recommendations based on the note content. Focus on actionable advice and potential concerns to watch for. Limit your response to 3-5 bullet points."
+            "You are analyzing a caregiver's note about a patient. Provide concise, practical insights or recommendations based on the note content. Focus on actionable advice and potential concerns to watch for. Limit your response to 3-5 bullet points.",
+            options={"task": "note_insight"}
         )
         
         # Add the note with AI insights
@@ -281,26 +312,25 @@ def get_recommendations(patient_id):
         # Get caregiver agent and generate recommendations
         agent = get_caregiver_agent()
         
-        # Format prompt for the agent
-        prompt = f"""Based on the following patient data, provide personalized care recommendations:
-        
-Patient: {patient.get('first_name')} {patient.get('last_name')}
+        # Stable instructions first, then the patient's data, so providers can
+        # cache the prompt prefix; only the short request follows
+        patient_context = f"""Patient: {patient.get('first_name')} {patient.get('last_name')}
 Age: {patient.get('age')}
 Condition: {patient.get('condition')}
 
 Medications: {', '.join([med.get('name') for med in medications])}
 
-Recent moods: {', '.join([entry.get('mood') for entry in context['recent_moods']])}
-
-Please provide recommendations in these categories:
-1. Care approaches
-2. Communication strategies
-3. Cognitive exercises
-4. Lifestyle adjustments
-5. Warning signs to watch for
-"""
+Recent moods: {', '.join([entry.get('mood') for entry in context['recent_moods']])}"""
         
-        recommendations = agent.ask(prompt)
+        # Without history the prompt depends only on the patient's data, so
+        # simultaneous dashboard loads share one upstream call
+        recommendations = agent.ask(
+            "Based on the patient data above, provide personalized care recommendations.",
+            agent.system_prompt,
+            options={"task": "recommendations"},
+            use_history=False,
+            context=[RECOMMENDATION_INSTRUCTIONS, patient_context]
+        )
         
         return jsonify({
             "status": "success", 
@@ -332,4 +362,65 @@ def create_progress():
         )
         return jsonify({"status": "success", "result": result})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 400 
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 400 
+
+# Caregiver Conversations
+@bp.route('/conversations/<caregiver_id>', methods=['GET'])
+def list_conversations(caregiver_id):
+    """Get a caregiver's conversations, most recently active first."""
+    try:
+        conversations = get_conversations(caregiver_id)
+        return jsonify({"status": "success", "conversations": conversations})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@bp.route('/conversation', methods=['POST'])
+def start_conversation():
+    """Start a new conversation with the caregiver assistant."""
+    data = request.json
+    try:
+        conversation = create_conversation(
+            caregiver_id=data.get('caregiver_id'),
+            patient_id=data.get('patient_id'),
+            title=data.get('title')
+        )
+        return jsonify({"status": "success", "conversation": conversation})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@bp.route('/conversation/<conversation_id>/messages', methods=['GET'])
+def list_conversation_messages(conversation_id):
+    """Get a page of messages, newest first; pass next_cursor as `before` for older pages."""
+    try:
+        page = get_messages(
+            conversation_id,
+            before=request.args.get('before'),
+            limit=request.args.get('limit', 50, type=int)
+        )
+        return jsonify({"status": "success", **page})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@bp.route('/conversation/<conversation_id>/message', methods=['POST'])
+def send_conversation_message(conversation_id):
+    """Send a message to the caregiver assistant and store the exchange."""
+    data = request.json
+    try:
+        message = data.get('message', '')
+        
+        # The agent sees the stored summary and recent messages, not the whole conversation
+        agent = get_caregiver_agent(data.get('provider'), data.get('caregiver_id'), conversation_id)
+        resume_session(agent.session, conversation_id)
+        response = agent.ask(message, agent.system_prompt, options={"task": "chat"})
+        
+        if not response.startswith("Error generating response:"):
+            record_messages(conversation_id, [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response}
+            ])
+        
+        return jsonify({"status": "success", "response": response})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
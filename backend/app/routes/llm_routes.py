@@ -1,13 +1,50 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from contextlib import closing
 import os
+import json
 from app.services.agent_service import (
     get_game_agent,
     get_therapy_agent,
     get_caregiver_agent
 )
+from app.services.llm_service import get_llm_service
+from app.services.exercise_pool import get_exercise_pool
+from app.services.llm_metrics import get_metrics, current_metric_tags, metric_tags
 
 bp = Blueprint('llm', __name__, url_prefix='/api/llm')
 
+def _wants_stream(data):
+    """Stream when the body asks for it or the client accepts server-sent events."""
+    return bool(data.get('stream')) or request.accept_mimetypes.best == 'text/event-stream'
+
+def _sse_response(chunks):
+    """Relay text chunks as server-sent events.
+
+    Each chunk is sent as a `data: {"delta": ...}` event (chunks that are
+    already dicts, such as structured fields, are sent as they are), followed by a final
+    `done` event, or an `error` event if generation fails mid-stream. When the
+    client disconnects the server closes this generator, which closes the
+    upstream provider stream and stops generation.
+    """
+    # The stream outlives the request's teardown; keep its metric tags
+    tags = current_metric_tags()
+
+    def events():
+        with metric_tags(**tags), closing(chunks):
+            try:
+                for chunk in chunks:
+                    event = chunk if isinstance(chunk, dict) else {'delta': chunk}
+                    yield f"data: {json.dumps(event)}\n\n"
+                yield "event: done\ndata: {}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @bp.route('/models', methods=['GET'])
 def list_models():
     """List available LLM models."""
@@ -94,6 +131,37 @@ def list_models():
         "default_model_id": default_model_id
     })
 
+@bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss statistics of the LLM response cache for this worker."""
+    cache = get_llm_service().cache
+    return jsonify({
+        "status": "success",
+        "enabled": cache is not None,
+        "stats": cache.stats() if cache else {}
+    })
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """LLM call latency, token usage, errors and cache hit rates for this worker."""
+    service = get_llm_service()
+    return jsonify({
+        "status": "success",
+        "metrics": get_metrics().snapshot(),
+        "cache_stats": {
+            "responses": service.cache.stats() if service.cache else {},
+            "embeddings": service.embedding_cache.stats() if service.embedding_cache else {}
+        }
+    })
+
+@bp.route('/model-routes', methods=['GET'])
+def model_routes():
+    """Task to model tier routing table, with the model used on each provider."""
+    return jsonify({
+        "status": "success",
+        "routes": get_llm_service().router.table()
+    })
+
 @bp.route('/chat', methods=['POST'])
 def chat():
     """General chat endpoint for LLM interaction."""
@@ -117,11 +185,13 @@ def chat():
     if not provider:
         provider = os.environ.get('DEFAULT_LLM_PROVIDER', 'openai')
     
-    # Get game agent (which is based on the general Agent)
-    agent = get_game_agent(provider)
+    # A conversation_id keeps the history on the server, per user and
+    # conversation; otherwise the client's earlier messages are the history
+    user_id = data.get('user_id')
+    conversation_id = data.get('conversation_id')
     
-    # Reset history to prevent contamination
-    agent.reset_history()
+    # Get a game agent (which is based on the general Agent) for this request
+    agent = get_game_agent(provider, user_id, conversation_id)
     
     # Extract just the user messages for the prompt
     formatted_messages = []
@@ -131,26 +201,30 @@ def chat():
             "content": msg.get('content', '')
         })
     
-    options = {
-        "model": model_id
-    }
+    # Routed as a chat task unless the client picked a model
+    options = {"task": "chat"}
+    if model_id:
+        options["model"] = model_id
     
     try:
         # Use the last message as the query and include prior messages as history
         if formatted_messages:
-            # Add all messages before the last one to history
-            for msg in formatted_messages[:-1]:
-                agent._add_to_history(msg["role"], msg["content"])
+            # Prior messages seed the history of a one-off or new conversation
+            if not conversation_id or not agent.history:
+                agent.history = formatted_messages[:-1]
             
             # Use the last message as the query
             last_message = formatted_messages[-1]
+            if _wants_stream(data):
+                return _sse_response(agent.ask_stream(last_message["content"], options=options))
             response = agent.ask(last_message["content"], options=options)
         else:
             response = "No messages provided."
             
         return jsonify({
             "status": "success",
-            "response": response
+            "response": response,
+            "conversation_id": conversation_id
         })
     except Exception as e:
         return jsonify({
@@ -158,9 +232,19 @@ def chat():
             "message": str(e)
         }), 500
 
+def _exercise_events(events, source):
+    """Tag the final exercise event with where the exercise came from."""
+    for event in events:
+        yield dict(event, source=source) if "exercise" in event else event
+
 @bp.route('/generate-exercise', methods=['POST'])
 def generate_exercise():
-    """Generate a cognitive exercise using the game agent."""
+    """Generate a cognitive exercise using the game agent.
+
+    Streaming clients receive each field as a `{"field", "value"}` event as
+    soon as it is generated, then `{"exercise", "source"}` with the whole
+    exercise.
+    """
     data = request.json
     
     game_type = data.get('game_type', 'word puzzle')
@@ -171,10 +255,29 @@ def generate_exercise():
     agent = get_game_agent(provider_name)
     
     try:
+        # Exercises without a user profile are served from the warm pool,
+        # generated live only when it is empty
+        if not user_profile:
+            exercise = get_exercise_pool().take(game_type, difficulty)
+            if exercise is not None and _wants_stream(data):
+                events = [{"field": field, "value": value} for field, value in exercise.items()]
+                return _sse_response(_exercise_events(events + [{"exercise": exercise}], "pool"))
+            if exercise is not None:
+                return jsonify({
+                    "status": "success",
+                    "exercise": exercise,
+                    "source": "pool"
+                })
+        
+        if _wants_stream(data):
+            events = agent.generate_exercise_stream(game_type, difficulty, user_profile)
+            return _sse_response(_exercise_events(events, "live"))
+        
         exercise = agent.generate_exercise(game_type, difficulty, user_profile)
         return jsonify({
             "status": "success",
-            "exercise": exercise
+            "exercise": exercise,
+            "source": "live"
         })
     except Exception as e:
         return jsonify({
@@ -241,6 +344,9 @@ def guided_meditation():
     
     agent = get_therapy_agent(provider_name)
     
+    if _wants_stream(data):
+        return _sse_response(agent.generate_guided_meditation_stream(duration_minutes, focus_area, experience_level))
+    
     try:
         meditation = agent.generate_guided_meditation(duration_minutes, focus_area, experience_level)
         return jsonify({
@@ -277,7 +383,7 @@ def analyze_patient():
 
 @bp.route('/daily-plan', methods=['POST'])
 def daily_plan():
-    """Generate a daily care plan for a patient."""
+    """Generate a daily care plan for a patient, streaming sections as they complete if asked."""
     data = request.json
     
     patient_profile = data.get('patient_profile', {})
@@ -286,6 +392,9 @@ def daily_plan():
     
     agent = get_caregiver_agent(provider_name)
     
+    if _wants_stream(data):
+        return _sse_response(agent.generate_daily_plan_stream(patient_profile, caregiver_constraints))
+    
     try:
         plan = agent.generate_daily_plan(patient_profile, caregiver_constraints)
         return jsonify({
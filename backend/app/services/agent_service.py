@@ -1,6 +1,13 @@
 import logging
-from typing import Dict, List, Any, Optional, Union
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Union, Iterator, Tuple
 from .llm_service import get_llm_service
+from .llm_metrics import get_metrics, metric_tags
+from .agent_sessions import AgentSession, get_session_store
+from app.utils.prompt_builder import PromptBuilder, fit_messages
+from app.utils.structured_output import JSONStreamExtractor, parse_structured, response_schema
+from app.utils.answer_evaluator import evaluate_locally
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -9,77 +16,185 @@ logger = logging.getLogger(__name__)
 class Agent:
     """Base class for all agents in the system"""
     
-    def __init__(self, provider_name: str = None):
-        """Initialize the agent with a specific LLM provider"""
+    def __init__(self, provider_name: str = None, session: AgentSession = None):
+        """Initialize the agent with a specific LLM provider
+        
+        Agents are cheap views over the shared LLM service: create one per
+        request. The conversation history lives in `session` (see
+        `get_session_store`); without one the agent starts with a private,
+        empty history.
+        """
         self.llm_service = get_llm_service()
         self.provider_name = provider_name
         self.provider = self.llm_service.get_provider(provider_name)
-        self.history = []
+        self.session = session or AgentSession(get_session_store().max_tokens)
+    
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """The conversation history, as of now"""
+        return self.session.messages
+    
+    @history.setter
+    def history(self, messages: List[Dict[str, str]]):
+        self.session.messages = messages
     
     def _add_to_history(self, role: str, content: str):
-        """Add a message to the conversation history"""
-        self.history.append({"role": role, "content": content})
-        # Keep history to a reasonable size
-        if len(self.history) > 20:
-            # Remove oldest messages but keep the system message if it exists
-            if self.history[0]["role"] == "system":
-                self.history = [self.history[0]] + self.history[-19:]
-            else:
-                self.history = self.history[-20:]
-    
-    def ask(self, query: str, system_prompt: str = None, options: Dict[str, Any] = None) -> str:
-        """Ask the agent a question and get a response"""
+        """Add a message to the conversation history (oldest messages beyond its token bound are dropped)"""
+        self.session.append({"role": role, "content": content})
+    
+    def _record_exchange(self, query: str, response: str):
+        """Add a question and its answer to the history as one unit
+        
+        Failed calls are not recorded, so their error text never reaches
+        later prompts or the running summary.
+        """
+        if response.startswith("Error generating response:"):
+            return
+        self.session.append({"role": "user", "content": query}, {"role": "assistant", "content": response})
+    
+    def _build_messages(self, query: str, system_prompt: str = None, use_history: bool = True,
+                        options: Dict[str, Any] = None, context: List[str] = None) -> List[Dict[str, str]]:
+        """Assemble system prompt, context, history and the new query into chat messages
+        
+        The stable parts come first so providers can cache the prompt prefix:
+        the agent's system prompt, then `context` blocks (task instructions,
+        patient data) as further system messages, ordered from most to least
+        stable. Only the conversation summary, history and the query vary from
+        call to call.
+        
+        The oldest history is dropped as needed to keep the messages within
+        the prompt token budget (options["token_budget"] or LLM_PROMPT_TOKEN_BUDGET).
+        """
         messages = []
         
         # Add system prompt if provided
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         
-        # Add history if available
-        if self.history:
+        # Add stable context blocks
+        for block in context or []:
+            if block:
+                messages.append({"role": "system", "content": block})
+        
+        # Add the summary of earlier conversation, then the recent history
+        if use_history:
+            if self.session.summary:
+                summary = f"Summary of the conversation so far:\n{self.session.summary}"
+                messages.append({"role": "system", "content": summary})
             messages.extend(self.history)
         
         # Add the new query
         messages.append({"role": "user", "content": query})
         
-        # Get response from LLM
-        response = self.provider.generate_chat(messages, options)
+        options = options or {}
+        return fit_messages(messages, options.get("token_budget"), options.get("model"))
+    
+    def ask(self, query: str, system_prompt: str = None, options: Dict[str, Any] = None, use_history: bool = True,
+            context: List[str] = None) -> str:
+        """Ask the agent a question and get a response
+        
+        One-shot requests pass use_history=False: the prompt is sent without
+        the conversation history and the exchange is not recorded, which also
+        lets identical requests be served from the response cache.
+        Stable instructions and data go in `context` rather than the query
+        (see `_build_messages`).
+        """
+        messages = self._build_messages(query, system_prompt, use_history, options, context)
+        
+        # Get response from LLM (through the service's response cache)
+        with metric_tags(agent=type(self).__name__):
+            response = self.llm_service.generate_chat(messages, options, self.provider)
         
         # Add to history
-        self._add_to_history("user", query)
-        self._add_to_history("assistant", response)
+        if use_history:
+            self._record_exchange(query, response)
+        
+        return response
+    
+    async def aask(self, query: str, system_prompt: str = None, options: Dict[str, Any] = None, use_history: bool = True,
+                   context: List[str] = None) -> str:
+        """Async `ask`, so several prompts can be issued concurrently.
+        
+        Each call sees the history as it was when the call started; the
+        exchange is appended when its response arrives.
+        """
+        messages = self._build_messages(query, system_prompt, use_history, options, context)
+        
+        with metric_tags(agent=type(self).__name__):
+            response = await self.llm_service.agenerate_chat(messages, options, self.provider)
+        
+        if use_history:
+            self._record_exchange(query, response)
         
         return response
     
+    def ask_json(self, query: str, schema: str, system_prompt: str = None, options: Dict[str, Any] = None,
+                 use_history: bool = True, context: List[str] = None) -> Any:
+        """Ask for a response matching one of the structured output SCHEMAS, decoded
+        
+        The provider is asked to constrain its output to the schema (JSON
+        schema mode, a forced tool call, or a sampling grammar), and the
+        response is validated before it is returned.
+        
+        Raises:
+            StructuredOutputError: If the response is not JSON matching the schema
+        """
+        options = dict(options or {}, response_schema=response_schema(schema))
+        response = self.ask(query, system_prompt, options, use_history, context)
+        if response.startswith("Error generating response:"):
+            # The call itself failed; not a parse failure
+            raise RuntimeError(response)
+        return parse_structured(response, schema)
+    
+    def ask_json_stream(self, query: str, schema: str, system_prompt: str = None, options: Dict[str, Any] = None,
+                        use_history: bool = True, context: List[str] = None) -> Iterator[Tuple[Optional[str], Any]]:
+        """Stream a structured response, yielding its top-level fields as they complete
+        
+        Yields (field, value) pairs as each field of the JSON object closes,
+        then (None, value) with the whole response once it has been
+        validated against the schema.
+        
+        Raises:
+            StructuredOutputError: If the response is not JSON matching the schema
+        """
+        options = dict(options or {}, response_schema=response_schema(schema))
+        extractor = JSONStreamExtractor()
+        chunks = []
+        with closing(self.ask_stream(query, system_prompt, options, context, use_history)) as stream:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield from extractor.feed(chunk)
+        yield None, parse_structured("".join(chunks), schema)
+    
+    def ask_stream(self, query: str, system_prompt: str = None, options: Dict[str, Any] = None,
+                   context: List[str] = None, use_history: bool = True) -> Iterator[str]:
+        """Ask the agent a question and yield the response as it is generated.
+        
+        The exchange is added to history only if the stream completes, so a
+        cancelled stream leaves no partial answer behind.
+        """
+        messages = self._build_messages(query, system_prompt, use_history, options=options, context=context)
+        options = options or {}
+        
+        chunks = []
+        tags = metric_tags(agent=type(self).__name__, task=options.get("task"))
+        with tags, closing(self.llm_service.generate_chat_stream(messages, options, self.provider)) as stream:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        
+        if use_history:
+            self._record_exchange(query, "".join(chunks))
+    
     def reset_history(self):
         """Clear the conversation history"""
-        self.history = []
+        self.session.clear()
 
 class GameAgent(Agent):
     """Agent specialized for cognitive games and exercises"""
     
-    def __init__(self, provider_name: str = None):
-        super().__init__(provider_name)
-        
-        # Set default system prompt
-        self.system_prompt = """You are a specialized AI assistant for cognitive games and exercises. 
-Your goal is to help users with word games, puzzles, and cognitive exercises that can improve memory,
-attention, and language skills. Be encouraging, adaptive to different difficulty levels, and provide
-hints without giving away answers completely."""
-    
-    def generate_exercise(self, game_type: str, difficulty: str, user_profile: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Generate a new cognitive exercise based on game type and difficulty"""
-        prompt = f"""Generate a new {game_type} cognitive exercise at {difficulty} difficulty level."""
-        
-        if user_profile:
-            prompt += f"""\nThis is for a user with the following profile:
-Age: {user_profile.get('age', 'unknown')}
-Cognitive strengths: {user_profile.get('strengths', 'unknown')}
-Areas needing improvement: {user_profile.get('improvement_areas', 'unknown')}
-Previous performance: {user_profile.get('previous_performance', 'unknown')}"""
-        
-        # Request a specific format for the response
-        prompt += """\nPlease structure your response as a JSON object with the following fields:
+    # Task instructions sent as stable context ahead of the per-call request
+    EXERCISE_FORMAT = """Structure each exercise as a JSON object with the following fields:
 1. title - The title of the exercise
 2. instructions - Clear and concise instructions for the user
 3. content - The actual exercise content (words, questions, etc.)
@@ -88,23 +203,37 @@ Previous performance: {user_profile.get('previous_performance', 'unknown')}"""
 6. validation_criteria - How to validate if the user's answer is correct
 
 Make sure the exercise is appropriate for the difficulty level and engaging for the user."""
+    
+    EVALUATION_FORMAT = """You will evaluate user answers to the cognitive exercise below. For each answer, provide feedback
+as a JSON object with the following fields:
+1. correct - Whether the answer is correct (true, also for partially correct answers) or not (false)
+2. score - A score from 0-100
+3. feedback - Constructive feedback, noting if the answer is only partially correct
+4. suggestion - A suggestion for improvement if needed
+5. encouragement - Encouragement for the user"""
+    
+    def __init__(self, provider_name: str = None, session: AgentSession = None):
+        super().__init__(provider_name, session)
+        
+        # Set default system prompt
+        self.system_prompt = """You are a specialized AI assistant for cognitive games and exercises. 
+Your goal is to help users with word games, puzzles, and cognitive exercises that can improve memory,
+attention, and language skills. Be encouraging, adaptive to different difficulty levels, and provide
+hints without giving away answers completely."""
+    
+    def generate_exercise(self, game_type: str, difficulty: str, user_profile: Dict[str, Any] = None,
+                          options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Generate a new cognitive exercise based on game type and difficulty
+        
+        `options` are merged into the call's LLM options (e.g. to disable
+        caching when generating several distinct exercises).
+        """
+        prompt, context = self._exercise_request(game_type, difficulty, user_profile)
         
         # Get response and parse as JSON
         try:
-            response = self.ask(prompt, self.system_prompt)
-            # Find JSON in the response (might be wrapped in ```json...``` or just plain text)
-            import json
-            import re
-            
-            # Try to find JSON in markdown code blocks
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # Assume the entire response is JSON
-                json_str = response
-                
-            exercise = json.loads(json_str)
+            exercise = self.ask_json(prompt, "exercise", self.system_prompt, options={"task": "exercise", **(options or {})},
+                                     context=context)
             return exercise
         except Exception as e:
             logger.error(f"Error generating exercise: {str(e)}")
@@ -113,40 +242,56 @@ Make sure the exercise is appropriate for the difficulty level and engaging for
                 "details": str(e)
             }
     
+    def generate_exercise_stream(self, game_type: str, difficulty: str,
+                                 user_profile: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """Generate an exercise, yielding {"field", "value"} events as its fields complete
+        
+        The last event is {"exercise": ...} with the validated exercise.
+        """
+        prompt, context = self._exercise_request(game_type, difficulty, user_profile)
+        for field, value in self.ask_json_stream(prompt, "exercise", self.system_prompt,
+                                                 options={"task": "exercise"}, context=context):
+            yield {"field": field, "value": value} if field is not None else {"exercise": value}
+    
+    def _exercise_request(self, game_type: str, difficulty: str, user_profile: Dict[str, Any] = None):
+        """Prompt and context blocks for an exercise request"""
+        profile = None
+        if user_profile:
+            profile = f"""This is for a user with the following profile:
+Age: {user_profile.get('age', 'unknown')}
+Cognitive strengths: {user_profile.get('strengths', 'unknown')}
+Areas needing improvement: {user_profile.get('improvement_areas', 'unknown')}
+Previous performance: {user_profile.get('previous_performance', 'unknown')}"""
+        
+        prompt = f"""Generate a new {game_type} cognitive exercise at {difficulty} difficulty level."""
+        return prompt, [self.EXERCISE_FORMAT, profile]
+    
     def evaluate_answer(self, exercise: Dict[str, Any], user_answer: str) -> Dict[str, Any]:
-        """Evaluate a user's answer to a cognitive exercise"""
-        prompt = f"""Evaluate the following user answer to a cognitive exercise:
+        """Evaluate a user's answer to a cognitive exercise
         
-Exercise: {exercise['title']}
+        Answers with a checkable solution (exact, misspelled, numeric, or a
+        list compared as a set or sequence) are scored locally at once; only
+        free-form or ambiguous answers go to the LLM.
+        """
+        evaluation = evaluate_locally(exercise, user_answer)
+        get_metrics().record_evaluation(evaluation["method"] if evaluation else "llm")
+        if evaluation is not None:
+            return evaluation
+        
+        # The exercise is the same for every answer to it, so it stays in the cached prefix
+        details = f"""Exercise: {exercise['title']}
 Instructions: {exercise['instructions']}
 Content: {exercise['content']}
 Correct solution: {exercise['solution']}
-Validation criteria: {exercise['validation_criteria']}
-
-User's answer: {user_answer}
-
-Please provide feedback on the user's answer. Include:
-1. Whether the answer is correct or partially correct
-2. A score from 0-100
-3. Constructive feedback
-4. A suggestion for improvement if needed
-5. Encouragement for the user
+Validation criteria: {exercise['validation_criteria']}"""
+        
+        prompt = f"""Evaluate the following user answer to the exercise:
 
-Structure your response as a JSON object."""
+User's answer: {user_answer}"""
         
         try:
-            response = self.ask(prompt, self.system_prompt)
-            # Find JSON in the response
-            import json
-            import re
-            
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response
-                
-            evaluation = json.loads(json_str)
+            evaluation = self.ask_json(prompt, "evaluation", self.system_prompt, options={"task": "evaluation"},
+                                       context=[self.EVALUATION_FORMAT, details])
             return evaluation
         except Exception as e:
             logger.error(f"Error evaluating answer: {str(e)}")
@@ -161,8 +306,27 @@ Structure your response as a JSON object."""
 class TherapyAgent(Agent):
     """Agent specialized for sound therapy and relaxation"""
     
-    def __init__(self, provider_name: str = None):
-        super().__init__(provider_name)
+    # Task instructions sent as stable context ahead of the per-call request
+    SOUND_FORMAT = """When asked for sound therapy options, recommend 3-5 of them. Structure your response as a JSON object 
+whose "recommendations" field is an array of objects, where each object has the following fields:
+1. title - Name of the recommended sound or track
+2. category - Category (nature, ambient, music, etc.)
+3. duration - Recommended duration in minutes
+4. description - Why this is recommended and its benefits
+5. instructions - How to best experience this sound (environment, posture, etc.)"""
+    
+    MEDITATION_FORMAT = """When asked for a guided meditation script, the script should include:
+1. A gentle introduction
+2. Breathing instructions
+3. Guided visualization
+4. Periodic reminders to refocus attention
+5. A gentle conclusion
+
+Make sure the pacing is appropriate for the length of the session and the language 
+is calming and supportive."""
+    
+    def __init__(self, provider_name: str = None, session: AgentSession = None):
+        super().__init__(provider_name, session)
         
         # Set default system prompt
         self.system_prompt = """You are a specialized AI assistant for sound therapy and relaxation.
@@ -180,28 +344,12 @@ and stress reduction."""
         if therapy_goal:
             prompt += f"\nTherapy goal: {therapy_goal}"
         
-        prompt += """\nPlease recommend 3-5 sound therapy options. Structure your response as a JSON array of objects, 
-where each object has the following fields:
-1. title - Name of the recommended sound or track
-2. category - Category (nature, ambient, music, etc.)
-3. duration - Recommended duration in minutes
-4. description - Why this is recommended and its benefits
-5. instructions - How to best experience this sound (environment, posture, etc.)"""
-        
         try:
-            response = self.ask(prompt, self.system_prompt)
-            # Parse JSON response
-            import json
-            import re
-            
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response
-                
-            recommendations = json.loads(json_str)
-            return recommendations
+            # The same mood and preferences recur often; serve repeats from cache
+            recommendations = self.ask_json(prompt, "sound_recommendations", self.system_prompt,
+                                            options={"cache": True, "task": "sounds"}, use_history=False,
+                                            context=[self.SOUND_FORMAT])
+            return recommendations["recommendations"]
         except Exception as e:
             logger.error(f"Error generating sound recommendations: {str(e)}")
             return [{
@@ -214,27 +362,47 @@ where each object has the following fields:
     
     def generate_guided_meditation(self, duration_minutes: int, focus_area: str, user_experience_level: str = "beginner") -> str:
         """Generate a guided meditation script based on user preferences"""
-        prompt = f"""Create a guided meditation script for a {duration_minutes}-minute meditation 
-focusing on {focus_area} for a {user_experience_level} level practitioner.
-
-The script should include:
-1. A gentle introduction
-2. Breathing instructions
-3. Guided visualization
-4. Periodic reminders to refocus attention
-5. A gentle conclusion
-
-Make sure the pacing is appropriate for a {duration_minutes}-minute session and the language 
-is calming and supportive."""
-        
-        response = self.ask(prompt, self.system_prompt)
+        prompt = self._meditation_prompt(duration_minutes, focus_area, user_experience_level)
+        response = self.ask(prompt, self.system_prompt, options={"task": "meditation"},
+                            context=[self.MEDITATION_FORMAT])
         return response
+    
+    def generate_guided_meditation_stream(self, duration_minutes: int, focus_area: str, user_experience_level: str = "beginner") -> Iterator[str]:
+        """Stream a guided meditation script as it is generated"""
+        prompt = self._meditation_prompt(duration_minutes, focus_area, user_experience_level)
+        return self.ask_stream(prompt, self.system_prompt, options={"task": "meditation"},
+                               context=[self.MEDITATION_FORMAT])
+    
+    def _meditation_prompt(self, duration_minutes: int, focus_area: str, user_experience_level: str) -> str:
+        """Build the guided meditation request"""
+        return f"""Create a guided meditation script for a {duration_minutes}-minute meditation 
+focusing on {focus_area} for a {user_experience_level} level practitioner."""
 
 class CaregiverAgent(Agent):
     """Agent specialized for caregiver support and patient management"""
     
-    def __init__(self, provider_name: str = None):
-        super().__init__(provider_name)
+    # Task instructions sent as stable context ahead of the per-call request
+    ANALYSIS_FORMAT = """When asked to analyze patient data, provide insights on progress, areas for improvement, and recommendations.
+Structure your analysis as a JSON object with the following sections:
+1. progress_summary - Overall assessment of patient progress
+2. cognitive_strengths - Areas where the patient is showing good performance
+3. improvement_areas - Areas that need attention or improvement
+4. recommendations - Specific recommendations for games, exercises, or therapy
+5. caregiver_tips - Practical tips for the caregiver
+6. follow_up - Suggested follow-up actions or assessments"""
+    
+    DAILY_PLAN_FORMAT = """When asked for a daily care and activity plan, structure it as a JSON object with the following sections:
+1. morning_routine - Activities and care for the morning
+2. cognitive_exercises - Recommended cognitive games or exercises (2-3)
+3. physical_activities - Recommended physical activities suitable for patient's mobility
+4. meals - Meal suggestions considering nutritional needs
+5. therapy_sessions - Any recommended therapy sessions
+6. social_engagement - Ideas for social interaction
+7. evening_routine - Activities and care for the evening
+8. caregiver_breaks - Suggested times for caregiver rest and self-care"""
+    
+    def __init__(self, provider_name: str = None, session: AgentSession = None):
+        super().__init__(provider_name, session)
         
         # Set default system prompt
         self.system_prompt = """You are a specialized AI assistant for caregivers managing patients with cognitive concerns.
@@ -249,51 +417,45 @@ guidance, always clarify that you're not replacing professional medical advice."
         therapy_history = patient_data.get("therapy_history", [])
         medications = patient_data.get("medications", [])
         symptoms = patient_data.get("reported_symptoms", [])
+        features = patient_data.get("performance_features")
         
-        # Create a prompt for the LLM
-        prompt = """Analyze the following patient data and provide insights on progress, areas for improvement, and recommendations:"""
+        # Create a prompt for the LLM, trimmed by priority to the token budget
+        builder = PromptBuilder()
+        builder.add("""Analyze the following patient data:""", required=True)
         
-        if game_history:
-            prompt += "\n\nGame Performance History:"
-            for game in game_history[:5]:  # Limit to most recent 5 for brevity
-                prompt += f"\n- Game: {game.get('game_name')}, Score: {game.get('score')}, Date: {game.get('date')}"
+        if features:
+            summary = "\n\nPerformance Summary (all sessions):"
+            summary += f"\n- Sessions: {int(features['sessions'])}, Average Score: {features['mean_score']:.1f}, Average Errors: {features['mean_errors']:.1f}"
+            summary += f"\n- Recent Average Score (last 5): {features['rolling_score']:.1f}, Score Trend Per Session: {features['score_slope']:+.2f}"
+            if features.get('change_points'):
+                last_change = datetime.fromtimestamp(features['last_change_point_at']).strftime('%Y-%m-%d')
+                summary += f"\n- Sustained performance drops detected: {int(features['change_points'])} (most recent {last_change})"
+            builder.add(summary, priority=4)
         
-        if therapy_history:
-            prompt += "\n\nTherapy Session History:"
-            for session in therapy_history[:5]:
-                prompt += f"\n- Type: {session.get('therapy_type')}, Duration: {session.get('duration')} min, Mood Change: {session.get('mood_change', 'Not reported')}, Date: {session.get('date')}"
+        builder.add_items("\n\nGame Performance History:", [
+            f"\n- Game: {game.get('game_name')}, Score: {game.get('score')}, Date: {game.get('date')}"
+            for game in game_history[:5]  # Limit to most recent 5 for brevity
+        ], priority=3)
         
-        if medications:
-            prompt += "\n\nCurrent Medications:"
-            for med in medications:
-                prompt += f"\n- {med.get('name')}, Dosage: {med.get('dosage')}, Schedule: {med.get('schedule')}"
+        builder.add_items("\n\nTherapy Session History:", [
+            f"\n- Type: {session.get('therapy_type')}, Duration: {session.get('duration')} min, Mood Change: {session.get('mood_change', 'Not reported')}, Date: {session.get('date')}"
+            for session in therapy_history[:5]
+        ], priority=1)
         
-        if symptoms:
-            prompt += "\n\nReported Symptoms:"
-            for symptom in symptoms:
-                prompt += f"\n- {symptom.get('description')}, Severity: {symptom.get('severity')}, Date: {symptom.get('date')}"
+        builder.add_items("\n\nCurrent Medications:", [
+            f"\n- {med.get('name')}, Dosage: {med.get('dosage')}, Schedule: {med.get('schedule')}"
+            for med in medications
+        ], priority=2)
         
-        prompt += """\n\nPlease structure your analysis as a JSON object with the following sections:
-1. progress_summary - Overall assessment of patient progress
-2. cognitive_strengths - Areas where the patient is showing good performance
-3. improvement_areas - Areas that need attention or improvement
-4. recommendations - Specific recommendations for games, exercises, or therapy
-5. caregiver_tips - Practical tips for the caregiver
-6. follow_up - Suggested follow-up actions or assessments"""
+        builder.add_items("\n\nReported Symptoms:", [
+            f"\n- {symptom.get('description')}, Severity: {symptom.get('severity')}, Date: {symptom.get('date')}"
+            for symptom in symptoms
+        ], priority=3)
+        prompt = builder.build()
         
         try:
-            response = self.ask(prompt, self.system_prompt)
-            # Parse JSON response
-            import json
-            import re
-            
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response
-                
-            analysis = json.loads(json_str)
+            analysis = self.ask_json(prompt, "patient_analysis", self.system_prompt, options={"task": "analysis"},
+                                     context=[self.ANALYSIS_FORMAT])
             return analysis
         except Exception as e:
             logger.error(f"Error analyzing patient progress: {str(e)}")
@@ -308,44 +470,13 @@ guidance, always clarify that you're not replacing professional medical advice."
     
     def generate_daily_plan(self, patient_profile: Dict[str, Any], caregiver_constraints: Dict[str, Any] = None) -> Dict[str, Any]:
         """Generate a daily care and activity plan for a patient"""
-        prompt = """Generate a daily care and activity plan for a patient with the following profile:"""
-        
-        prompt += f"\nAge: {patient_profile.get('age', 'unknown')}"
-        prompt += f"\nCognitive condition: {patient_profile.get('condition', 'unknown')}"
-        prompt += f"\nMobility level: {patient_profile.get('mobility', 'unknown')}"
-        prompt += f"\nCognitive strengths: {patient_profile.get('strengths', 'unknown')}"
-        prompt += f"\nAreas needing improvement: {patient_profile.get('improvement_areas', 'unknown')}"
-        prompt += f"\nInterests/hobbies: {patient_profile.get('interests', 'unknown')}"
-        
-        if caregiver_constraints:
-            prompt += "\n\nCaregiver constraints:"
-            prompt += f"\nAvailable time: {caregiver_constraints.get('available_time', 'unknown')}"
-            prompt += f"\nSupport network: {caregiver_constraints.get('support_network', 'unknown')}"
-            prompt += f"\nOther considerations: {caregiver_constraints.get('considerations', 'unknown')}"
-        
-        prompt += """\n\nPlease structure your daily plan as a JSON object with the following sections:
-1. morning_routine - Activities and care for the morning
-2. cognitive_exercises - Recommended cognitive games or exercises (2-3)
-3. physical_activities - Recommended physical activities suitable for patient's mobility
-4. meals - Meal suggestions considering nutritional needs
-5. therapy_sessions - Any recommended therapy sessions
-6. social_engagement - Ideas for social interaction
-7. evening_routine - Activities and care for the evening
-8. caregiver_breaks - Suggested times for caregiver rest and self-care"""
+        prompt = self._daily_plan_prompt(patient_profile, caregiver_constraints)
         
         try:
-            response = self.ask(prompt, self.system_prompt)
-            # Parse JSON response
-            import json
-            import re
-            
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response
-                
-            daily_plan = json.loads(json_str)
+            # Plans depend only on the profile and constraints; serve repeats from cache
+            daily_plan = self.ask_json(prompt, "daily_plan", self.system_prompt,
+                                       options={"cache": True, "task": "plan"}, use_history=False,
+                                       context=[self.DAILY_PLAN_FORMAT])
             return daily_plan
         except Exception as e:
             logger.error(f"Error generating daily plan: {str(e)}")
@@ -359,30 +490,50 @@ guidance, always clarify that you're not replacing professional medical advice."
                 "evening_routine": ["Calm activities before bed", "Medication", "Regular sleep schedule"],
                 "caregiver_breaks": ["Short breaks when patient is engaged in an activity", "Self-care is important"]
             }
+    
+    def generate_daily_plan_stream(self, patient_profile: Dict[str, Any],
+                                   caregiver_constraints: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """Generate a daily plan, yielding {"field", "value"} events as its sections complete
+        
+        The last event is {"plan": ...} with the validated plan.
+        """
+        prompt = self._daily_plan_prompt(patient_profile, caregiver_constraints)
+        for field, value in self.ask_json_stream(prompt, "daily_plan", self.system_prompt, options={"task": "plan"},
+                                                 use_history=False, context=[self.DAILY_PLAN_FORMAT]):
+            yield {"field": field, "value": value} if field is not None else {"plan": value}
+    
+    def _daily_plan_prompt(self, patient_profile: Dict[str, Any], caregiver_constraints: Dict[str, Any] = None) -> str:
+        prompt = """Generate a daily care and activity plan for a patient with the following profile:"""
+        
+        prompt += f"\nAge: {patient_profile.get('age', 'unknown')}"
+        prompt += f"\nCognitive condition: {patient_profile.get('condition', 'unknown')}"
+        prompt += f"\nMobility level: {patient_profile.get('mobility', 'unknown')}"
+        prompt += f"\nCognitive strengths: {patient_profile.get('strengths', 'unknown')}"
+        prompt += f"\nAreas needing improvement: {patient_profile.get('improvement_areas', 'unknown')}"
+        prompt += f"\nInterests/hobbies: {patient_profile.get('interests', 'unknown')}"
+        
+        if caregiver_constraints:
+            prompt += "\n\nCaregiver constraints:"
+            prompt += f"\nAvailable time: {caregiver_constraints.get('available_time', 'unknown')}"
+            prompt += f"\nSupport network: {caregiver_constraints.get('support_network', 'unknown')}"
+            prompt += f"\nOther considerations: {caregiver_constraints.get('considerations', 'unknown')}"
+        return prompt
 
 
-# Singleton instances
-_game_agent = None
-_therapy_agent = None
-_caregiver_agent = None
+def _session(user_id: Optional[str], conversation_id: Optional[str]) -> Optional[AgentSession]:
+    """The stored session for a conversation, or None for a one-off request"""
+    if conversation_id is None:
+        return None
+    return get_session_store().get(user_id, conversation_id)
 
-def get_game_agent(provider_name: str = None) -> GameAgent:
-    """Get the singleton game agent instance"""
-    global _game_agent
-    if _game_agent is None:
-        _game_agent = GameAgent(provider_name)
-    return _game_agent
+def get_game_agent(provider_name: str = None, user_id: str = None, conversation_id: str = None) -> GameAgent:
+    """Get a game agent for one request, with the conversation's history if given"""
+    return GameAgent(provider_name, _session(user_id, conversation_id))
 
-def get_therapy_agent(provider_name: str = None) -> TherapyAgent:
-    """Get the singleton therapy agent instance"""
-    global _therapy_agent
-    if _therapy_agent is None:
-        _therapy_agent = TherapyAgent(provider_name)
-    return _therapy_agent
+def get_therapy_agent(provider_name: str = None, user_id: str = None, conversation_id: str = None) -> TherapyAgent:
+    """Get a therapy agent for one request, with the conversation's history if given"""
+    return TherapyAgent(provider_name, _session(user_id, conversation_id))
 
-def get_caregiver_agent(provider_name: str = None) -> CaregiverAgent:
-    """Get the singleton caregiver agent instance"""
-    global _caregiver_agent
-    if _caregiver_agent is None:
-        _caregiver_agent = CaregiverAgent(provider_name)
-    return _caregiver_agent 
\ No newline at end of file
+def get_caregiver_agent(provider_name: str = None, user_id: str = None, conversation_id: str = None) -> CaregiverAgent:
+    """Get a caregiver agent for one request, with the conversation's history if given"""
+    return CaregiverAgent(provider_name, _session(user_id, conversation_id))
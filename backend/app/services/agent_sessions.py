@@ -0,0 +1,241 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Callable
+
+from app.utils.prompt_builder import count_message_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Longest running summary (tokens) the summarizer is asked for
+SUMMARY_TOKENS = int(os.environ.get("AGENT_SUMMARY_TOKENS", 300))
+
+SUMMARY_PROMPT = f"""You maintain a running summary of a conversation for the assistant taking part in it.
+Merge the earlier summary, if any, with the messages that follow it. Keep names, facts about the user and
+the people they care for, decisions, advice already given, open questions and stated preferences. Leave out
+greetings and small talk. Write plain prose in at most {SUMMARY_TOKENS * 3 // 4} words."""
+
+def summarize_history(summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Fold messages into the running summary with the fast model tier"""
+    from app.services.llm_service import get_llm_service
+
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if summary:
+        transcript = f"Earlier summary:\n{summary}\n\nMessages:\n{transcript}"
+    response = get_llm_service().generate_chat(
+        [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+        options={"task": "summary", "max_tokens": SUMMARY_TOKENS, "temperature": 0.2, "cache": False}
+    )
+    if response.startswith("Error generating response:"):
+        raise RuntimeError(response)
+    return response.strip()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _summary_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.environ.get("AGENT_SUMMARY_CONCURRENCY", 2)),
+                                           thread_name_prefix="agent-summary")
+        return _executor
+
+class AgentSession:
+    """
+    The conversation history of one user's conversation.
+
+    History is bounded by tokens rather than message count: the oldest
+    messages are dropped once it exceeds `max_tokens`, along with an answer
+    whose question was dropped. Exchanges are appended atomically, so concurrent
+    requests on one conversation never interleave half an exchange.
+
+    With a `summarizer`, older turns are compressed rather than lost: once
+    the history passes `summarize_at` tokens, everything but the newest
+    `keep_tokens` is folded into the running `summary` in the background.
+    The messages stay in the history until their summary is ready, so the
+    prompt (summary plus recent turns) stays about the same size however long
+    the conversation runs. `on_summary` is called with each new summary,
+    e.g. to store it.
+
+    Args:
+        summarizer (callable): (summary, messages) -> new summary
+    """
+
+    def __init__(self, max_tokens: int = 2000, summarizer: Callable[[Optional[str], List[Dict[str, str]]], str] = None,
+                 summarize_at: int = None, keep_tokens: int = None):
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.summarize_at = summarize_at or max_tokens * 3 // 5
+        self.keep_tokens = keep_tokens or max_tokens // 5
+        self.on_summary = None
+        # Summary of the conversation before the history
+        self.summary = None
+        self.hydrated = False
+        # Version of the stored conversation last loaded (see hydrate)
+        self.version = None
+        self._messages = []
+        self._summarizing = False
+        # Bumped whenever the history is replaced, so stale summaries are discarded
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._hydrate_lock = threading.Lock()
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """A copy of the history, safe to use while other requests append"""
+        with self._lock:
+            return list(self._messages)
+
+    @messages.setter
+    def messages(self, messages: List[Dict[str, str]]):
+        with self._lock:
+            self._messages = list(messages)
+            self._generation += 1
+            self._trim()
+
+    def append(self, *messages: Dict[str, str]):
+        """Append messages (e.g. a user and assistant turn) as one unit"""
+        with self._lock:
+            self._messages.extend(messages)
+            self._trim()
+            self._summarize_older()
+
+    def hydrate(self, load, version=None):
+        """Fill the session from stored state unless it already holds `version` of it
+
+        `load()` returns (summary, messages), which replace the session's own.
+        Pass the stored conversation's current version (anything that changes
+        when other workers store messages or a summary) to pick up their turns.
+        """
+        with self._hydrate_lock:
+            if self.hydrated and version == self.version:
+                return
+            summary, messages = load()
+            with self._lock:
+                self.summary = summary
+                self._messages = list(messages)
+                self._generation += 1
+                self._trim()
+                self.version = version
+            self.hydrated = True
+
+    def clear(self):
+        with self._lock:
+            self._messages = []
+            self.summary = None
+            self._generation += 1
+
+    def _trim(self):
+        total = count_message_tokens(self._messages)
+        while self._messages and total > self.max_tokens:
+            total -= count_message_tokens([self._messages.pop(0)])
+        while self._messages and self._messages[0]["role"] == "assistant":
+            self._messages.pop(0)
+
+    def _summarize_older(self):
+        """Hand all but the recent tail to the summarizer once the history passes summarize_at (lock held)"""
+        if self.summarizer is None or self._summarizing:
+            return
+        if count_message_tokens(self._messages) <= self.summarize_at:
+            return
+
+        # Keep the newest messages within keep_tokens verbatim, starting at a question
+        start, tokens = len(self._messages), 0
+        while start > 0:
+            tokens += count_message_tokens([self._messages[start - 1]])
+            if tokens > self.keep_tokens:
+                break
+            start -= 1
+        while start < len(self._messages) and self._messages[start]["role"] != "user":
+            start += 1
+
+        older = self._messages[:start]
+        if older:
+            self._summarizing = True
+            _summary_executor().submit(self._summarize, older, self.summary, self._generation)
+
+    def _summarize(self, older: List[Dict[str, str]], summary: Optional[str], generation: int):
+        try:
+            summary = self.summarizer(summary, older)
+        except Exception as e:
+            logger.warning(f"Error summarizing conversation history: {str(e)}")
+            summary = None
+
+        with self._lock:
+            self._summarizing = False
+            if not summary or generation != self._generation:
+                return
+            self.summary = summary
+            # Drop the summarized messages still at the front (the trim may have dropped some already)
+            summarized = {id(message) for message in older}
+            while self._messages and id(self._messages[0]) in summarized:
+                self._messages.pop(0)
+            self._trim()
+            on_summary = self.on_summary
+
+        if on_summary is not None:
+            try:
+                on_summary(summary)
+            except Exception as e:
+                logger.error(f"Error storing conversation summary: {str(e)}")
+
+class AgentSessionStore:
+    """
+    Conversation histories keyed by (user, conversation), least recently used evicted first.
+
+    Args:
+        max_sessions (int): Most conversations kept in this process
+        max_tokens (int): Token bound of each conversation's history
+        summarizer (callable): Summarizes older turns of each conversation; defaults to
+            `summarize_history` unless AGENT_SUMMARIZE is off
+    """
+
+    def __init__(self, max_sessions: int = None, max_tokens: int = None,
+                 summarizer: Callable[[Optional[str], List[Dict[str, str]]], str] = None):
+        self.max_sessions = max_sessions or int(os.environ.get("AGENT_SESSION_MAX", 1000))
+        self.max_tokens = max_tokens or int(os.environ.get("AGENT_HISTORY_TOKENS", 2000))
+        if summarizer is None and os.environ.get("AGENT_SUMMARIZE", "true").lower() == "true":
+            summarizer = summarize_history
+        self.summarizer = summarizer
+        self.summarize_at = int(os.environ.get("AGENT_SUMMARIZE_TOKENS", 0)) or None
+        self.keep_tokens = int(os.environ.get("AGENT_SUMMARY_KEEP_TOKENS", 0)) or None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[str], conversation_id: str) -> AgentSession:
+        """The session for a conversation, created if new"""
+        key = (user_id or "anonymous", conversation_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = AgentSession(self.max_tokens, self.summarizer,
+                                                             self.summarize_at, self.keep_tokens)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(key)
+            return session
+
+    def drop(self, user_id: Optional[str], conversation_id: str):
+        """Forget a conversation"""
+        with self._lock:
+            self._sessions.pop((user_id or "anonymous", conversation_id), None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+# Singleton instance
+_store = None
+
+def get_session_store() -> AgentSessionStore:
+    """Get the singleton session store"""
+    global _store
+    if _store is None:
+        _store = AgentSessionStore()
+    return _store
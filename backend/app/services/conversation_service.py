@@ -0,0 +1,275 @@
+import os
+import atexit
+import logging
+import threading
+import uuid
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+import pandas as pd
+
+from app.services.agent_sessions import AgentSession
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Messages loaded into an agent's history when a conversation is resumed
+TAIL_MESSAGES = int(os.environ.get("CONVERSATION_TAIL_MESSAGES", 20))
+
+# Largest page of messages a client may request
+MAX_PAGE_SIZE = 200
+
+def _table(name: str):
+    from app.services.supabase_client import supabase
+    return supabase.from_table(name)
+
+def _insert_messages(rows: List[Dict[str, Any]]):
+    """Write a batch of messages in one request and bump each conversation's updated_at"""
+    _table('conversation_messages').insert(rows)
+    latest = {}
+    for row in rows:
+        latest[row["conversation_id"]] = row["timestamp"]
+    for conversation_id, timestamp in latest.items():
+        _table('caregiver_conversations').eq('id', conversation_id).update({"updated_at": timestamp})
+
+class ConversationWriter:
+    """
+    Buffers conversation messages and writes them in batches.
+
+    Messages are flushed when `batch_size` are waiting, every
+    `flush_interval` seconds, and at exit. Each gets an explicit timestamp
+    that strictly increases within the process, since rows inserted together
+    would otherwise share the transaction's NOW(). Rows from different
+    workers can still tie, so the read cursor breaks ties on the id. A failed write is retried on the
+    next flush; beyond `max_pending` waiting messages the oldest are dropped.
+
+    Args:
+        write_rows (callable): Writes a list of rows; defaults to a Supabase insert
+    """
+
+    def __init__(self, write_rows=None, batch_size: int = None, flush_interval: float = None,
+                 max_pending: int = None):
+        self._write_rows = write_rows or _insert_messages
+        self.batch_size = batch_size or int(os.environ.get("CONVERSATION_WRITE_BATCH", 20))
+        self.flush_interval = flush_interval or float(os.environ.get("CONVERSATION_FLUSH_SECONDS", 2))
+        self.max_pending = max_pending or int(os.environ.get("CONVERSATION_MAX_PENDING", 1000))
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_timestamp = None
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="conversation-writer", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _next_timestamp(self) -> datetime:
+        now = datetime.now(timezone.utc)
+        if self._last_timestamp is not None and now <= self._last_timestamp:
+            now = self._last_timestamp + timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    def append(self, conversation_id: str, messages: List[Dict[str, str]]):
+        """Queue chat messages ({"role", "content"}) for writing; only user and assistant turns are stored"""
+        with self._lock:
+            for message in messages:
+                if message.get("role") not in ("user", "assistant"):
+                    continue
+                self._pending.append({
+                    "conversation_id": conversation_id,
+                    "sender": message["role"],
+                    "message": message.get("content", ""),
+                    "timestamp": self._next_timestamp().isoformat()
+                })
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def pending(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Messages of a conversation not yet written"""
+        with self._lock:
+            return [row for row in self._pending if row["conversation_id"] == conversation_id]
+
+    def flush(self) -> int:
+        """Write everything queued; returns the number of messages written"""
+        with self._flush_lock:
+            # Rows stay visible in `pending` until they are written
+            with self._lock:
+                rows = list(self._pending)
+            if not rows:
+                return 0
+            try:
+                self._write_rows(rows)
+            except Exception as e:
+                logger.error(f"Error writing {len(rows)} conversation messages: {str(e)}")
+                with self._lock:
+                    dropped = len(self._pending) - self.max_pending
+                    if dropped > 0:
+                        logger.warning(f"Dropping {dropped} unwritten conversation messages")
+                        del self._pending[:dropped]
+                return 0
+            with self._lock:
+                del self._pending[:len(rows)]
+            return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+def create_conversation(caregiver_id: str, patient_id: str = None, title: str = None) -> Dict[str, Any]:
+    """Start a conversation for a caregiver, optionally about a patient"""
+    row = {"caregiver_id": caregiver_id, "patient_id": patient_id}
+    if title:
+        row["title"] = title
+    return _table('caregiver_conversations').insert(row)[0]
+
+def get_conversations(caregiver_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """A caregiver's conversations, most recently active first"""
+    return _table('caregiver_conversations') \
+        .select('id,patient_id,title,created_at,updated_at') \
+        .eq('caregiver_id', caregiver_id) \
+        .order('updated_at', ascending=False) \
+        .limit(limit) \
+        .execute()
+
+def _parse_cursor(before: Optional[str]) -> Tuple[Optional[pd.Timestamp], Optional[str]]:
+    """Split a "timestamp,id" cursor into a timestamp and a message UUID.
+
+    Raises ValueError for anything else, so client input never reaches a filter verbatim.
+    """
+    if not before:
+        return None, None
+    cutoff, _, cutoff_id = before.partition(",")
+    try:
+        timestamp = pd.Timestamp(cutoff)
+        message_id = str(uuid.UUID(cutoff_id)) if cutoff_id else None
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {before!r}")
+    if pd.isna(timestamp):
+        raise ValueError(f"Invalid cursor: {before!r}")
+    return timestamp, message_id
+
+def get_messages(conversation_id: str, before: str = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    One page of a conversation's messages, walking back from the newest.
+
+    Pages are read with a keyset cursor on (conversation_id, timestamp, id),
+    so each page costs the same however long the conversation is, and
+    messages that share a timestamp are neither skipped nor repeated.
+    Messages still waiting in this worker's write buffer are included.
+
+    Args:
+        conversation_id (str): Conversation ID
+        before (str): Cursor from the previous page; omit for the newest page
+        limit (int): Messages per page (at most MAX_PAGE_SIZE)
+
+    Returns:
+        dict: "messages" oldest first, and "next_cursor" for the page before it (None at the start)
+
+    Raises:
+        ValueError: If `before` is not a cursor returned by this function
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    # Cursors are "timestamp,id"; a message not yet written has no id
+    cutoff, cutoff_id = _parse_cursor(before)
+    query = _table('conversation_messages') \
+        .select('id,sender,message,timestamp') \
+        .eq('conversation_id', conversation_id)
+    # The filter is built only from the parsed values
+    if cutoff_id:
+        value = f'"{cutoff.isoformat()}"'
+        query = query.or_(f'timestamp.lt.{value},and(timestamp.eq.{value},id.lt.{cutoff_id})')
+    elif cutoff is not None:
+        query = query.lt('timestamp', cutoff.isoformat())
+    rows = query.order('timestamp', ascending=False).order('id', ascending=False).limit(limit).execute()
+
+    written = {(pd.Timestamp(row["timestamp"]), row["sender"], row["message"]) for row in rows}
+    for row in get_conversation_writer().pending(conversation_id):
+        timestamp = pd.Timestamp(row["timestamp"])
+        if (timestamp, row["sender"], row["message"]) not in written and (cutoff is None or timestamp < cutoff):
+            rows.append(row)
+    rows = sorted(rows, key=lambda row: (pd.Timestamp(row["timestamp"]), row.get("id") or ""), reverse=True)[:limit]
+
+    rows.reverse()
+    next_cursor = None
+    if len(rows) == limit:
+        oldest = rows[0]
+        next_cursor = f'{oldest["timestamp"]},{oldest["id"]}' if oldest.get("id") else oldest["timestamp"]
+    return {
+        "messages": rows,
+        "next_cursor": next_cursor
+    }
+
+def get_summary(conversation_id: str) -> Optional[str]:
+    """The stored summary of a conversation's earlier messages"""
+    rows = _table('caregiver_conversations').select('summary').eq('id', conversation_id).limit(1).execute()
+    return rows[0].get("summary") if rows else None
+
+def save_summary(conversation_id: str, summary: str, replaces: Optional[str] = None) -> bool:
+    """
+    Store the summary of a conversation's earlier messages.
+
+    `replaces` is the summary_updated_at of the stored summary the new one
+    was built on. If another worker has stored a newer summary since, it is
+    kept and this one is discarded.
+
+    Returns:
+        bool: Whether the summary was stored
+    """
+    query = _table('caregiver_conversations').eq('id', conversation_id)
+    query = query.eq('summary_updated_at', replaces) if replaces else query.is_('summary_updated_at', 'null')
+    return bool(query.update({
+        "summary": summary,
+        "summary_updated_at": datetime.now(timezone.utc).isoformat()
+    }))
+
+def get_conversation_version(conversation_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """(updated_at, summary_updated_at) of a conversation; changes whenever messages or a summary are stored"""
+    rows = _table('caregiver_conversations').select('updated_at,summary_updated_at') \
+        .eq('id', conversation_id).limit(1).execute()
+    return (rows[0].get("updated_at"), rows[0].get("summary_updated_at")) if rows else (None, None)
+
+def load_conversation(conversation_id: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """The stored summary and the most recent messages, as chat messages"""
+    page = get_messages(conversation_id, limit=TAIL_MESSAGES)
+    messages = [{"role": row["sender"], "content": row["message"]} for row in page["messages"]]
+    return get_summary(conversation_id), messages
+
+def resume_session(session: AgentSession, conversation_id: str):
+    """Load a stored conversation into an agent session when it is new to this worker or stored turns changed
+    
+    Every worker answers turns of the same conversation, so each resume
+    checks the stored version and reloads the summary and tail when another
+    worker has stored messages or a summary since. Summaries the session
+    makes of older messages are stored with the conversation, unless another
+    worker stored a newer one first.
+    """
+    def store_summary(summary):
+        replaces = session.version[1] if session.version else None
+        if not save_summary(conversation_id, summary, replaces):
+            logger.info(f"Conversation {conversation_id} already has a newer summary")
+
+    session.on_summary = store_summary
+    try:
+        session.hydrate(lambda: load_conversation(conversation_id), get_conversation_version(conversation_id))
+    except Exception as e:
+        logger.error(f"Error loading conversation {conversation_id}: {str(e)}")
+
+def record_messages(conversation_id: str, messages: List[Dict[str, str]]):
+    """Queue messages for the batched write"""
+    get_conversation_writer().append(conversation_id, messages)
+
+# Singleton instance
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_conversation_writer() -> ConversationWriter:
+    """Get the singleton conversation writer"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ConversationWriter()
+        return _writer
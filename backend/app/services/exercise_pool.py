@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+from app.services.llm_cache import SQLiteStore
+from app.services.llm_metrics import get_metrics
+from app.utils.structured_output import StructuredOutputError, validate
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Options for pooled exercises: each call must produce a new exercise, so
+# responses are neither cached nor coalesced, and sampled a little hotter
+POOL_GENERATION_OPTIONS = {"cache": False, "coalesce": False, "temperature": 0.9}
+
+def _default_path() -> str:
+    return os.environ.get("EXERCISE_POOL_PATH", os.path.join(tempfile.gettempdir(), "mindflex_exercise_pool.sqlite3"))
+
+def _seed_keys() -> List[Tuple[str, str]]:
+    """(game_type, difficulty) pairs to keep warm from the start, from EXERCISE_POOL_GAME_TYPES"""
+    game_types = [t.strip() for t in os.environ.get("EXERCISE_POOL_GAME_TYPES", "word puzzle").split(",") if t.strip()]
+    difficulties = [d.strip() for d in os.environ.get("EXERCISE_POOL_DIFFICULTIES", "easy,medium,hard").split(",")
+                    if d.strip()]
+    return [(game_type, difficulty) for game_type in game_types for difficulty in difficulties]
+
+def _known_keys(seed_keys: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Pairs the pool may hold: the seeded pairs and every game type and difficulty in the game catalogue"""
+    keys = list(seed_keys)
+    try:
+        from app.services.game_service import MOCK_GAMES
+        keys += [(game["type"], difficulty) for game in MOCK_GAMES for difficulty in game["difficulty_levels"]]
+    except Exception as e:
+        logger.warning(f"Game catalogue unavailable; pooling only seeded exercises: {str(e)}")
+    return keys
+
+def _generate_live(game_type: str, difficulty: str) -> Dict[str, Any]:
+    from app.services.agent_service import get_game_agent
+    return get_game_agent().generate_exercise(game_type, difficulty, options=POOL_GENERATION_OPTIONS)
+
+class ExercisePool(SQLiteStore):
+    """
+    Ready-made exercises for each (game_type, difficulty), shared by all workers on the host.
+
+    Exercises are generated in the background, validated against the
+    exercise schema before they are stored, and handed out once each. A
+    filler thread in every worker tops up pools that fall to `low_water`
+    back to `size` in one bulk pass; a flock on a side file makes sure only
+    one worker fills at a time. Pairs are kept warm if seeded from the
+    environment or requested in the last `key_ttl` seconds. Only known
+    pairs are pooled, so made-up game types and difficulties can't make the
+    filler spend generations on them; those are generated live.
+
+    Args:
+        generate (callable): (game_type, difficulty) -> exercise; defaults to the game agent
+        known_keys (list): (game_type, difficulty) pairs that may be pooled; defaults to the
+            seeded pairs and the game catalogue's types and difficulties
+    """
+
+    def __init__(self, path: str = None, size: int = None, low_water: int = None,
+                 generate: Callable[[str, str], Dict[str, Any]] = None, seed_keys: List[Tuple[str, str]] = None,
+                 known_keys: List[Tuple[str, str]] = None):
+        super().__init__(path or _default_path())
+        seed_keys = _seed_keys() if seed_keys is None else seed_keys
+        self.known_keys = set(known_keys if known_keys is not None else _known_keys(seed_keys))
+        self.size = size or int(os.environ.get("EXERCISE_POOL_SIZE", 5))
+        self.low_water = low_water if low_water is not None else int(os.environ.get("EXERCISE_POOL_LOW_WATER", 2))
+        self.refill_interval = float(os.environ.get("EXERCISE_POOL_REFILL_SECONDS", 60))
+        self.concurrency = int(os.environ.get("EXERCISE_POOL_CONCURRENCY", 3))
+        self.key_ttl = int(os.environ.get("EXERCISE_POOL_KEY_TTL", 7 * 24 * 3600))
+        self._generate = generate or _generate_live
+        self._wake = threading.Event()
+        self._filler = None
+        self._filler_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS exercise_pool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                game_type TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                exercise TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS exercise_pool_key ON exercise_pool (game_type, difficulty, id)")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS exercise_pool_keys (
+                game_type TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                requested_at REAL NOT NULL,
+                PRIMARY KEY (game_type, difficulty)
+            )
+        """)
+        for game_type, difficulty in seed_keys:
+            self._touch(connection, game_type, difficulty)
+
+    @staticmethod
+    def _touch(connection: sqlite3.Connection, game_type: str, difficulty: str):
+        connection.execute(
+            "INSERT OR REPLACE INTO exercise_pool_keys (game_type, difficulty, requested_at) VALUES (?, ?, ?)",
+            (game_type, difficulty, time.time())
+        )
+
+    def take(self, game_type: str, difficulty: str) -> Optional[Dict[str, Any]]:
+        """Claim a ready exercise, or None if the pool is empty or the pair unknown; wakes the filler when it runs low"""
+        if (game_type, difficulty) not in self.known_keys:
+            return None
+        self.start()
+        try:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._touch(connection, game_type, difficulty)
+                row = connection.execute(
+                    "SELECT id, exercise FROM exercise_pool WHERE game_type = ? AND difficulty = ? ORDER BY id LIMIT 1",
+                    (game_type, difficulty)
+                ).fetchone()
+                if row is not None:
+                    connection.execute("DELETE FROM exercise_pool WHERE id = ?", (row[0],))
+                remaining = connection.execute(
+                    "SELECT COUNT(*) FROM exercise_pool WHERE game_type = ? AND difficulty = ?",
+                    (game_type, difficulty)
+                ).fetchone()[0]
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Error reading exercise pool: {str(e)}")
+            return None
+
+        get_metrics().record_cache("exercise_pool", hits=int(row is not None), misses=int(row is None))
+        if remaining <= self.low_water:
+            self._wake.set()
+        return json.loads(row[1]) if row is not None else None
+
+    def add_many(self, game_type: str, difficulty: str, exercises: List[Dict[str, Any]]):
+        """Store exercises for a pair in one transaction"""
+        now = time.time()
+        connection = self._connect()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT INTO exercise_pool (game_type, difficulty, exercise, created_at) VALUES (?, ?, ?, ?)",
+                [(game_type, difficulty, json.dumps(exercise), now) for exercise in exercises]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        """Ready exercises for every pair being kept warm"""
+        rows = self._connect().execute("""
+            SELECT k.game_type, k.difficulty, COUNT(p.id)
+            FROM exercise_pool_keys k
+            LEFT JOIN exercise_pool p ON p.game_type = k.game_type AND p.difficulty = k.difficulty
+            WHERE k.requested_at > ?
+            GROUP BY k.game_type, k.difficulty
+        """, (time.time() - self.key_ttl,)).fetchall()
+        return {(game_type, difficulty): count for game_type, difficulty, count in rows}
+
+    def refill(self) -> int:
+        """Top up every low pool to `size` unless another worker is already filling; returns exercises added"""
+        with open(self.path + ".fill", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                return self._refill()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refill(self) -> int:
+        jobs = [
+            key for key, count in self.counts().items() if count <= self.low_water and key in self.known_keys
+            for _ in range(self.size - count)
+        ]
+        if not jobs:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="exercise-pool") as executor:
+            exercises = list(executor.map(lambda key: self._generate_valid(*key), jobs))
+
+        generated = {}
+        for key, exercise in zip(jobs, exercises):
+            if exercise is not None:
+                generated.setdefault(key, []).append(exercise)
+        for (game_type, difficulty), batch in generated.items():
+            self.add_many(game_type, difficulty, batch)
+
+        added = sum(len(batch) for batch in generated.values())
+        logger.info(f"Exercise pool refilled with {added} of {len(jobs)} exercises")
+        return added
+
+    def _generate_valid(self, game_type: str, difficulty: str) -> Optional[Dict[str, Any]]:
+        """Generate one exercise, or None if generation failed or it doesn't match the schema"""
+        try:
+            exercise = self._generate(game_type, difficulty)
+            if "error" in exercise:
+                raise StructuredOutputError(exercise.get("details") or exercise["error"])
+            validate(exercise, "exercise")
+            return exercise
+        except Exception as e:
+            logger.warning(f"Discarding pooled {difficulty} {game_type} exercise: {str(e)}")
+            return None
+
+    def start(self):
+        """Start this worker's filler thread (once)"""
+        with self._filler_lock:
+            if self._filler is None:
+                self._filler = threading.Thread(target=self._run, name="exercise-pool-filler", daemon=True)
+                self._filler.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refill()
+            except Exception as e:
+                logger.error(f"Error refilling exercise pool: {str(e)}")
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+# Singleton instance
+_pool = None
+
+def get_exercise_pool() -> ExercisePool:
+    """Get the singleton exercise pool, starting its filler"""
+    global _pool
+    if _pool is None:
+        _pool = ExercisePool()
+        _pool.start()
+    return _pool
@@ -0,0 +1,375 @@
+import os
+import time
+import fcntl
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable
+
+import numpy as np
+
+from app.utils.change_detection import PageHinkley, DEFAULT_PARAMS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump whenever the record layout changes; stale files are recreated on open
+FORMAT_VERSION = 2
+
+# Number of most recent sessions used for the rolling features
+ROLLING_WINDOW = 5
+
+# Derived features readers get back, in column order
+FEATURE_NAMES = (
+    "sessions",
+    "mean_score",
+    "mean_duration",
+    "mean_errors",
+    "rolling_score",
+    "rolling_errors",
+    "score_slope",
+    "errors_slope",
+    "last_score",
+    "last_played_at",
+    "change_points",
+    "last_change_point_at",
+)
+
+# Running aggregates needed to update the features incrementally, followed
+# by Page-Hinkley detector state for the score and error series
+_SUM_SCORE, _SUM_DURATION, _SUM_ERRORS, _SUM_XY_SCORE, _SUM_XY_ERRORS = range(5)
+_RING_SCORES = slice(5, 5 + ROLLING_WINDOW)
+_RING_ERRORS = slice(_RING_SCORES.stop, _RING_SCORES.stop + ROLLING_WINDOW)
+_DETECTORS = {
+    "score": slice(_RING_ERRORS.stop, _RING_ERRORS.stop + PageHinkley.STATE_SIZE),
+    "errors": slice(_RING_ERRORS.stop + PageHinkley.STATE_SIZE, _RING_ERRORS.stop + 2 * PageHinkley.STATE_SIZE),
+}
+_STATE_SIZE = _DETECTORS["errors"].stop
+
+# One fixed-width record per patient. `seq` is a seqlock counter: writers make
+# it odd while a record is being rewritten so lock-free readers can retry.
+_RECORD = np.dtype([
+    ("key", "<u8"),
+    ("seq", "<u8"),
+    ("features", "<f8", (len(FEATURE_NAMES),)),
+    ("state", "<f8", (_STATE_SIZE,)),
+])
+
+# Record 0 is a header: features[0] = format version, features[1] = last full
+# rebuild (epoch seconds), features[2] = number of occupied slots.
+_HEADER_VERSION, _HEADER_REBUILT_AT, _HEADER_COUNT = range(3)
+
+def _patient_key(patient_id: str, game_id: str = None) -> int:
+    """Stable 64-bit key for a patient, or a patient's game (0 marks empty slots)."""
+    name = str(patient_id) if game_id is None else f"{patient_id}/{game_id}"
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+def _timestamp(value: Any) -> float:
+    """Convert a created_at value (ISO string or datetime) to epoch seconds."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+def _slope(n: float, sum_y: float, sum_xy: float) -> float:
+    """Least-squares slope of y against the session index 0..n-1."""
+    if n < 2:
+        return 0.0
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    return (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+
+class FeatureStore:
+    """Per-patient feature vectors kept in a memory-mapped file.
+
+    Every gunicorn worker maps the same file, so reads are a hash probe into
+    shared pages with no copying or re-aggregation. Writes (ingestion and full
+    rebuilds) are serialized across processes with an exclusive file lock.
+    """
+
+    def __init__(self, path: str = None, capacity: int = None, rebuild_interval: int = None):
+        self.path = path or os.environ.get(
+            "FEATURE_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "mindflex_features.bin")
+        )
+        self.capacity = capacity or int(os.environ.get("FEATURE_STORE_CAPACITY", 8192))
+        self.rebuild_interval = rebuild_interval or int(os.environ.get("FEATURE_STORE_REBUILD_INTERVAL", 6 * 3600))
+        self._lock_path = self.path + ".lock"
+        self._rebuild_attempted_at = 0.0
+        self._records = self._open()
+
+    def _open(self) -> np.memmap:
+        """Map the store file, creating or resetting it if needed."""
+        expected_size = (self.capacity + 1) * _RECORD.itemsize
+        with self._locked():
+            if not os.path.exists(self.path) or os.path.getsize(self.path) != expected_size:
+                self._create(expected_size)
+            records = np.memmap(self.path, dtype=_RECORD, mode="r+", shape=(self.capacity + 1,))
+            if records[0]["features"][_HEADER_VERSION] != FORMAT_VERSION:
+                del records
+                self._create(expected_size)
+                records = np.memmap(self.path, dtype=_RECORD, mode="r+", shape=(self.capacity + 1,))
+        return records
+
+    def _create(self, size: int):
+        """Write an empty store file carrying the current format version."""
+        with open(self.path, "wb") as f:
+            f.truncate(size)
+        records = np.memmap(self.path, dtype=_RECORD, mode="r+", shape=(self.capacity + 1,))
+        records[0]["features"][_HEADER_VERSION] = FORMAT_VERSION
+        records.flush()
+        del records
+
+    def _locked(self, blocking: bool = True):
+        """Context manager holding the cross-process write lock."""
+        return _FileLock(self._lock_path, blocking)
+
+    def _find_slot(self, key: int, insert: bool = False) -> Optional[int]:
+        """Linear-probe for a key; optionally claim an empty slot for it."""
+        keys = self._records["key"]
+        slot = key % self.capacity
+        for _ in range(self.capacity):
+            current = int(keys[slot + 1])
+            if current == key:
+                return slot + 1
+            if current == 0:
+                if not insert:
+                    return None
+                keys[slot + 1] = key
+                self._records[0]["features"][_HEADER_COUNT] += 1
+                return slot + 1
+            slot = (slot + 1) % self.capacity
+        return None
+
+    def get(self, patient_id: str, game_id: str = None) -> Optional[Dict[str, float]]:
+        """Read a patient's (or one game's) feature vector, or None if unknown."""
+        if int(self._records[0]["seq"]) % 2:
+            # A full rebuild is rewriting the table
+            return None
+
+        slot = self._find_slot(_patient_key(patient_id, game_id))
+        if slot is None:
+            return None
+
+        record = self._records[slot]
+        for _ in range(100):
+            before = int(record["seq"])
+            if before % 2 == 0:
+                features = record["features"].copy()
+                if int(record["seq"]) == before:
+                    return dict(zip(FEATURE_NAMES, features.tolist()))
+            time.sleep(0)
+        return None
+
+    def ingest(self, patient_id: str, session: Dict[str, Any]) -> List[str]:
+        """
+        Fold one new game session into the patient's features.
+
+        Returns:
+            list: Metrics ('score', 'errors') whose change-point detector for
+            this game fired on this session
+        """
+        with self._locked():
+            return self._ingest(patient_id, session)
+
+    def _ingest(self, patient_id: str, session: Dict[str, Any]) -> List[str]:
+        """Update the patient row and the per-game row; caller holds the lock."""
+        alarms = []
+        game_id = session.get("game_id")
+        if game_id is not None:
+            slot = self._find_slot(_patient_key(patient_id, game_id), insert=True)
+            if slot is not None:
+                alarms = self._update(self._records[slot], session, detect=True)
+
+        slot = self._find_slot(_patient_key(patient_id), insert=True)
+        if slot is None:
+            logger.warning("Feature store is full; increase FEATURE_STORE_CAPACITY")
+            return alarms
+        self._update(self._records[slot], session, alarms=alarms)
+        return alarms
+
+    def _update(self, record, session: Dict[str, Any], detect: bool = False, alarms: List[str] = None) -> List[str]:
+        """Apply one session to a record's running state and features.
+
+        Change points are only detected on per-game rows, since score scales
+        differ between games; the patient row counts the alarms passed in.
+        """
+        score = float(session.get("score") or 0)
+        duration = float(session.get("duration") or 0)
+        errors = float(session.get("errors") or 0)
+
+        record["seq"] += 1
+        features = record["features"]
+        state = record["state"]
+
+        index = features[0]
+        n = index + 1
+        state[_SUM_SCORE] += score
+        state[_SUM_DURATION] += duration
+        state[_SUM_ERRORS] += errors
+        state[_SUM_XY_SCORE] += index * score
+        state[_SUM_XY_ERRORS] += index * errors
+
+        ring_slot = int(index) % ROLLING_WINDOW
+        state[_RING_SCORES.start + ring_slot] = score
+        state[_RING_ERRORS.start + ring_slot] = errors
+        window = min(n, ROLLING_WINDOW)
+        played_at = _timestamp(session.get("created_at"))
+
+        alarms = list(alarms or [])
+        change_points, last_change_point_at = features[-2], features[-1]
+        if detect:
+            for metric, columns in _DETECTORS.items():
+                detector = PageHinkley(state=state[columns], **DEFAULT_PARAMS[metric])
+                value = score if metric == "score" else errors
+                if detector.update(value):
+                    alarms.append(metric)
+                state[columns] = detector.state()
+        if alarms:
+            change_points += 1
+            last_change_point_at = played_at
+
+        features[:] = (
+            n,
+            state[_SUM_SCORE] / n,
+            state[_SUM_DURATION] / n,
+            state[_SUM_ERRORS] / n,
+            state[_RING_SCORES].sum() / window,
+            state[_RING_ERRORS].sum() / window,
+            _slope(n, state[_SUM_SCORE], state[_SUM_XY_SCORE]),
+            _slope(n, state[_SUM_ERRORS], state[_SUM_XY_ERRORS]),
+            score,
+            played_at,
+            change_points,
+            last_change_point_at,
+        )
+        record["seq"] += 1
+        return alarms
+
+    def rebuild(self, rows: Iterable[Dict[str, Any]]):
+        """Recompute every feature vector from the full score history."""
+        sessions: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            sessions.setdefault(row["patient_id"], []).append(row)
+
+        with self._locked():
+            header = self._records[0]
+            header["seq"] += 1
+            self._records[1:] = np.zeros(self.capacity, dtype=_RECORD)
+            header["features"][_HEADER_COUNT] = 0
+
+            for patient_id, history in sessions.items():
+                history.sort(key=lambda s: _timestamp(s.get("created_at")))
+                for session in history:
+                    self._ingest(patient_id, session)
+
+            header["features"][_HEADER_REBUILT_AT] = time.time()
+            header["seq"] += 1
+            self._records.flush()
+
+        logger.info(f"Rebuilt feature store for {len(sessions)} patients")
+
+    def needs_rebuild(self) -> bool:
+        """Whether the last full rebuild is older than the rebuild interval."""
+        rebuilt_at = self._records[0]["features"][_HEADER_REBUILT_AT]
+        return time.time() - rebuilt_at > self.rebuild_interval
+
+class _FileLock:
+    """Exclusive flock on a side file, shared by every worker process."""
+
+    def __init__(self, path: str, blocking: bool = True):
+        self.path = path
+        self.blocking = blocking
+        self.acquired = False
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._file, flags)
+            self.acquired = True
+        except BlockingIOError:
+            self.acquired = False
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.acquired:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+def _fetch_all_scores(page_size: int = 1000) -> List[Dict[str, Any]]:
+    """Load every game score from Supabase, one page at a time."""
+    from app.services.supabase_client import supabase
+
+    rows = []
+    offset = 0
+    while True:
+        page = supabase.from_table('game_scores') \
+            .select('patient_id,game_id,score,duration,errors,created_at') \
+            .order('created_at') \
+            .limit(page_size) \
+            .offset(offset) \
+            .execute()
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+def rebuild_feature_store(fetch_rows=None):
+    """Run a full rebuild unless another worker already has one in progress."""
+    store = get_feature_store()
+    store._rebuild_attempted_at = time.time()
+    with _FileLock(store.path + ".rebuild", blocking=False) as lock:
+        if not lock.acquired or not store.needs_rebuild():
+            return False
+        try:
+            store.rebuild((fetch_rows or _fetch_all_scores)())
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding feature store: {str(e)}")
+            return False
+
+def record_session(patient_id: str, session: Dict[str, Any]) -> List[str]:
+    """Incrementally ingest a session and kick off a rebuild when one is due.
+
+    Returns the metrics whose change-point detector fired for this game.
+    """
+    store = get_feature_store()
+    alarms = store.ingest(patient_id, session)
+    # Don't retry a failing rebuild (e.g. Supabase offline) on every session
+    retry_after = min(300, store.rebuild_interval)
+    if store.needs_rebuild() and time.time() - store._rebuild_attempted_at > retry_after:
+        threading.Thread(target=rebuild_feature_store, daemon=True).start()
+    return alarms
+
+def get_patient_features(patient_id: str, game_id: str = None) -> Optional[Dict[str, float]]:
+    """Read a patient's (or one game's) precomputed features from the shared store."""
+    try:
+        return get_feature_store().get(patient_id, game_id)
+    except Exception as e:
+        logger.error(f"Error reading feature store: {str(e)}")
+        return None
+
+# Singleton instance
+_instance = None
+
+def get_feature_store() -> FeatureStore:
+    """Get the singleton feature store instance for this process"""
+    global _instance
+    if _instance is None:
+        _instance = FeatureStore()
+    return _instance
+
+if __name__ == "__main__":
+    # Allow a scheduled full rebuild: python -m app.services.feature_store
+    get_feature_store().rebuild(_fetch_all_scores())
@@ -3,6 +3,9 @@ import json
 from datetime import datetime, timedelta
 import random
 from app.services.supabase_client import supabase
+from app.services.feature_store import record_session, get_patient_features
+from app.utils.prompt_builder import PromptBuilder
+from app.utils.structured_output import StructuredOutputError, parse_structured, response_schema
 
 # Import LLM services for enhanced analytics
 try:
@@ -11,6 +14,20 @@ except ImportError:
     # If agent_service is not available, create a placeholder
     get_game_agent = None
 
+# Task instructions for LLM game analytics, sent ahead of the patient's data
+GAME_ANALYTICS_INSTRUCTIONS = """Based on the game performance data provided, provide an analysis of the patient's 
+cognitive performance strengths and areas for improvement. Also suggest personalized recommendations 
+for exercises or games that might help improve cognitive skills.
+
+Please respond with a JSON object containing:
+1. "strengths": Array of the patient's cognitive strengths based on game performance
+2. "areas_for_improvement": Array of areas where the patient could improve
+3. "recommendations": Array of specific games, difficulties, or cognitive exercises recommended
+4. "cognitive_pattern": Brief description of any patterns in performance
+5. "progress_projection": Brief projection of expected improvement if the patient continues current engagement
+
+Your analysis should be specifically tailored to the types of games played and the pattern of scores."""
+
 # Mock game database
 MOCK_GAMES = [
     {
@@ -93,10 +110,11 @@ def log_game_score(patient_id, game_id, score, duration, difficulty, errors=0, m
     }
     
     try:
-        result = supabase.from_table('game_scores').insert(game_score).execute()
+        result = supabase.from_table('game_scores').insert(game_score)
         if result and len(result) > 0:
-            return result[0]
-        return game_score
+            result = result[0]
+        else:
+            result = dict(game_score)
     except Exception as e:
         print(f"Error logging game score to Supabase: {e}")
         # Fallback to mock data if Supabase fails
@@ -105,6 +123,18 @@ def log_game_score(patient_id, game_id, score, duration, difficulty, errors=0, m
         game_score["id"] = mock_id
         MOCK_SCORES.append(game_score)
         return game_score
+    
+    # Only stored sessions update the patient's features and change detection
+    change_points = []
+    try:
+        change_points = record_session(patient_id, game_score)
+    except Exception as e:
+        print(f"Error updating patient features: {e}")
+    
+    if change_points:
+        print(f"Change point detected for patient {patient_id} in {game['name']}: {', '.join(change_points)}")
+        result["change_points"] = change_points
+    return result
 
 def get_user_game_history(patient_id, limit=10):
     """Get game history for a specific patient from Supabase."""
@@ -189,6 +219,9 @@ def get_game_analytics(patient_id, game_type=None, time_period=None, use_llm=Tru
         if first_half_avg > 0:
             improvement_rate = ((second_half_avg - first_half_avg) / first_half_avg) * 100
     
+    # Long-term features are maintained incrementally by the feature store
+    features = get_patient_features(patient_id)
+    
     # Enhanced analytics using LLM if available and requested
     strengths = []
     areas_for_improvement = []
@@ -210,62 +243,53 @@ def get_game_analytics(patient_id, game_type=None, time_period=None, use_llm=Tru
                 "improvement_rate": improvement_rate
             }
             
-            # Create prompt for the LLM
-            prompt = f"""Based on the following game performance data, provide an analysis of the patient's 
-cognitive performance strengths and areas for improvement. Also suggest personalized recommendations 
-for exercises or games that might help improve cognitive skills.
+            # Create prompt for the LLM, trimmed by priority to the token budget
+            builder = PromptBuilder()
+            builder.add(f"""Game performance data:
 
 Patient ID: {patient_id}
 Total Games Played: {total_games}
 Average Score: {average_score:.2f}
 Average Duration: {average_duration:.2f} seconds
 Improvement Rate: {improvement_rate:.2f}%
-
-Game History:
-"""
+""", required=True)
             
-            # Add up to 10 most recent games for context
-            for i, game in enumerate(sorted(scores, key=lambda s: s["created_at"], reverse=True)[:10]):
-                prompt += f"""Game {i+1}: 
+            if features:
+                builder.add(f"""
+All-Time Sessions: {int(features['sessions'])}
+Recent Average Score (last 5): {features['rolling_score']:.2f}
+Score Trend Per Session: {features['score_slope']:+.2f}
+Recent Average Errors (last 5): {features['rolling_errors']:.2f}
+""", priority=2)
+            
+            # Add up to 10 most recent games for context, newest first so the
+            # oldest are dropped if the budget is tight
+            builder.add_items("""
+Game History:
+""", [f"""Game {i+1}: 
 - Type: {game.get('game_type', 'unknown')}
 - Score: {game.get('score', 0)}
 - Duration: {game.get('duration', 0)} seconds
 - Difficulty: {game.get('difficulty', 'medium')}
 - Errors: {game.get('errors', 0)}
 - Date: {game.get('created_at', 'unknown')}
-"""
-
-            prompt += """
-Please respond with a JSON object containing:
-1. "strengths": Array of the patient's cognitive strengths based on game performance
-2. "areas_for_improvement": Array of areas where the patient could improve
-3. "recommendations": Array of specific games, difficulties, or cognitive exercises recommended
-4. "cognitive_pattern": Brief description of any patterns in performance
-5. "progress_projection": Brief projection of expected improvement if the patient continues current engagement
-
-Your analysis should be specifically tailored to the types of games played and the pattern of scores.
-"""
+""" for i, game in enumerate(sorted(scores, key=lambda s: s["created_at"], reverse=True)[:10])], priority=1)
+            prompt = builder.build()
             
-            # Get LLM response and parse it
-            import json
-            import re
+            # Get LLM response, constrained to the analytics schema, and parse it.
+            # Instructions go ahead of the data as a stable, cacheable prefix
+            response = game_agent.ask(prompt, game_agent.system_prompt,
+                                      options={"response_schema": response_schema("game_analytics"),
+                                               "task": "game_analytics"},
+                                      context=[GAME_ANALYTICS_INSTRUCTIONS])
             
-            response = game_agent.ask(prompt)
-            
-            # Try to find JSON in the response
-            json_match = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response
-                
             try:
-                llm_insights = json.loads(json_str)
+                llm_insights = parse_structured(response, "game_analytics")
                 # Extract insights from LLM response
                 strengths = llm_insights.get("strengths", [])
                 areas_for_improvement = llm_insights.get("areas_for_improvement", [])
                 recommendations = llm_insights.get("recommendations", [])
-            except json.JSONDecodeError:
+            except StructuredOutputError:
                 # If JSON parsing fails, extract insights using heuristics
                 print("Failed to parse LLM response as JSON, using fallback extraction")
                 
@@ -297,6 +321,14 @@ Your analysis should be specifically tailored to the types of games played and t
         "recommendations": recommendations or ["Try increasing difficulty levels as scores improve"]
     }
     
+    if features:
+        analytics["long_term"] = {
+            "sessions": int(features["sessions"]),
+            "rolling_score": round(features["rolling_score"], 2),
+            "score_slope": round(features["score_slope"], 2),
+            "rolling_errors": round(features["rolling_errors"], 2)
+        }
+    
     # Add additional LLM insights if available
     if llm_insights:
         if "cognitive_pattern" in llm_insights:
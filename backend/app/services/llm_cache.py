@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Options that change how a call is made but not what the model returns
+_TRANSPORT_OPTIONS = ("connect_timeout", "read_timeout", "deadline", "cache", "cache_ttl", "token_budget")
+
+# Expired and excess disk entries are pruned once every this many writes
+_PRUNE_EVERY = 200
+
+# Keys per SQLite IN (...) lookup, below the bound-variable limit
+_LOOKUP_BATCH = 500
+
+def _default_path() -> str:
+    return os.environ.get("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "mindflex_llm_cache.sqlite3"))
+
+def make_cache_key(provider: str, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+    """Stable hash of everything that determines a chat completion."""
+    options = {k: v for k, v in (options or {}).items() if k not in _TRANSPORT_OPTIONS and v is not None}
+    material = json.dumps([provider, messages, options], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def make_embedding_key(provider: str, model: str, text: str) -> str:
+    """Content address of a text's embedding under one provider and model."""
+    return hashlib.sha256(f"{provider}\0{model}\0{text}".encode("utf-8")).hexdigest()
+
+class SQLiteStore:
+    """
+    Per-thread SQLite connections to a database shared by all workers.
+
+    Base for the host-wide stores (response and embedding caches, exercise
+    pool). Connections run in WAL and autocommit mode, so writes spanning
+    several statements need an explicit BEGIN/COMMIT.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (and per process, after a fork)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+class LLMCache(SQLiteStore):
+    """
+    Two-tier cache for LLM responses.
+
+    The memory tier is a per-process LRU. The disk tier is a SQLite database
+    in WAL mode that every worker on the host reads and writes, so a response
+    generated by one gunicorn worker is served by all of them. Entries expire
+    after their TTL in both tiers; disk hits are promoted into memory.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, max_disk_entries: int = None, ttl: int = None):
+        super().__init__(path or _default_path())
+        self.max_entries = max_entries or int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1000))
+        self.max_disk_entries = max_disk_entries or int(os.environ.get("LLM_CACHE_MAX_DISK_ENTRIES", 50000))
+        self.ttl = ttl or int(os.environ.get("LLM_CACHE_TTL", 24 * 3600))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "disk_errors": 0}
+
+        try:
+            self._connect().execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+        except sqlite3.Error as e:
+            logger.error(f"LLM disk cache unavailable at {self.path}: {str(e)}")
+            self._stats["disk_errors"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Look a response up in memory, then on disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading LLM disk cache: {str(e)}")
+            row = None
+            with self._lock:
+                self._stats["disk_errors"] += 1
+
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: int = None):
+        """Store a response in both tiers."""
+        expires_at = time.time() + (ttl or self.ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._stats["stores"] += 1
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+
+        try:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            if prune:
+                self._prune(connection)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing LLM disk cache: {str(e)}")
+            with self._lock:
+                self._stats["disk_errors"] += 1
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        """Insert into the memory tier, evicting least recently used entries (lock held)"""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _prune(self, connection: sqlite3.Connection):
+        """Drop expired disk entries, then the soonest-expiring beyond the size bound"""
+        connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        connection.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_disk_entries,))
+
+    def clear(self):
+        """Empty both tiers."""
+        with self._lock:
+            self._memory.clear()
+        try:
+            self._connect().execute("DELETE FROM llm_cache")
+        except sqlite3.Error as e:
+            logger.error(f"Error clearing LLM disk cache: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process, with the overall hit rate."""
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+class EmbeddingCache(SQLiteStore):
+    """
+    Content-addressed cache of embedding vectors.
+
+    In memory, vectors of each dimension live in one float32 matrix used as a
+    ring: once `max_rows` is reached the oldest row is overwritten. On disk,
+    vectors are float32 blobs in the shared SQLite database, so unchanged
+    text is embedded once per host rather than once per worker. Embeddings
+    are deterministic per model, so entries never expire.
+    """
+
+    def __init__(self, path: str = None, max_rows: int = None, max_disk_entries: int = None):
+        super().__init__(path or _default_path())
+        self.max_rows = max_rows or int(os.environ.get("LLM_EMBEDDING_CACHE_MAX_ROWS", 5000))
+        self.max_disk_entries = max_disk_entries or int(os.environ.get("LLM_CACHE_MAX_DISK_ENTRIES", 50000))
+
+        # Per dimension: the vector matrix, the key stored in each row, and
+        # the next row to fill. _rows maps key -> (dimension, row).
+        self._matrices = {}
+        self._row_keys = {}
+        self._next_row = {}
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "disk_errors": 0}
+
+        try:
+            self._connect().execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL
+                )
+            """)
+        except sqlite3.Error as e:
+            logger.error(f"Embedding disk cache unavailable at {self.path}: {str(e)}")
+            self._stats["disk_errors"] += 1
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever of `keys` are present."""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                location = self._rows.get(key)
+                if location is None:
+                    missing.append(key)
+                else:
+                    dim, row = location
+                    found[key] = self._matrices[dim][row].copy()
+            self._stats["memory_hits"] += len(found)
+
+        from_disk = {}
+        try:
+            connection = self._connect()
+            for start in range(0, len(missing), _LOOKUP_BATCH):
+                batch = missing[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for key, dim, blob in connection.execute(
+                    f"SELECT key, dim, vector FROM embedding_cache WHERE key IN ({placeholders})", batch
+                ):
+                    from_disk[key] = np.frombuffer(blob, dtype=np.float32, count=dim).copy()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading embedding disk cache: {str(e)}")
+            with self._lock:
+                self._stats["disk_errors"] += 1
+
+        with self._lock:
+            for key, vector in from_disk.items():
+                self._remember(key, vector)
+            self._stats["disk_hits"] += len(from_disk)
+            self._stats["misses"] += len(missing) - len(from_disk)
+        found.update(from_disk)
+        return found
+
+    def set_many(self, vectors: Dict[str, np.ndarray]):
+        """Store vectors in memory and on disk."""
+        if not vectors:
+            return
+        rows = []
+        with self._lock:
+            for key, vector in vectors.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, len(vector), vector.tobytes()))
+            self._stats["stores"] += len(rows)
+            self._writes += len(rows)
+            prune = self._writes >= _PRUNE_EVERY
+            if prune:
+                self._writes = 0
+
+        try:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, dim, vector) VALUES (?, ?, ?)", rows
+            )
+            if prune:
+                connection.execute("""
+                    DELETE FROM embedding_cache WHERE rowid IN (
+                        SELECT rowid FROM embedding_cache ORDER BY rowid DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_disk_entries,))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing embedding disk cache: {str(e)}")
+            with self._lock:
+                self._stats["disk_errors"] += 1
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Write a vector into its dimension's matrix (lock held)"""
+        dim = len(vector)
+        if key in self._rows and self._rows[key][0] == dim:
+            self._matrices[dim][self._rows[key][1]] = vector
+            return
+
+        matrix = self._matrices.get(dim)
+        if matrix is None:
+            matrix = self._matrices[dim] = np.empty((min(64, self.max_rows), dim), dtype=np.float32)
+            self._row_keys[dim] = []
+            self._next_row[dim] = 0
+
+        row = self._next_row[dim]
+        row_keys = self._row_keys[dim]
+        if row == len(matrix) and len(matrix) < self.max_rows:
+            # Grow geometrically up to max_rows
+            matrix = self._matrices[dim] = np.concatenate(
+                [matrix, np.empty((min(len(matrix), self.max_rows - len(matrix)), dim), dtype=np.float32)]
+            )
+        row %= len(matrix)
+
+        if row < len(row_keys):
+            # Ring is full: the oldest vector gives up its row
+            self._rows.pop(row_keys[row], None)
+            row_keys[row] = key
+        else:
+            row_keys.append(key)
+        matrix[row] = vector
+        self._rows[key] = (dim, row)
+        self._next_row[dim] = row + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process, with the overall hit rate."""
+        with self._lock:
+            stats = dict(self._stats, memory_vectors=len(self._rows),
+                         memory_bytes=sum(m.nbytes for m in self._matrices.values()))
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+# Singleton instances
+_instance = None
+_embedding_instance = None
+
+def get_llm_cache() -> LLMCache:
+    """Get the singleton LLM response cache for this process"""
+    global _instance
+    if _instance is None:
+        _instance = LLMCache()
+    return _instance
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the singleton embedding cache for this process"""
+    global _embedding_instance
+    if _embedding_instance is None:
+        _embedding_instance = EmbeddingCache()
+    return _embedding_instance
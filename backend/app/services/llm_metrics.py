@@ -0,0 +1,239 @@
+import os
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+import requests
+
+# Upper bounds (seconds) of the latency histogram buckets; the last is unbounded
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Tags attached to every metric recorded in the current context: the agent
+# class, route and task that led to the call
+TAG_NAMES = ("agent", "route", "task")
+_tags = contextvars.ContextVar("llm_metric_tags", default={})
+
+def set_metric_tags(**tags) -> contextvars.Token:
+    """Add tags for the rest of the current context; pass the token to `reset_metric_tags`."""
+    return _tags.set({**_tags.get(), **{name: value for name, value in tags.items() if value is not None}})
+
+def reset_metric_tags(token: contextvars.Token):
+    """Restore the tags from before `set_metric_tags`."""
+    _tags.reset(token)
+
+def current_metric_tags() -> Dict[str, str]:
+    """Tags in effect, e.g. to carry into a streamed response that outlives the request."""
+    return dict(_tags.get())
+
+@contextmanager
+def metric_tags(**tags):
+    """Tag metrics recorded inside the block."""
+    token = set_metric_tags(**tags)
+    try:
+        yield
+    finally:
+        reset_metric_tags(token)
+
+def error_type(error: Exception) -> str:
+    """Short error class for counting, with the status code of HTTP errors"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"HTTP {error.response.status_code}"
+    return type(error).__name__
+
+def usage_tokens(usage: Optional[Dict[str, Any]]) -> Tuple[int, int, int]:
+    """Prompt, completion and cached prompt tokens from an OpenAI or Anthropic usage block.
+    
+    Prompt tokens include the cached ones for both providers (Anthropic
+    reports cache reads and writes separately from input_tokens).
+    """
+    if not usage:
+        return 0, 0, 0
+    if "prompt_tokens" in usage:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        return int(usage["prompt_tokens"] or 0), int(usage.get("completion_tokens") or 0), int(cached)
+    cached = usage.get("cache_read_input_tokens") or 0
+    prompt = (usage.get("input_tokens") or 0) + cached + (usage.get("cache_creation_input_tokens") or 0)
+    return int(prompt), int(usage.get("output_tokens") or 0), int(cached)
+
+class _Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, self.counts):
+            seen += bucket
+            if seen >= rank:
+                return bound if bound != float("inf") else None
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        return {
+            "count": count,
+            "sum": round(self.total, 4),
+            "mean": round(self.total / count, 4) if count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": [["+Inf" if b == float("inf") else b, c] for b, c in zip(LATENCY_BUCKETS, self.counts)]
+        }
+
+class MetricsRegistry:
+    """
+    In-process LLM telemetry for this worker.
+
+    Provider calls are counted per provider, model and endpoint, tagged with
+    the agent class, route and task from the current context: a latency
+    histogram, token usage as reported by the provider, and errors by type.
+    Cache lookups and structured response parses are counted per cache or
+    schema and tag set, routed tasks against their target latency, and
+    answer evaluations by whether they needed the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._caches = {}
+        self._structured = {}
+        self._tasks = {}
+        self._evaluations = {}
+
+    @staticmethod
+    def _tag_key() -> Tuple[str, ...]:
+        tags = _tags.get()
+        return tuple(tags.get(name, "-") for name in TAG_NAMES)
+
+    def record_call(self, provider: str, model: str, endpoint: str, seconds: float,
+                    usage: Dict[str, Any] = None, error: Exception = None):
+        """Record one provider call (successful or not)"""
+        prompt, completion, cached = usage_tokens(usage)
+        key = (provider, model or "default", endpoint) + self._tag_key()
+        with self._lock:
+            series = self._calls.get(key)
+            if series is None:
+                series = self._calls[key] = {
+                    "latency": _Histogram(), "prompt_tokens": 0, "completion_tokens": 0,
+                    "cached_prompt_tokens": 0, "errors": {}
+                }
+            series["latency"].observe(seconds)
+            series["prompt_tokens"] += prompt
+            series["completion_tokens"] += completion
+            series["cached_prompt_tokens"] += cached
+            if error is not None:
+                kind = error_type(error)
+                series["errors"][kind] = series["errors"].get(kind, 0) + 1
+
+    def record_cache(self, cache: str, hits: int = 0, misses: int = 0):
+        """Record lookups in a cache ("response", "embedding", ...)"""
+        key = (cache,) + self._tag_key()
+        with self._lock:
+            counts = self._caches.setdefault(key, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def record_structured_output(self, schema: str, outcome: str):
+        """Record a structured response parse outcome: ok, invalid_json or schema_mismatch"""
+        key = (schema,) + self._tag_key()
+        with self._lock:
+            outcomes = self._structured.setdefault(key, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def record_task(self, task: str, seconds: float, target_latency: float = None, failed: bool = False):
+        """Record one routed task's end-to-end latency against its target"""
+        with self._lock:
+            series = self._tasks.get(task)
+            if series is None:
+                series = self._tasks[task] = {"latency": _Histogram(), "target_latency": target_latency,
+                                              "over_target": 0, "failed": 0}
+            series["latency"].observe(seconds)
+            if target_latency is not None and seconds > target_latency:
+                series["over_target"] += 1
+            if failed:
+                series["failed"] += 1
+
+    def record_evaluation(self, method: str):
+        """Record how an answer was evaluated: by a local method (exact, fuzzy, set, ...) or by the LLM ("llm")"""
+        with self._lock:
+            self._evaluations[method] = self._evaluations.get(method, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All series as JSON-serializable dicts"""
+        with self._lock:
+            calls = [
+                {
+                    "provider": key[0], "model": key[1], "endpoint": key[2], **dict(zip(TAG_NAMES, key[3:])),
+                    "latency": series["latency"].snapshot(),
+                    "prompt_tokens": series["prompt_tokens"],
+                    "completion_tokens": series["completion_tokens"],
+                    "cached_prompt_tokens": series["cached_prompt_tokens"],
+                    "cached_prompt_ratio": round(series["cached_prompt_tokens"] / series["prompt_tokens"], 4)
+                    if series["prompt_tokens"] else None,
+                    "errors": dict(series["errors"])
+                }
+                for key, series in self._calls.items()
+            ]
+            caches = [
+                {
+                    "cache": key[0], **dict(zip(TAG_NAMES, key[1:])), "hits": hits, "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None
+                }
+                for key, (hits, misses) in self._caches.items()
+            ]
+            structured = [
+                {
+                    "schema": key[0], **dict(zip(TAG_NAMES, key[1:])), "outcomes": dict(outcomes),
+                    "failure_rate": round(1 - outcomes.get("ok", 0) / sum(outcomes.values()), 4)
+                }
+                for key, outcomes in self._structured.items()
+            ]
+            tasks = [
+                {
+                    "task": task,
+                    "target_latency": series["target_latency"],
+                    "latency": series["latency"].snapshot(),
+                    "over_target": series["over_target"],
+                    "over_target_rate": round(series["over_target"] / sum(series["latency"].counts), 4),
+                    "failed": series["failed"]
+                }
+                for task, series in self._tasks.items()
+            ]
+            total = sum(self._evaluations.values())
+            evaluations = {
+                "methods": dict(self._evaluations),
+                "total": total,
+                "local_fraction": round(1 - self._evaluations.get("llm", 0) / total, 4) if total else None
+            }
+        return {"pid": os.getpid(), "calls": calls, "caches": caches, "structured_output": structured,
+                "tasks": tasks, "evaluations": evaluations}
+
+    def clear(self):
+        with self._lock:
+            self._calls.clear()
+            self._caches.clear()
+            self._structured.clear()
+            self._tasks.clear()
+            self._evaluations.clear()
+
+# Singleton instance
+_metrics = None
+
+def get_metrics() -> MetricsRegistry:
+    """Get the singleton metrics registry"""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
@@ -1,17 +1,217 @@
 import os
 import json
+import time
+import fcntl
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional, Union
+import tempfile
+import functools
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import closing
+from typing import Dict, List, Any, Optional, Union, Iterator, Tuple
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from abc import ABC, abstractmethod
 
+from app.services.rate_limiter import RateLimitExceeded, limiter_from_env
+from app.services.llm_metrics import get_metrics, metric_tags
+from app.services.model_router import get_model_router
+from app.services.local_inference import LocalInferenceEngine, get_local_engine
+from app.utils.prompt_builder import count_tokens, count_message_tokens
+from app.services.llm_cache import (
+    LLMCache,
+    EmbeddingCache,
+    get_llm_cache,
+    get_embedding_cache,
+    make_cache_key,
+    make_embedding_key
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OpenAI models that support response_format json_schema
+JSON_SCHEMA_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+def _create_session(headers: Dict[str, str], pool_size: int) -> requests.Session:
+    """Create a keep-alive HTTP session with a connection pool for one provider"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(headers)
+    return session
+
+def _openai_deltas(events: Iterator[str]) -> Iterator[str]:
+    """Extract content deltas from OpenAI-format chat completion chunks.
+    
+    Reads through the final [DONE] marker so the connection is returned to
+    the pool; closing this generator closes the upstream stream.
+    """
+    with closing(events):
+        for event in events:
+            if event == "[DONE]":
+                continue
+            choices = json.loads(event).get("choices") or []
+            if choices:
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+def _stream_usage(event: str) -> Dict[str, Any]:
+    """Token usage carried by a streamed event (OpenAI final chunk, Anthropic message_start/message_delta)"""
+    try:
+        event = json.loads(event)
+    except ValueError:
+        return {}
+    return event.get("usage") or (event.get("message") or {}).get("usage") or {}
+
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
     
+    name = "base"
+    
+    # Texts per embeddings request and the model they are embedded with;
+    # providers with a batch API override these
+    embedding_batch_size = 1
+    embedding_model = "default"
+    
+    def __init__(self, base_url: str, headers: Dict[str, str] = None):
+        """Set up the pooled HTTP session and timeouts shared by all calls"""
+        self.base_url = base_url
+        self._configure_timeouts()
+        pool_size = int(os.environ.get("LLM_POOL_SIZE", 10))
+        
+        # Async calls run on a dedicated pool sized to the concurrency limit,
+        # so the limit holds across event loops (threads start on demand)
+        self.max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", pool_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"llm-{self.name}")
+        
+        # Keep a connection for every concurrent call
+        pool_size = max(pool_size, self.max_concurrency)
+        self.session = _create_session({"Content-Type": "application/json", **(headers or {})}, pool_size)
+    
+    def _configure_timeouts(self):
+        """Read the embedding batch size, timeouts and deadline from the environment"""
+        batch_size = os.environ.get("LLM_EMBEDDING_BATCH_SIZE")
+        if batch_size:
+            self.embedding_batch_size = int(batch_size)
+        self.connect_timeout = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(os.environ.get("LLM_READ_TIMEOUT", 60))
+        deadline = os.environ.get("LLM_REQUEST_DEADLINE", "90")
+        self.deadline = float(deadline) if deadline else None
+    
+    def _timeouts(self, options: Dict[str, Any] = None):
+        """Resolve (connect, read) timeouts and the total deadline for one call"""
+        options = options or {}
+        connect_timeout = options.get("connect_timeout", self.connect_timeout)
+        read_timeout = options.get("read_timeout", self.read_timeout)
+        deadline = options.get("deadline", self.deadline)
+        if deadline:
+            connect_timeout = min(connect_timeout, deadline)
+            read_timeout = min(read_timeout, deadline)
+        return (connect_timeout, read_timeout), deadline
+    
+    def _post(self, path: str, payload: Dict[str, Any], options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """POST JSON over the pooled session and return the decoded response.
+        
+        Connect and read timeouts bound each socket operation (both are capped
+        at the deadline); the deadline is also checked as the body streams in,
+        so a server that keeps trickling bytes cannot hold the worker.
+        Per-call overrides: connect_timeout, read_timeout, deadline.
+        Latency, token usage and errors are recorded in the metrics registry.
+        """
+        started = time.monotonic()
+        try:
+            body = self._request(path, payload, options, started)
+        except Exception as e:
+            self._record(path, payload, started, error=e)
+            raise
+        self._record(path, payload, started, usage=body.get("usage") if isinstance(body, dict) else None)
+        return body
+    
+    def _request(self, path: str, payload: Dict[str, Any], options: Dict[str, Any], started: float) -> Dict[str, Any]:
+        """Send the request for `_post`, enforcing the deadline"""
+        timeout, deadline = self._timeouts(options)
+        response = self.session.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            timeout=timeout,
+            stream=bool(deadline)
+        )
+        try:
+            response.raise_for_status()
+            if not deadline:
+                return response.json()
+            
+            # Small reads so the deadline is checked as the body arrives
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=1024):
+                body.extend(chunk)
+                if time.monotonic() - started > deadline:
+                    raise requests.Timeout(f"LLM request exceeded deadline of {deadline}s")
+            return json.loads(body)
+        finally:
+            response.close()
+    
+    def _record(self, path: str, payload: Dict[str, Any], started: float,
+                usage: Dict[str, Any] = None, error: Exception = None):
+        """Record a call's latency, token usage or error in the metrics registry"""
+        get_metrics().record_call(self.name, payload.get("model"), path.strip("/"),
+                                  time.monotonic() - started, usage, error)
+    
+    async def _run_async(self, func, *args):
+        """Run a blocking provider call on the provider's executor.
+        
+        Calls beyond `max_concurrency` wait in the executor's queue. Context
+        variables are carried into the worker thread as with asyncio.to_thread.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        return await loop.run_in_executor(self._executor, call)
+    
+    def _stream(self, path: str, payload: Dict[str, Any], options: Dict[str, Any] = None) -> Iterator[str]:
+        """POST a streaming request and yield the data field of each server-sent event.
+        
+        The upstream response is closed when the generator is closed, so
+        abandoning iteration (e.g. the client disconnected) cancels the
+        generation at the provider. The same timeouts and deadline as `_post`
+        apply, with the deadline checked between events.
+        """
+        started = time.monotonic()
+        timeout, deadline = self._timeouts(options)
+        usage = {}
+        error = None
+        response = None
+        try:
+            response = self.session.post(
+                f"{self.base_url}{path}",
+                json=payload,
+                timeout=timeout,
+                stream=True
+            )
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if deadline and time.monotonic() - started > deadline:
+                    raise requests.Timeout(f"LLM request exceeded deadline of {deadline}s")
+                if line and line.startswith("data:"):
+                    data = line[5:].strip()
+                    if '"usage"' in data:
+                        usage.update(_stream_usage(data))
+                    yield data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            self._record(path, payload, started, usage, error)
+    
     @abstractmethod
     def generate_text(self, prompt: str, options: Dict[str, Any] = None) -> str:
         """Generate text based on the prompt"""
@@ -22,17 +222,67 @@ class LLMProvider(ABC):
         """Generate a response based on a conversation history"""
         pass
     
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Iterator[str]:
+        """Yield the response in text chunks as the provider produces them.
+        
+        Providers without a streaming API yield the whole response at once.
+        Unlike `generate_chat`, errors are raised rather than returned as text,
+        since part of the response may already have been sent.
+        """
+        yield self._chat(messages, options)
+    
+    @abstractmethod
+    def _chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Generate a chat response, raising on failure"""
+        pass
+    
+    async def agenerate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Async `generate_chat`; at most `max_concurrency` calls run at once.
+        
+        The blocking call runs in a worker thread over the pooled session, so
+        many prompts can be awaited together, e.g. with asyncio.gather.
+        """
+        return await self._run_async(self.generate_chat, messages, options)
+    
+    async def aembedding(self, text: str) -> List[float]:
+        """Async `embedding`, sharing the provider's concurrency limit"""
+        return await self._run_async(self.embedding, text)
+    
     @abstractmethod
     def embedding(self, text: str) -> List[float]:
         """Get vector embedding for the text"""
         pass
+    
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in provider-sized batches, one request per batch.
+        
+        Returns one vector per text, in order; texts in a failed batch get []
+        as with `embedding`.
+        """
+        vectors = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            batch = texts[start:start + self.embedding_batch_size]
+            try:
+                vectors.extend(self._embed_batch(batch))
+            except Exception as e:
+                logger.error(f"Error in {self.name} batch embedding: {str(e)}")
+                vectors.extend([] for _ in batch)
+        return vectors
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, raising on failure; one call per text by default"""
+        return [self.embedding(text) for text in texts]
 
 class OpenAIProvider(LLMProvider):
     """Implementation for OpenAI API"""
     
+    name = "openai"
+    embedding_batch_size = 256  # API limit is 2048 inputs per request
+    
     def __init__(self, api_key: str):
+        super().__init__("https://api.openai.com/v1", {"Authorization": f"Bearer {api_key}"})
         self.api_key = api_key
-        self.base_url = "https://api.openai.com/v1"
+        self.embedding_model = os.environ.get("DEFAULT_EMBEDDING_MODEL", "text-embedding-ada-002")
         
     def generate_text(self, prompt: str, options: Dict[str, Any] = None) -> str:
         """Generate text using OpenAI Completions API"""
@@ -44,11 +294,6 @@ class OpenAIProvider(LLMProvider):
         temperature = options.get("temperature", 0.7)
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "model": model,
                 "prompt": prompt,
@@ -56,14 +301,8 @@ class OpenAIProvider(LLMProvider):
                 "temperature": temperature
             }
             
-            response = requests.post(
-                f"{self.base_url}/completions",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["choices"][0]["text"].strip()
+            response = self._post("/completions", data, options)
+            return response["choices"][0]["text"].strip()
             
         except Exception as e:
             logger.error(f"Error in OpenAI text generation: {str(e)}")
@@ -71,6 +310,24 @@ class OpenAIProvider(LLMProvider):
     
     def generate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
         """Generate chat response using OpenAI Chat API"""
+        try:
+            return self._chat(messages, options)
+        except Exception as e:
+            logger.error(f"Error in OpenAI chat generation: {str(e)}")
+            return f"Error generating response: {str(e)}"
+    
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Iterator[str]:
+        """Stream chat response deltas from the OpenAI Chat API"""
+        data = dict(self._chat_payload(messages, options), stream=True, stream_options={"include_usage": True})
+        yield from _openai_deltas(self._stream("/chat/completions", data, options))
+    
+    def _chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Call the Chat API, raising on failure"""
+        response = self._post("/chat/completions", self._chat_payload(messages, options), options)
+        return response["choices"][0]["message"]["content"].strip()
+    
+    def _chat_payload(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Build the Chat API request body"""
         if options is None:
             options = {}
             
@@ -78,64 +335,53 @@ class OpenAIProvider(LLMProvider):
         max_tokens = options.get("max_tokens", 500)
         temperature = options.get("temperature", 0.7)
         
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"].strip()
-            
-        except Exception as e:
-            logger.error(f"Error in OpenAI chat generation: {str(e)}")
-            return f"Error generating response: {str(e)}"
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        schema = options.get("response_schema")
+        if schema:
+            # Older chat models only support the plain JSON mode
+            if model.startswith(JSON_SCHEMA_MODEL_PREFIXES):
+                data["response_format"] = {"type": "json_schema", "json_schema": schema}
+            else:
+                data["response_format"] = {"type": "json_object"}
+        return data
     
     def embedding(self, text: str) -> List[float]:
         """Get embedding vector using OpenAI Embeddings API"""
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
-                "model": "text-embedding-ada-002",
+                "model": self.embedding_model,
                 "input": text
             }
             
-            response = requests.post(
-                f"{self.base_url}/embeddings",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["data"][0]["embedding"]
+            response = self._post("/embeddings", data)
+            return response["data"][0]["embedding"]
             
         except Exception as e:
             logger.error(f"Error in OpenAI embedding: {str(e)}")
             return []
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts in one Embeddings API request"""
+        response = self._post("/embeddings", {"model": self.embedding_model, "input": texts})
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
 
 class AnthropicProvider(LLMProvider):
     """Implementation for Anthropic (Claude) API"""
     
+    name = "anthropic"
+    
     def __init__(self, api_key: str):
+        super().__init__("https://api.anthropic.com/v1", {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01"
+        })
         self.api_key = api_key
-        self.base_url = "https://api.anthropic.com/v1"
+        self.prompt_cache = os.environ.get("LLM_PROMPT_CACHE", "true").lower() != "false"
     
     def generate_text(self, prompt: str, options: Dict[str, Any] = None) -> str:
         """Generate text using Anthropic API"""
@@ -145,6 +391,37 @@ class AnthropicProvider(LLMProvider):
     
     def generate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
         """Generate chat response using Anthropic API"""
+        try:
+            return self._chat(messages, options)
+        except Exception as e:
+            logger.error(f"Error in Anthropic generation: {str(e)}")
+            return f"Error generating response: {str(e)}"
+    
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Iterator[str]:
+        """Stream text deltas from the Anthropic Messages API"""
+        data = dict(self._chat_payload(messages, options), stream=True)
+        with closing(self._stream("/messages", data, options)) as events:
+            for event in events:
+                event = json.loads(event)
+                if event.get("type") == "content_block_delta":
+                    # Text, or the JSON of a structured response's tool input
+                    text = event["delta"].get("text") or event["delta"].get("partial_json")
+                    if text:
+                        yield text
+                elif event.get("type") == "error":
+                    raise RuntimeError(event["error"].get("message", "Anthropic stream error"))
+    
+    def _chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Call the Messages API, raising on failure"""
+        response = self._post("/messages", self._chat_payload(messages, options), options)
+        for block in response["content"]:
+            # A structured response arrives as the forced tool call's input
+            if block.get("type") == "tool_use":
+                return json.dumps(block["input"])
+        return response["content"][0]["text"]
+    
+    def _chat_payload(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Build the Messages API request body"""
         if options is None:
             options = {}
             
@@ -152,49 +429,65 @@ class AnthropicProvider(LLMProvider):
         max_tokens = options.get("max_tokens", 500)
         temperature = options.get("temperature", 0.7)
         
-        try:
-            headers = {
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json"
-            }
-            
-            # Convert from OpenAI format to Anthropic format
-            anthropic_messages = []
-            for msg in messages:
-                role = "assistant" if msg["role"] == "assistant" else "user"
+        # Convert from OpenAI format to Anthropic format: system messages go in
+        # the top-level system field, consecutive turns of one role are merged
+        system = []
+        anthropic_messages = []
+        for msg in messages:
+            if msg["role"] == "system":
+                system.append({"type": "text", "text": msg["content"]})
+                continue
+            role = "assistant" if msg["role"] == "assistant" else "user"
+            if anthropic_messages and anthropic_messages[-1]["role"] == role:
+                anthropic_messages[-1]["content"] += "\n\n" + msg["content"]
+            else:
                 anthropic_messages.append({"role": role, "content": msg["content"]})
-            
-            data = {
-                "model": model,
-                "messages": anthropic_messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/messages",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["content"][0]["text"]
-            
-        except Exception as e:
-            logger.error(f"Error in Anthropic generation: {str(e)}")
-            return f"Error generating response: {str(e)}"
+        
+        data = {
+            "model": model,
+            "messages": anthropic_messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        schema = options.get("response_schema")
+        if schema:
+            # Structured output through a single tool the model must call
+            data["tools"] = [{
+                "name": schema["name"],
+                "description": f"Record the {schema['name'].replace('_', ' ')} as structured data",
+                "input_schema": schema["schema"]
+            }]
+            data["tool_choice"] = {"type": "tool", "name": schema["name"]}
+        if system:
+            # Cache breakpoints after the system prompt and after the last
+            # context block; prefixes below the model's minimum are not cached
+            if self.prompt_cache:
+                system[0]["cache_control"] = {"type": "ephemeral"}
+                system[-1]["cache_control"] = {"type": "ephemeral"}
+            data["system"] = system
+        return data
     
     def embedding(self, text: str) -> List[float]:
         """Anthropic doesn't provide embeddings API, so we'll use a placeholder"""
         logger.warning("Anthropic doesn't provide embeddings API")
         return []
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """No embeddings API; warn once per batch rather than per text"""
+        logger.warning("Anthropic doesn't provide embeddings API")
+        return [[] for _ in texts]
 
 class LocalLLMProvider(LLMProvider):
     """Implementation for local models via API (e.g., LM Studio, Ollama)"""
     
+    name = "local"
+    embedding_batch_size = 32
+    
     def __init__(self, base_url: str = "http://localhost:8080"):
-        self.base_url = base_url
+        super().__init__(base_url)
+        # How the server constrains structured responses: json_schema (LM Studio,
+        # Ollama, vLLM), grammar (llama.cpp server), json_object, or none
+        self.json_mode = os.environ.get("LOCAL_LLM_JSON_MODE", "json_schema")
     
     def generate_text(self, prompt: str, options: Dict[str, Any] = None) -> str:
         """Generate text using local API"""
@@ -204,6 +497,24 @@ class LocalLLMProvider(LLMProvider):
     
     def generate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
         """Generate chat response using local API"""
+        try:
+            return self._chat(messages, options)
+        except Exception as e:
+            logger.error(f"Error in Local LLM generation: {str(e)}")
+            return f"Error generating response: {str(e)}"
+    
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Iterator[str]:
+        """Stream chat response deltas from the OpenAI-compatible endpoint"""
+        data = dict(self._chat_payload(messages, options), stream=True)
+        yield from _openai_deltas(self._stream("/v1/chat/completions", data, options))
+    
+    def _chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Call the OpenAI-compatible chat endpoint, raising on failure"""
+        response = self._post("/v1/chat/completions", self._chat_payload(messages, options), options)
+        return response["choices"][0]["message"]["content"].strip()
+    
+    def _chat_payload(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Build the chat request body"""
         if options is None:
             options = {}
             
@@ -211,61 +522,182 @@ class LocalLLMProvider(LLMProvider):
         max_tokens = options.get("max_tokens", 500)
         temperature = options.get("temperature", 0.7)
         
-        try:
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/v1/chat/completions",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"].strip()
-            
-        except Exception as e:
-            logger.error(f"Error in Local LLM generation: {str(e)}")
-            return f"Error generating response: {str(e)}"
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        schema = options.get("response_schema")
+        if schema and self.json_mode == "json_schema":
+            data["response_format"] = {"type": "json_schema", "json_schema": schema}
+        elif schema and self.json_mode == "grammar":
+            # llama.cpp server: compiled to a sampling grammar
+            data["json_schema"] = schema["schema"]
+        elif schema and self.json_mode == "json_object":
+            data["response_format"] = {"type": "json_object"}
+        return data
     
     def embedding(self, text: str) -> List[float]:
         """Get embedding vector using local API if available"""
         try:
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "input": text
             }
             
-            response = requests.post(
-                f"{self.base_url}/v1/embeddings",
-                headers=headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            return response.json()["data"][0]["embedding"]
+            response = self._post("/v1/embeddings", data)
+            return response["data"][0]["embedding"]
             
         except Exception as e:
             logger.error(f"Error in Local LLM embedding: {str(e)}")
             return []
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts in one OpenAI-compatible request"""
+        response = self._post("/v1/embeddings", {"input": texts})
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item.get("index", 0))]
 
-class LLMService:
-    """Service for accessing different LLM providers"""
+class InProcessLLMProvider(LocalLLMProvider):
+    """Local GGUF model run inside the worker process (no model server or network needed)
+    
+    Serves as the "local" provider when LOCAL_LLM_MODEL_PATH is set. Calls
+    queue on the process's `LocalInferenceEngine`; the same timeouts and
+    deadline as HTTP providers apply, with the deadline enforced while a
+    call waits in the queue and between generated tokens.
+    """
+    
+    def __init__(self, engine: LocalInferenceEngine = None):
+        # No HTTP session or executor: calls queue on the engine, and async
+        # calls wait on the event loop's default executor
+        self._configure_timeouts()
+        self.base_url = None
+        self.session = None
+        self._executor = None
+        # Schemas go to llama.cpp as response_format (see _params), not in the payload
+        self.json_mode = "none"
+        self.engine = engine or get_local_engine()
+        self.model_name = os.path.basename(self.engine.model_path or "in-process")
+    
+    def _params(self, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """llama.cpp generation arguments; schemas are compiled to a sampling grammar"""
+        data = self._chat_payload([], options)
+        params = {"max_tokens": data["max_tokens"], "temperature": data["temperature"]}
+        schema = (options or {}).get("response_schema")
+        if schema:
+            params["response_format"] = {"type": "json_object", "schema": schema["schema"]}
+        return params
+    
+    def _submit(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None):
+        _, deadline = self._timeouts(options)
+        return self.engine.submit(messages, self._params(options),
+                                  time.monotonic() + deadline if deadline else None)
+    
+    def _usage(self, messages: List[Dict[str, str]], text: str) -> Dict[str, Any]:
+        """Estimated usage, since llama.cpp doesn't report it for streamed generations"""
+        return {"prompt_tokens": count_message_tokens(messages),
+                "completion_tokens": count_tokens(text)}
+    
+    def _chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> str:
+        """Generate on the in-process model, raising on failure"""
+        started = time.monotonic()
+        payload = {"model": self.model_name}
+        try:
+            text = self._submit(messages, options).result().strip()
+        except Exception as e:
+            self._record("llama.cpp/chat", payload, started, error=e)
+            raise
+        self._record("llama.cpp/chat", payload, started, usage=self._usage(messages, text))
+        return text
+    
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None) -> Iterator[str]:
+        """Stream deltas as the model generates them; closing the stream stops generation"""
+        started = time.monotonic()
+        chunks = []
+        error = None
+        try:
+            with closing(self._submit(messages, options).stream()) as stream:
+                for text in stream:
+                    chunks.append(text)
+                    yield text
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record("llama.cpp/chat", {"model": self.model_name}, started,
+                         usage=None if error else self._usage(messages, "".join(chunks)), error=error)
+    
+    def embedding(self, text: str) -> List[float]:
+        """The chat model isn't loaded for embeddings"""
+        logger.warning("In-process local model doesn't provide embeddings")
+        return []
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """No embeddings; warn once per batch rather than per text"""
+        logger.warning("In-process local model doesn't provide embeddings")
+        return [[] for _ in texts]
+
+class _Flight:
+    """An upstream call that identical concurrent calls wait on"""
     
     def __init__(self):
-        self.providers = {}
-        self._initialize_providers()
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+class LLMService:
+    """Service for accessing different LLM providers
+    
+    Chat calls are routed: if the requested provider fails, the others are
+    tried in LLM_FALLBACK_ORDER. With LLM_HEDGE_PERCENTILE set, a call still
+    pending after that percentile of the provider's recent latencies is also
+    sent to the next provider, and whichever answers first is used.
+    
+    Providers with LLM_RATE_LIMIT_<PROVIDER>_RPM/_TPM set share request and
+    token buckets across worker processes; calls queue for quota instead of
+    drawing 429s, and fail over if the wait would exceed LLM_RATE_LIMIT_MAX_WAIT.
+    """
+    
+    def __init__(self, providers: Dict[str, LLMProvider] = None, cache: LLMCache = None,
+                 embedding_cache: EmbeddingCache = None):
+        if providers is None:
+            self.providers = {}
+            self._initialize_providers()
+        else:
+            self.providers = providers
+        
+        # Response cache for deterministic or opted-in chat calls, and the
+        # content-addressed embedding cache
+        cache_enabled = os.environ.get("LLM_CACHE_ENABLED", "true").lower() != "false"
+        self.cache = cache or (get_llm_cache() if cache_enabled else None)
+        self.embedding_cache = embedding_cache or (get_embedding_cache() if cache_enabled else None)
+        self.cache_max_temperature = float(os.environ.get("LLM_CACHE_MAX_TEMPERATURE", 0.2))
+        
+        # Failover order, and hedging after a latency percentile (0 disables)
+        self.fallback_order = [
+            name.strip() for name in os.environ.get("LLM_FALLBACK_ORDER", "openai,anthropic,local").split(",")
+            if name.strip()
+        ]
+        self.hedge_percentile = float(os.environ.get("LLM_HEDGE_PERCENTILE", 0) or 0)
+        self.hedge_min_delay = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 1.0))
+        self.hedge_min_samples = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+        self._latencies = {}
+        self._latencies_lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(thread_name_prefix="llm-hedge")
+        
+        # Task to model tier routing
+        self.router = get_model_router()
+        
+        # Per-provider quotas shared by all workers on the host
+        self.rate_limiters = {name: limiter_from_env(name) for name in self.providers}
+        
+        # Coalescing of identical in-flight calls, within this worker and
+        # optionally across the workers on the host
+        self.single_flight = os.environ.get("LLM_SINGLE_FLIGHT", "true").lower() != "false"
+        self.single_flight_shared = os.environ.get("LLM_SINGLE_FLIGHT_SHARED", "false").lower() == "true"
+        self.single_flight_ttl = int(os.environ.get("LLM_SINGLE_FLIGHT_TTL", 5))
+        self.single_flight_dir = os.environ.get("LLM_SINGLE_FLIGHT_DIR", tempfile.gettempdir())
+        self._flights = {}
+        self._flights_lock = threading.Lock()
     
     def _initialize_providers(self):
         """Initialize all configured providers"""
@@ -279,24 +711,353 @@ class LLMService:
         if anthropic_api_key:
             self.providers["anthropic"] = AnthropicProvider(anthropic_api_key)
         
-        # Local LLM (always available as fallback)
-        local_api_url = os.environ.get("LOCAL_LLM_API_URL", "http://localhost:8080")
-        self.providers["local"] = LocalLLMProvider(local_api_url)
+        # Local LLM (always available as fallback): a GGUF model in this
+        # process, or an OpenAI-compatible model server
+        if os.environ.get("LOCAL_LLM_MODEL_PATH"):
+            self.providers["local"] = InProcessLLMProvider()
+        else:
+            local_api_url = os.environ.get("LOCAL_LLM_API_URL", "http://localhost:8080")
+            self.providers["local"] = LocalLLMProvider(local_api_url)
     
     def get_provider(self, provider_name: str = None) -> LLMProvider:
         """Get an LLM provider by name, or default"""
         if provider_name and provider_name in self.providers:
             return self.providers[provider_name]
         
-        # Return default provider (OpenAI > Anthropic > Local)
-        if "openai" in self.providers:
-            return self.providers["openai"]
-        elif "anthropic" in self.providers:
-            return self.providers["anthropic"]
-        elif "local" in self.providers:
-            return self.providers["local"]
-        else:
-            raise ValueError("No LLM providers are available")
+        # Return default provider (first configured in the fallback order)
+        for name in self.fallback_order:
+            if name in self.providers:
+                return self.providers[name]
+        if self.providers:
+            return next(iter(self.providers.values()))
+        raise ValueError("No LLM providers are available")
+    
+    def _cacheable(self, options: Dict[str, Any]) -> bool:
+        """Cache calls that opt in via options["cache"], or low-temperature calls by default"""
+        if self.cache is None:
+            return False
+        if "cache" in options:
+            return bool(options["cache"])
+        return float(options.get("temperature", 0.7)) <= self.cache_max_temperature
+    
+    def generate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None,
+                      provider: Union[str, LLMProvider] = None) -> str:
+        """Generate a chat response, served from the response cache when possible.
+        
+        Set options["cache"] to force caching on or off, and options["cache_ttl"]
+        to override the TTL in seconds. Failed calls are never cached.
+        
+        Identical calls already in flight are coalesced: the later callers wait
+        for the first one's upstream call and share its response. Set
+        options["coalesce"] = False to always make a separate call.
+        
+        Set options["task"] (see model_router.DEFAULT_TASKS) to pick the
+        model from the task's tier on whichever provider serves the call,
+        unless options["model"] names one explicitly.
+        """
+        options = options or {}
+        if not isinstance(provider, LLMProvider):
+            provider = self.get_provider(provider)
+        
+        task = options.get("task")
+        if not task:
+            return self._generate_chat(messages, options, provider)
+        
+        # Routed task: measure the whole call against the task's target latency
+        started = time.monotonic()
+        with metric_tags(task=task):
+            response = self._generate_chat(messages, options, provider)
+        get_metrics().record_task(task, time.monotonic() - started, self.router.target_latency(task),
+                                  failed=response.startswith("Error generating response:"))
+        return response
+    
+    def _generate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any], provider: LLMProvider) -> str:
+        """`generate_chat` once the provider is resolved"""
+        key = make_cache_key(provider.name, messages, options)
+        cacheable = self._cacheable(options)
+        if cacheable:
+            response = self.cache.get(key)
+            get_metrics().record_cache("response", hits=response is not None, misses=response is None)
+            if response is not None:
+                return response
+        
+        try:
+            if self.single_flight and options.get("coalesce", True):
+                return self._coalesced_chat(key, messages, options, provider, cacheable)
+            return self._fresh_chat(key, messages, options, provider, cacheable)[0]
+        except Exception as e:
+            logger.error(f"Error in {provider.name} chat generation: {str(e)}")
+            return f"Error generating response: {str(e)}"
+    
+    def _fresh_chat(self, key: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                    provider: LLMProvider, cacheable: bool) -> Tuple[str, bool]:
+        """Make the upstream call and cache its response if the call is cacheable.
+        
+        Returns the response and whether `provider` answered it. The key names
+        `provider`, so a fallback provider's answer is never cached under it.
+        """
+        response, answered_by = self._routed_chat(messages, options, provider)
+        own = answered_by is provider
+        if cacheable and own:
+            self.cache.set(key, response, options.get("cache_ttl"))
+        return response, own
+    
+    def _coalesced_chat(self, key: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                        provider: LLMProvider, cacheable: bool) -> str:
+        """Make the call unless an identical one is in flight in this worker, then share its outcome"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        get_metrics().record_cache("single_flight", hits=not leader, misses=leader)
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        
+        try:
+            if self.single_flight_shared and self.cache is not None:
+                flight.response = self._shared_flight(key, messages, options, provider, cacheable)
+            else:
+                flight.response = self._fresh_chat(key, messages, options, provider, cacheable)[0]
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+    
+    def _shared_flight(self, key: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                       provider: LLMProvider, cacheable: bool) -> str:
+        """Coalesce across workers: one worker per host makes the call, the rest read its result.
+        
+        The worker holding the key's lock file makes the call and stores the
+        response in the shared cache (briefly, if the call isn't cacheable);
+        workers that find the lock held wait for it and read the cache. If
+        the call failed, or a fallback provider answered it, they make their own.
+        """
+        path = os.path.join(self.single_flight_dir, f"{key}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                response = self.cache.get(key)
+                if response is not None:
+                    return response
+                return self._fresh_chat(key, messages, options, provider, cacheable)[0]
+            
+            try:
+                response, own = self._fresh_chat(key, messages, options, provider, cacheable)
+                if own and not cacheable:
+                    self.cache.set(key, response, self.single_flight_ttl)
+                return response
+            finally:
+                # Unlinked before the lock is released, so a new call starts a new flight
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.close(fd)
+    
+    def _routed_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any],
+                     primary: LLMProvider) -> Tuple[str, LLMProvider]:
+        """Try the primary provider, then the fallbacks, raising the last error if all fail.
+        
+        Returns the response and the provider that answered it.
+        
+        Set options["fallback"] = False to use only the primary, and
+        options["hedge"] = False to disable hedging for a call.
+        """
+        chain = [primary]
+        if options.get("fallback", True):
+            chain += [self.providers[name] for name in self.fallback_order
+                      if name in self.providers and self.providers[name] is not primary]
+        hedge = options.get("hedge", True) and self.hedge_percentile > 0
+        
+        failed = set()
+        last_error = None
+        for index, provider in enumerate(chain):
+            if provider.name in failed:
+                continue
+            backup = next((p for p in chain[index + 1:] if p.name not in failed), None) if hedge else None
+            try:
+                return self._hedged_chat(messages, options, primary, provider, backup, failed)
+            except Exception as e:
+                last_error = e
+                logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+        raise last_error
+    
+    def _hedged_chat(self, messages, options, primary, provider, backup, failed) -> Tuple[str, LLMProvider]:
+        """Call `provider`; if it is still pending after the hedge delay, race `backup` against it."""
+        delay = self._hedge_delay(provider) if backup else None
+        if delay is None:
+            try:
+                return self._timed_chat(provider, messages, self._options_for(provider, options, primary)), provider
+            except Exception:
+                failed.add(provider.name)
+                raise
+        
+        # Calls run with the caller's context so their metrics keep its tags
+        futures = {self._hedge_executor.submit(
+            contextvars.copy_context().run, self._timed_chat, provider, messages,
+            self._options_for(provider, options, primary)
+        ): provider}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            logger.info(f"Hedging {provider.name} after {delay:.2f}s with {backup.name}")
+            futures[self._hedge_executor.submit(
+                contextvars.copy_context().run, self._timed_chat, backup, messages,
+                self._options_for(backup, options, primary)
+            )] = backup
+        
+        # First success wins; the slower call finishes in the background
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result(), futures[future]
+                except Exception as e:
+                    failed.add(futures[future].name)
+                    error = e
+        raise error
+    
+    def _acquire(self, provider: LLMProvider, tokens: float):
+        """Wait for quota on the provider's shared limiter, if it has one
+        
+        Raises:
+            RateLimitExceeded: If the wait would exceed LLM_RATE_LIMIT_MAX_WAIT
+        """
+        limiter = self.rate_limiters.get(provider.name)
+        if limiter:
+            limiter.acquire(tokens)
+    
+    def _timed_chat(self, provider: LLMProvider, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+        """Call a provider within its rate limit, recording the latency of successful calls"""
+        # Quota is charged for the prompt plus the most the reply may use
+        self._acquire(provider, count_message_tokens(messages, options.get("model")) + options.get("max_tokens", 500))
+        
+        started = time.monotonic()
+        response = provider._chat(messages, options)
+        with self._latencies_lock:
+            window = self._latencies.setdefault(provider.name, deque(maxlen=200))
+            window.append(time.monotonic() - started)
+        return response
+    
+    def _hedge_delay(self, provider: LLMProvider) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough latencies are recorded"""
+        with self._latencies_lock:
+            window = list(self._latencies.get(provider.name, ()))
+        if len(window) < self.hedge_min_samples:
+            return None
+        return max(float(np.percentile(window, self.hedge_percentile)), self.hedge_min_delay)
+    
+    def _options_for(self, provider: LLMProvider, options: Dict[str, Any], primary: LLMProvider) -> Dict[str, Any]:
+        """Options for one provider: the task's model for its tier, or the caller's model on the primary.
+        
+        A model chosen for the primary provider means nothing to a fallback.
+        """
+        if provider is primary and options.get("model"):
+            return options
+        model = self.router.route(options.get("task"), provider.name)
+        if model:
+            return {**options, "model": model}
+        if "model" not in options:
+            return options
+        return {k: v for k, v in options.items() if k != "model"}
+    
+    def route_options(self, options: Dict[str, Any], provider: LLMProvider) -> Dict[str, Any]:
+        """Resolve options["task"] to a model for calls made directly on a provider (e.g. streaming)"""
+        return self._options_for(provider, options or {}, provider)
+    
+    def generate_chat_stream(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None,
+                             provider: Union[str, LLMProvider] = None) -> Iterator[str]:
+        """Stream a chat response from one provider, within its rate limit.
+        
+        options["task"] is routed as for `generate_chat`. Streams are neither
+        cached nor failed over, since part of the response may already have
+        been sent; errors are raised. Closing the stream closes the upstream one.
+        
+        Raises:
+            RateLimitExceeded: If the provider's quota would not cover the call in time
+        """
+        if not isinstance(provider, LLMProvider):
+            provider = self.get_provider(provider)
+        options = self.route_options(options, provider)
+        self._acquire(provider, count_message_tokens(messages, options.get("model")) + options.get("max_tokens", 500))
+        yield from provider.generate_chat_stream(messages, options)
+    
+    def embed_many(self, texts: List[str], provider: Union[str, LLMProvider] = None) -> np.ndarray:
+        """Embed texts as a float32 matrix, one row per text.
+        
+        Each text's vector is looked up by content in the embedding cache;
+        only texts never seen before are sent to the provider, deduplicated
+        and in batches. Rows for texts that could not be embedded are zeros
+        and are not cached.
+        """
+        if not isinstance(provider, LLMProvider):
+            provider = self.get_provider(provider)
+        
+        keys = [make_embedding_key(provider.name, provider.embedding_model, text) for text in texts]
+        vectors = self.embedding_cache.get_many(set(keys)) if self.embedding_cache else {}
+        if self.embedding_cache:
+            hits = sum(key in vectors for key in keys)
+            get_metrics().record_cache("embedding", hits=hits, misses=len(keys) - hits)
+        
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        
+        if missing:
+            embedded = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, self._embed_within_limit(provider, list(missing.values())))
+                if len(vector)
+            }
+            if self.embedding_cache:
+                self.embedding_cache.set_many(embedded)
+            vectors.update(embedded)
+        
+        dim = len(next(iter(vectors.values()))) if vectors else 0
+        matrix = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, key in enumerate(keys):
+            if key in vectors:
+                matrix[row] = vectors[key]
+        return matrix
+    
+    def _embed_within_limit(self, provider: LLMProvider, texts: List[str]) -> List[List[float]]:
+        """Embed texts one provider batch at a time, taking each batch's quota before it is sent
+        
+        A batch the quota can't cover in time gets [] vectors, as a failed batch does.
+        """
+        vectors = []
+        for start in range(0, len(texts), provider.embedding_batch_size):
+            batch = texts[start:start + provider.embedding_batch_size]
+            try:
+                self._acquire(provider, sum(count_tokens(text) for text in batch))
+            except RateLimitExceeded as e:
+                logger.warning(f"Skipping {provider.name} embedding batch: {str(e)}")
+                vectors.extend([] for _ in batch)
+                continue
+            vectors.extend(provider.embed_many(batch))
+        return vectors
+    
+    async def agenerate_chat(self, messages: List[Dict[str, str]], options: Dict[str, Any] = None,
+                             provider: Union[str, LLMProvider] = None) -> str:
+        """Async `generate_chat`, within the provider's concurrency limit"""
+        if not isinstance(provider, LLMProvider):
+            provider = self.get_provider(provider)
+        return await provider._run_async(self.generate_chat, messages, options, provider)
 
 # Singleton instance
 _instance = None
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Dict, List, Any, Iterator, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Marks the end of a job's output in its chunk queue
+_DONE = object()
+
+class _Job:
+    """One chat generation waiting for, or running on, the inference worker"""
+
+    def __init__(self, messages: List[Dict[str, str]], params: Dict[str, Any], deadline: Optional[float]):
+        self.messages = messages
+        self.params = params
+        self.deadline = deadline
+        self.chunks = queue.Queue()
+        self.cancelled = threading.Event()
+        # Leading system messages: jobs sharing them reuse the model's KV cache
+        self.prefix = json.dumps([m.get("content") for m in self._system_messages()])
+
+    def _system_messages(self) -> List[Dict[str, str]]:
+        prefix = []
+        for message in self.messages:
+            if message.get("role") != "system":
+                break
+            prefix.append(message)
+        return prefix
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def should_stop(self, *args) -> bool:
+        """llama.cpp stopping criterion: the caller went away or the deadline passed"""
+        return self.cancelled.is_set() or self.expired()
+
+    def stream(self) -> Iterator[str]:
+        """Yield text deltas as they are generated; closing the generator cancels the job
+
+        Waiting is bounded by the deadline, including time spent queued
+        behind other jobs.
+
+        Raises:
+            TimeoutError: If the deadline passes before generation finishes
+        """
+        try:
+            while True:
+                timeout = None
+                if self.deadline is not None:
+                    timeout = self.deadline - time.monotonic()
+                try:
+                    if timeout is not None and timeout <= 0:
+                        raise queue.Empty
+                    chunk = self.chunks.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("Local inference deadline passed")
+                if chunk is _DONE:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self.cancelled.set()
+
+    def result(self) -> str:
+        """The whole response once generation finishes"""
+        return "".join(self.stream())
+
+class LocalInferenceEngine:
+    """
+    A GGUF model run in-process on the CPU with llama.cpp.
+
+    The model is loaded once per process, in the background as soon as the
+    engine starts. A single worker thread owns it, since a llama.cpp context
+    runs one sequence at a time. Concurrent prompts wait in a bounded queue.
+    The worker takes everything queued, up to `max_batch`, and runs jobs that
+    share a system prompt back to back, starting with the prompt already in
+    the KV cache. llama.cpp then only evaluates each prompt past the shared
+    prefix.
+
+    Args:
+        model_path (str): Path to the GGUF model file
+        model: An already loaded llama_cpp.Llama to use instead of model_path
+        n_ctx (int): Context window in tokens
+        n_threads (int): CPU threads for inference (llama.cpp default if None)
+        max_batch (int): Most queued jobs reordered together
+        queue_size (int): Most jobs waiting before new ones are refused
+    """
+
+    def __init__(self, model_path: str = None, model=None, n_ctx: int = 4096, n_threads: int = None,
+                 max_batch: int = 8, queue_size: int = 64, chat_format: str = None):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.chat_format = chat_format
+        self.max_batch = max_batch
+        self._model = model
+        self._load_error = None
+        self._last_prefix = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._run, name="llm-local-inference", daemon=True)
+        self._worker.start()
+
+    def _load(self):
+        """Load the model on the worker thread; a failure fails every job with the same error"""
+        if self._model is not None or self._load_error is not None:
+            return
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            self._load_error = RuntimeError(
+                "llama-cpp-python is not installed; install it to serve LOCAL_LLM_MODEL_PATH in-process"
+            )
+            logger.error(str(self._load_error))
+            return
+        try:
+            started = time.monotonic()
+            self._model = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads,
+                                chat_format=self.chat_format, verbose=False)
+            logger.info(f"Loaded local model {self.model_path} in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self._load_error = RuntimeError(f"Could not load local model {self.model_path}: {str(e)}")
+            logger.error(str(self._load_error))
+
+    def submit(self, messages: List[Dict[str, str]], params: Dict[str, Any] = None,
+               deadline: Optional[float] = None) -> _Job:
+        """
+        Queue a chat generation.
+
+        Args:
+            messages (list): Chat messages
+            params (dict): llama.cpp create_chat_completion arguments (max_tokens, temperature, response_format)
+            deadline (float): time.monotonic() after which generation stops with a TimeoutError
+
+        Returns:
+            _Job: Read the response with `result()` or `stream()`
+
+        Raises:
+            RuntimeError: If the queue is full
+        """
+        job = _Job(messages, params or {}, deadline)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise RuntimeError("Local inference queue is full")
+        return job
+
+    def _next_batch(self) -> List[_Job]:
+        """Wait for a job, take whatever else is queued, and group the jobs by system prompt"""
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        groups = {}
+        if any(job.prefix == self._last_prefix for job in batch):
+            groups[self._last_prefix] = []
+        for job in batch:
+            groups.setdefault(job.prefix, []).append(job)
+        return [job for group in groups.values() for job in group]
+
+    def _run(self):
+        self._load()
+        while True:
+            for job in self._next_batch():
+                self._generate(job)
+
+    def _generate(self, job: _Job):
+        """Run one job, streaming its deltas into the job's queue"""
+        try:
+            if self._load_error is not None:
+                raise self._load_error
+            if job.should_stop():
+                raise TimeoutError("Local inference deadline passed while queued")
+
+            self._last_prefix = job.prefix
+            chunks = self._model.create_chat_completion(
+                messages=job.messages, stream=True, stopping_criteria=job.should_stop, **job.params
+            )
+            for chunk in chunks:
+                text = (chunk["choices"][0].get("delta") or {}).get("content")
+                if text:
+                    job.chunks.put(text)
+                if job.cancelled.is_set():
+                    break
+            if job.expired():
+                raise TimeoutError("Local inference exceeded its deadline")
+            job.chunks.put(_DONE)
+        except Exception as e:
+            job.chunks.put(e)
+
+# Singleton instance
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_local_engine() -> LocalInferenceEngine:
+    """Get the process-wide engine for LOCAL_LLM_MODEL_PATH, starting the model load"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            threads = os.environ.get("LOCAL_LLM_THREADS")
+            _engine = LocalInferenceEngine(
+                model_path=os.environ.get("LOCAL_LLM_MODEL_PATH"),
+                n_ctx=int(os.environ.get("LOCAL_LLM_CONTEXT", 4096)),
+                n_threads=int(threads) if threads else None,
+                max_batch=int(os.environ.get("LOCAL_LLM_MAX_BATCH", 8)),
+                queue_size=int(os.environ.get("LOCAL_LLM_QUEUE_SIZE", 64)),
+                chat_format=os.environ.get("LOCAL_LLM_CHAT_FORMAT") or None
+            )
+        return _engine
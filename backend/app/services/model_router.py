@@ -0,0 +1,102 @@
+import os
+import logging
+from typing import Dict, Any, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model tiers, cheapest and fastest first
+TIERS = ("fast", "standard", "deep")
+
+# Model per provider and tier; override with LLM_MODEL_<PROVIDER>_<TIER>
+DEFAULT_TIER_MODELS = {
+    "openai": {"fast": "gpt-4o-mini", "standard": "gpt-4o-mini", "deep": "gpt-4o"},
+    "anthropic": {"fast": "claude-3-haiku-20240307", "standard": "claude-3-sonnet-20240229",
+                  "deep": "claude-3-sonnet-20240229"},
+    "local": {"fast": "default", "standard": "default", "deep": "default"}
+}
+
+# Task routing table: model tier and target end-to-end latency (seconds).
+# Override with LLM_TASK_<TASK>_TIER and LLM_TASK_<TASK>_TARGET_LATENCY.
+DEFAULT_TASKS = {
+    "note_insight": {"tier": "fast", "target_latency": 3.0},
+    "evaluation": {"tier": "fast", "target_latency": 3.0},
+    "chat": {"tier": "fast", "target_latency": 4.0},
+    "sounds": {"tier": "fast", "target_latency": 4.0},
+    "summary": {"tier": "fast", "target_latency": 8.0},
+    "exercise": {"tier": "standard", "target_latency": 6.0},
+    "meditation": {"tier": "standard", "target_latency": 10.0},
+    "recommendations": {"tier": "standard", "target_latency": 10.0},
+    "game_analytics": {"tier": "standard", "target_latency": 10.0},
+    "plan": {"tier": "standard", "target_latency": 15.0},
+    "analysis": {"tier": "deep", "target_latency": 20.0}
+}
+
+class ModelRouter:
+    """
+    Pick a model for each task from a routing table.
+
+    Short interactive tasks (note insights, answer evaluation) go to the fast
+    tier, long structured ones (patient analysis) to the deep tier. Each task
+    has a target latency that its calls are measured against in the LLM
+    metrics. Tasks not in the table use the provider's default model.
+
+    Args:
+        tasks (dict): Task to {"tier", "target_latency"}; defaults to DEFAULT_TASKS
+        tier_models (dict): Provider to {tier: model}; defaults to DEFAULT_TIER_MODELS
+    """
+
+    def __init__(self, tasks: Dict[str, Dict[str, Any]] = None, tier_models: Dict[str, Dict[str, str]] = None):
+        self.tasks = {}
+        for task, route in (tasks or DEFAULT_TASKS).items():
+            prefix = f"LLM_TASK_{task.upper()}"
+            tier = os.environ.get(f"{prefix}_TIER", route["tier"])
+            if tier not in TIERS:
+                logger.warning(f"Unknown model tier {tier} for task {task}; using {route['tier']}")
+                tier = route["tier"]
+            self.tasks[task] = {
+                "tier": tier,
+                "target_latency": float(os.environ.get(f"{prefix}_TARGET_LATENCY", route["target_latency"]))
+            }
+
+        self.tier_models = {}
+        for provider, models in (tier_models or DEFAULT_TIER_MODELS).items():
+            self.tier_models[provider] = {
+                tier: os.environ.get(f"LLM_MODEL_{provider.upper()}_{tier.upper()}", model)
+                for tier, model in models.items()
+            }
+
+    def route(self, task: Optional[str], provider: str) -> Optional[str]:
+        """Model for a task on a provider, or None to use the provider's default"""
+        route = self.tasks.get(task)
+        if route is None:
+            return None
+        return self.tier_models.get(provider, {}).get(route["tier"])
+
+    def target_latency(self, task: Optional[str]) -> Optional[float]:
+        """Target latency in seconds for a task, if it has one"""
+        route = self.tasks.get(task)
+        return route["target_latency"] if route else None
+
+    def table(self) -> List[Dict[str, Any]]:
+        """The routing table with the model chosen on each provider"""
+        return [
+            {
+                "task": task,
+                "tier": route["tier"],
+                "target_latency": route["target_latency"],
+                "models": {provider: models.get(route["tier"]) for provider, models in self.tier_models.items()}
+            }
+            for task, route in self.tasks.items()
+        ]
+
+# Singleton instance
+_router = None
+
+def get_model_router() -> ModelRouter:
+    """Get the singleton model router"""
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
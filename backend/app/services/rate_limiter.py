@@ -0,0 +1,148 @@
+import os
+import time
+import fcntl
+import struct
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared bucket state: requests available, tokens available, last refill (epoch seconds)
+_STATE = struct.Struct("<ddd")
+
+# Longest single sleep while queued, so freed capacity is noticed promptly
+_MAX_SLEEP = 0.25
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to queue longer than the limiter's max wait."""
+
+class RateLimiter:
+    """
+    Token buckets for one provider's requests-per-minute and tokens-per-minute
+    quotas, shared by every worker process on the host.
+
+    Bucket state lives in a small file updated under an exclusive flock, so
+    all gunicorn workers draw from the same quota. Each bucket holds up to
+    `burst_seconds` worth of its per-minute rate and refills continuously.
+    A call that doesn't fit waits for the buckets to refill, up to
+    `max_wait` seconds, instead of being sent and rejected with a 429.
+
+    Args:
+        name (str): Provider name; selects the state file
+        requests_per_minute (float): Request quota, or None for unlimited
+        tokens_per_minute (float): Token quota, or None for unlimited
+        burst_seconds (float): Seconds of quota that may be used at once
+        max_wait (float): Longest a call may queue before RateLimitExceeded
+        path (str): State file (defaults to LLM_RATE_LIMIT_DIR/mindflex_llm_rate_<name>.bin)
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 burst_seconds: float = 60.0, max_wait: float = 10.0, path: str = None):
+        self.name = name
+        self.rates = (
+            requests_per_minute / 60.0 if requests_per_minute else None,
+            tokens_per_minute / 60.0 if tokens_per_minute else None,
+        )
+        self.capacities = tuple(rate * burst_seconds if rate else None for rate in self.rates)
+        self.max_wait = max_wait
+        self.path = path or os.path.join(
+            os.environ.get("LLM_RATE_LIMIT_DIR", tempfile.gettempdir()),
+            f"mindflex_llm_rate_{name}.bin"
+        )
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _file(self) -> int:
+        """Open the state file once per process"""
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _take(self, requests: float, tokens: float) -> float:
+        """Deduct from both buckets if they can cover the call; otherwise return seconds to wait."""
+        wanted = (requests, tokens)
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(fd, _STATE.size, 0)
+                if len(data) == _STATE.size:
+                    requests_left, tokens_left, refilled_at = _STATE.unpack(data)
+                    available = [requests_left, tokens_left]
+                    elapsed = max(now - refilled_at, 0.0)
+                else:
+                    # New state file: buckets start full
+                    available = [capacity or 0.0 for capacity in self.capacities]
+                    elapsed = 0.0
+
+                wait = 0.0
+                for i, (rate, capacity) in enumerate(zip(self.rates, self.capacities)):
+                    if rate is None:
+                        continue
+                    available[i] = min(capacity, available[i] + rate * elapsed)
+                    # A call larger than the whole bucket waits for a full bucket
+                    need = min(wanted[i], capacity)
+                    if available[i] < need:
+                        wait = max(wait, (need - available[i]) / rate)
+
+                if wait == 0.0:
+                    for i, rate in enumerate(self.rates):
+                        if rate is not None:
+                            available[i] -= min(wanted[i], self.capacities[i])
+                os.pwrite(fd, _STATE.pack(available[0], available[1], now), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self, tokens: float = 0, max_wait: float = None) -> float:
+        """
+        Take one request and `tokens` tokens from the shared quota, queueing if needed.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded: If the quota would not cover the call within max_wait
+        """
+        if self.rates == (None, None):
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        started = time.monotonic()
+        while True:
+            wait = self._take(1, tokens)
+            waited = time.monotonic() - started
+            if wait == 0.0:
+                if waited > 0.01:
+                    logger.info(f"Queued {self.name} call for {waited:.2f}s by rate limit")
+                return waited
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(
+                    f"{self.name} rate limit: call would wait {waited + wait:.1f}s (max {max_wait}s)"
+                )
+            time.sleep(min(wait, _MAX_SLEEP))
+
+def limiter_from_env(name: str) -> Optional[RateLimiter]:
+    """
+    Build a provider's limiter from LLM_RATE_LIMIT_<NAME>_RPM / _TPM, or None
+    if neither quota is configured.
+    """
+    prefix = f"LLM_RATE_LIMIT_{name.upper()}"
+    rpm = os.environ.get(f"{prefix}_RPM")
+    tpm = os.environ.get(f"{prefix}_TPM")
+    if not rpm and not tpm:
+        return None
+    return RateLimiter(
+        name,
+        requests_per_minute=float(rpm) if rpm else None,
+        tokens_per_minute=float(tpm) if tpm else None,
+        burst_seconds=float(os.environ.get("LLM_RATE_LIMIT_BURST_SECONDS", 60)),
+        max_wait=float(os.environ.get("LLM_RATE_LIMIT_MAX_WAIT", 10))
+    )
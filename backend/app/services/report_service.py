@@ -0,0 +1,209 @@
+import os
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.supabase_client import supabase
+from app.utils.ml_utils import generate_cognitive_report, predict_cognitive_decline
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns the report and prediction need from game_scores
+HISTORY_COLUMNS = 'patient_id,game_id,score,duration,errors,created_at'
+
+def _json_safe(value):
+    """Convert numpy scalars and containers into plain JSON types."""
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def stream_patient_histories(page_size: int = 1000) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Yield (patient_id, score rows) for every patient, paging through game_scores.
+
+    Rows are ordered by patient and date, so only one patient's history is held
+    in memory at a time regardless of table size. The row id breaks ties, so
+    offset paging neither skips nor repeats rows.
+    """
+    offset = 0
+    current_id = None
+    current_rows = []
+    while True:
+        page = supabase.from_table('game_scores') \
+            .select(HISTORY_COLUMNS) \
+            .order('patient_id') \
+            .order('created_at') \
+            .order('id') \
+            .limit(page_size) \
+            .offset(offset) \
+            .execute()
+
+        for row in page:
+            if row['patient_id'] != current_id:
+                if current_rows:
+                    yield current_id, current_rows
+                current_id = row['patient_id']
+                current_rows = []
+            current_rows.append(row)
+
+        if len(page) < page_size:
+            break
+        offset += page_size
+
+    if current_rows:
+        yield current_id, current_rows
+
+def build_report(patient_id: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compute the cognitive report and decline prediction for one patient."""
+    history = pd.DataFrame(rows)
+    history['created_at'] = pd.to_datetime(history['created_at'])
+    for column in ('score', 'duration', 'errors'):
+        history[column] = pd.to_numeric(history[column]).fillna(0)
+
+    return {
+        "patient_id": patient_id,
+        "report": _json_safe(generate_cognitive_report(patient_id, history)),
+        "prediction": _json_safe(predict_cognitive_decline(patient_id, history)),
+        "sessions": len(rows),
+        "generated_at": datetime.now().isoformat()
+    }
+
+def _build_chunk(chunk: List[Tuple[str, List[Dict[str, Any]]]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Worker entry point: build reports for a chunk of patients."""
+    results = []
+    failures = 0
+    for patient_id, rows in chunk:
+        try:
+            results.append(build_report(patient_id, rows))
+        except Exception as e:
+            logger.error(f"Error building report for patient {patient_id}: {str(e)}")
+            failures += 1
+    return results, failures
+
+def _chunks(histories, chunk_size: int):
+    """Group the history stream into lists of `chunk_size` patients."""
+    chunk = []
+    for item in histories:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run_report_batch(chunk_size: int = None, workers: int = None, page_size: int = 1000) -> Dict[str, Any]:
+    """Precompute cognitive reports for every patient across a process pool.
+
+    Histories are streamed from Supabase and dispatched in chunks; at most two
+    chunks per worker are in flight so memory stays bounded. Each finished chunk
+    is upserted into `cognitive_reports`, and the run's throughput is recorded
+    in `report_batch_runs`.
+    """
+    chunk_size = chunk_size or int(os.environ.get('REPORT_BATCH_CHUNK_SIZE', 50))
+    workers = workers or int(os.environ.get('REPORT_BATCH_WORKERS', os.cpu_count() or 1))
+
+    started_at = datetime.now()
+    start = time.perf_counter()
+    stats = {"patients": 0, "sessions": 0, "failures": 0}
+
+    def store(future):
+        results, failures = future.result()
+        stats["failures"] += failures
+        if not results:
+            return
+        try:
+            supabase.from_table('cognitive_reports').upsert(results, on_conflict='patient_id')
+            stats["patients"] += len(results)
+            stats["sessions"] += sum(r["sessions"] for r in results)
+        except Exception as e:
+            logger.error(f"Error saving cognitive reports: {str(e)}")
+            stats["failures"] += len(results)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in _chunks(stream_patient_histories(page_size), chunk_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(future)
+            pending.add(pool.submit(_build_chunk, chunk))
+
+        for future in wait(pending).done:
+            store(future)
+
+    elapsed = time.perf_counter() - start
+    run = {
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.now().isoformat(),
+        "patients": stats["patients"],
+        "sessions": stats["sessions"],
+        "failures": stats["failures"],
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "patients_per_second": round(stats["patients"] / elapsed, 2) if elapsed > 0 else 0
+    }
+
+    try:
+        supabase.from_table('report_batch_runs').insert(run)
+    except Exception as e:
+        logger.error(f"Error recording batch run stats: {str(e)}")
+
+    logger.info(f"Cognitive report batch finished: {run}")
+    return run
+
+def get_precomputed_report(patient_id: str, max_age_hours: int = None) -> Optional[Dict[str, Any]]:
+    """Read a patient's report from the nightly batch, if it is fresh enough."""
+    if max_age_hours is None:
+        max_age_hours = int(os.environ.get('REPORT_MAX_AGE_HOURS', 36))
+
+    try:
+        rows = supabase.from_table('cognitive_reports').select('*').eq('patient_id', patient_id).limit(1).execute()
+    except Exception as e:
+        logger.error(f"Error fetching precomputed report: {str(e)}")
+        return None
+
+    if not rows:
+        return None
+
+    row = rows[0]
+    generated_at = pd.to_datetime(row.get("generated_at"), utc=True)
+    if pd.isna(generated_at) or generated_at < pd.Timestamp.now(tz='UTC') - timedelta(hours=max_age_hours):
+        return None
+    return row
+
+def get_cognitive_report(patient_id: str) -> Optional[Dict[str, Any]]:
+    """Serve the precomputed report, computing one on demand only if none exists."""
+    report = get_precomputed_report(patient_id)
+    if report:
+        report["precomputed"] = True
+        return report
+
+    rows = supabase.from_table('game_scores').select(HISTORY_COLUMNS) \
+        .eq('patient_id', patient_id).order('created_at').execute()
+    if not rows:
+        return None
+
+    report = build_report(patient_id, rows)
+    report["precomputed"] = False
+    return report
+
+if __name__ == "__main__":
+    # Nightly entry point: python -m app.services.report_service
+    parser = argparse.ArgumentParser(description="Precompute cognitive reports for all patients")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Patients per worker task")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows fetched per Supabase request")
+    args = parser.parse_args()
+
+    run_report_batch(args.chunk_size, args.workers, args.page_size)
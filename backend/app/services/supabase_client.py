@@ -1,5 +1,6 @@
 import os
 import requests
+from urllib.parse import quote
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -66,13 +67,37 @@ class SupabaseTable:
         return self
     
     def eq(self, column, value):
-        """Add an equals filter."""
-        self.query_params.append(f"{column}=eq.{value}")
+        """Add an equals filter (values are URL-encoded)."""
+        self.query_params.append(f"{column}=eq.{quote(str(value), safe='')}")
+        return self
+    
+    def lt(self, column, value):
+        """Add a less-than filter (values are URL-encoded, e.g. timestamps with a +hh:mm offset)."""
+        self.query_params.append(f"{column}=lt.{quote(str(value), safe='')}")
+        return self
+    
+    def gt(self, column, value):
+        """Add a greater-than filter."""
+        self.query_params.append(f"{column}=gt.{quote(str(value), safe='')}")
+        return self
+    
+    def or_(self, filters):
+        """Add an or filter in PostgREST syntax, e.g. "timestamp.lt.x,and(timestamp.eq.x,id.lt.y)"."""
+        self.query_params.append(f"or=({quote(filters, safe='(),.')})")
+        return self
+    
+    def is_(self, column, value):
+        """Add an is filter (null, true or false)."""
+        self.query_params.append(f"{column}=is.{value}")
         return self
     
     def order(self, column, ascending=True):
-        """Order results by a column."""
+        """Order results by a column; further calls add tiebreaker columns."""
         direction = "asc" if ascending else "desc"
+        for i, param in enumerate(self.query_params):
+            if param.startswith("order="):
+                self.query_params[i] = f"{param},{column}.{direction}"
+                return self
         self.query_params.append(f"order={column}.{direction}")
         return self
     
@@ -81,6 +106,11 @@ class SupabaseTable:
         self.query_params.append(f"limit={count}")
         return self
     
+    def offset(self, count):
+        """Skip the first `count` results (used with limit for paging)."""
+        self.query_params.append(f"offset={count}")
+        return self
+    
     def execute(self):
         """Execute the query and return results."""
         url = self.client._build_url(self.table)
@@ -94,22 +124,41 @@ class SupabaseTable:
             raise Exception(f"Query failed: {response.text}")
     
     def insert(self, data):
-        """Insert data into the table."""
+        """Insert data into the table, returning the inserted rows."""
         url = self.client._build_url(self.table)
-        response = requests.post(url, json=data, headers=self.client.headers)
+        headers = dict(self.client.headers)
+        headers["Prefer"] = "return=representation"
+        response = requests.post(url, json=data, headers=headers)
         
         if response.status_code in [200, 201]:
             return response.json()
         else:
             raise Exception(f"Insert failed: {response.text}")
     
+    def upsert(self, data, on_conflict=None):
+        """Insert data, merging into existing rows that conflict on `on_conflict` columns."""
+        url = self.client._build_url(self.table)
+        if on_conflict:
+            url += f"?on_conflict={on_conflict}"
+        headers = dict(self.client.headers)
+        headers["Prefer"] = "resolution=merge-duplicates,return=representation"
+        
+        response = requests.post(url, json=data, headers=headers)
+        
+        if response.status_code in [200, 201]:
+            return response.json()
+        else:
+            raise Exception(f"Upsert failed: {response.text}")
+    
     def update(self, data):
-        """Update data in the table (must be used with filters like eq)."""
+        """Update data in the table (must be used with filters like eq), returning the updated rows."""
         url = self.client._build_url(self.table)
         if self.query_params:
             url += "?" + "&".join(self.query_params)
+        headers = dict(self.client.headers)
+        headers["Prefer"] = "return=representation"
         
-        response = requests.patch(url, json=data, headers=self.client.headers)
+        response = requests.patch(url, json=data, headers=headers)
         
         if response.status_code == 200:
             return response.json()
@@ -0,0 +1,185 @@
+import re
+import unicodedata
+from typing import Dict, List, Any, Optional
+
+# Criteria wording that marks an answer as open-ended, or one of a class of
+# acceptable answers: judged by the LLM
+_FREE_FORM = re.compile(
+    r"\b(explain|describe|justify|reason|in your own words|creative|open[- ]ended|any (?!order\b)\w+"
+    r"|valid( english)? words?|anagram|similar|synonym|make sense|subjective|example)", re.IGNORECASE
+)
+# Criteria wording that makes the solution the only accepted answer
+_EXACT = re.compile(r"\b(exact|exactly|must match|correct answer is|match(es)? the solution)\b", re.IGNORECASE)
+_EXACT_SPELLING = re.compile(r"\b(exact spelling|spelled (exactly|correctly)|case[- ]sensitive)\b", re.IGNORECASE)
+# Criteria wording that accepts spelling slips; otherwise a near miss may be a different word
+_ALLOWS_TYPOS = re.compile(
+    r"\b(misspell(ed|ings?)?|typos?|minor spelling|spelling (mistakes|errors|slips)"
+    r"|ignore spelling|spelling (does not|doesn't) matter)\b", re.IGNORECASE
+)
+_ANY_ORDER = re.compile(r"\b(any order|order does not matter|order doesn't matter|regardless of order)\b",
+                        re.IGNORECASE)
+_IN_ORDER = re.compile(r"\b(in order|same order|correct order|sequence|order matters)\b", re.IGNORECASE)
+
+# Separators between items of a list answer
+_ITEM_SEPARATOR = re.compile(r"\s*(?:,|;|\n|\band\b|\bthen\b|->|→)\s*", re.IGNORECASE)
+_ARTICLES = re.compile(r"^(?:the|a|an)\s+")
+
+# Longest single-answer solution (in words) checked locally; longer ones are free-form
+MAX_SOLUTION_WORDS = 4
+
+FEEDBACK = {
+    "exact": ("That's exactly right!", "", "Excellent work!"),
+    "typo": ("Correct! Just check the spelling: the answer is \"{solution}\".",
+             "Take a moment to double-check spelling.", "Great job!"),
+    "numeric": ("Correct, the answer is {solution}.", "", "Well done!"),
+    "numeric_wrong": ("Not quite. The answer is {solution}.", "Recheck your working step by step.",
+                      "You're building your skills with every try!"),
+    "wrong": ("Not quite. The answer is \"{solution}\".", "Review the hints and try a similar exercise.",
+              "Keep practicing, you're improving!"),
+    "set_partial": ("Partially correct: you found {matched} of {total} ({found}).",
+                    "Look again for the ones you missed.", "Good progress, keep going!"),
+    "sequence_partial": ("Partially correct: {matched} of {total} are in the right position.",
+                         "Pay attention to the order of the items.", "You're close, keep it up!"),
+}
+
+def normalize(text: Any) -> str:
+    """Lowercase, strip accents, punctuation, leading articles and extra whitespace."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").lower()
+    text = re.sub(r"[^\w\s.-]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip(" .")
+    return _ARTICLES.sub("", text)
+
+def edit_distance(a: str, b: str, limit: int = None) -> int:
+    """Levenshtein distance, stopping early once every path exceeds `limit`."""
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def _typo_budget(text: str) -> int:
+    """Edits still counted as a spelling slip: none for very short answers, then one per four characters"""
+    return 0 if len(text) <= 3 else max(1, len(text) // 4)
+
+def _close(answer: str, solution: str) -> bool:
+    return edit_distance(answer, solution, _typo_budget(solution)) <= _typo_budget(solution)
+
+def _number(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+def _criteria_text(criteria: Any) -> str:
+    if isinstance(criteria, dict):
+        return " ".join(f"{k} {v}" for k, v in criteria.items())
+    if isinstance(criteria, list):
+        return " ".join(str(c) for c in criteria)
+    return str(criteria or "")
+
+def _items(value: Any) -> List[str]:
+    parts = value if isinstance(value, list) else _ITEM_SEPARATOR.split(str(value))
+    return [item for item in (normalize(part) for part in parts) if item]
+
+def _result(kind: str, score: float, correct: bool, method: str, **values) -> Dict[str, Any]:
+    feedback, suggestion, encouragement = FEEDBACK[kind]
+    return {
+        "correct": correct,
+        "score": round(score),
+        "feedback": feedback.format(**values),
+        "suggestion": suggestion,
+        "encouragement": encouragement,
+        "method": method
+    }
+
+def _compare_items(answer: str, solution: List[str], ordered: bool, typos: bool) -> Dict[str, Any]:
+    given = _items(answer)
+    total = len(solution)
+    if len(given) == 1 and len(given[0].split()) == total:
+        # Items separated by spaces only
+        given = given[0].split()
+    if ordered:
+        matched = sum(1 for a, s in zip(given, solution) if a == s or (typos and _close(a, s)))
+    else:
+        remaining = list(given)
+        found = []
+        for item in solution:
+            hit = next((a for a in remaining if a == item or (typos and _close(a, item))), None)
+            if hit is not None:
+                remaining.remove(hit)
+                found.append(item)
+        matched = len(found)
+
+    method = "sequence" if ordered else "set"
+    if matched == total and len(given) == total:
+        return _result("exact", 100, True, method)
+    # Extra items count against the score as missing ones do
+    score = 100 * matched / max(total, len(given))
+    if ordered:
+        return _result("sequence_partial", score, score >= 50, method, matched=matched, total=total)
+    return _result("set_partial", score, score >= 50, method, matched=matched, total=total,
+                   found=", ".join(found) or "none yet")
+
+def evaluate_locally(exercise: Dict[str, Any], answer: str) -> Optional[Dict[str, Any]]:
+    """
+    Evaluate an answer without the LLM when the exercise has a checkable solution.
+
+    Handles exact and normalized matches, spelling slips (edit distance)
+    when the criteria allow them, numbers, and lists compared as a set or a sequence as the exercise's
+    validation_criteria say. Returns an evaluation in the shape of the
+    "evaluation" schema plus the `method` used, or None when the answer
+    needs the LLM: free-form criteria, structured or long solutions, or a
+    mismatch the criteria don't rule on.
+    """
+    solution = exercise.get("solution")
+    criteria = _criteria_text(exercise.get("validation_criteria"))
+    if solution is None or isinstance(solution, dict) or not str(answer or "").strip() or _FREE_FORM.search(criteria):
+        return None
+
+    # Lists: as a set unless the criteria ask for an order
+    if isinstance(solution, list) or _ANY_ORDER.search(criteria) or _IN_ORDER.search(criteria):
+        items = _items(solution)
+        if len(items) > 1:
+            return _compare_items(answer, items, ordered=bool(_IN_ORDER.search(criteria)),
+                                  typos=bool(_ALLOWS_TYPOS.search(criteria)))
+        if not items:
+            return None
+        solution = items[0]
+
+    raw_solution = str(solution).strip()
+    expected = normalize(raw_solution)
+    given = normalize(answer)
+    if not expected or len(expected.split()) > MAX_SOLUTION_WORDS:
+        return None
+
+    if str(answer).strip() == raw_solution:
+        return _result("exact", 100, True, "exact")
+    # Case, accents and punctuation count: no normalized or fuzzy match
+    if _EXACT_SPELLING.search(criteria):
+        return _result("wrong", 0, False, "exact", solution=raw_solution)
+
+    number, given_number = _number(expected), _number(given)
+    if number is not None:
+        if given_number is None:
+            return None
+        if abs(number - given_number) <= 1e-9 * max(1.0, abs(number)):
+            return _result("numeric", 100, True, "numeric", solution=raw_solution)
+        return _result("numeric_wrong", 0, False, "numeric", solution=raw_solution)
+
+    if given == expected:
+        return _result("exact", 100, True, "normalized")
+    if _ALLOWS_TYPOS.search(criteria) and _close(given, expected):
+        return _result("typo", 90, True, "fuzzy", solution=raw_solution)
+
+    # A clear miss is only final when the solution is the one accepted answer
+    if _EXACT.search(criteria):
+        return _result("wrong", 0, False, "exact", solution=raw_solution)
+    return None
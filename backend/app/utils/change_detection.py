@@ -0,0 +1,147 @@
+import os
+
+# Default Page-Hinkley parameters per series, in the series' own units.
+# drift is the tolerated change in the mean per session; threshold is how far
+# the cumulative deviation must move before a change point is raised.
+DEFAULT_PARAMS = {
+    'score': {
+        'drift': float(os.environ.get('CHANGE_POINT_SCORE_DRIFT', 2.0)),
+        'threshold': float(os.environ.get('CHANGE_POINT_SCORE_THRESHOLD', 40.0)),
+        'direction': 'decrease'
+    },
+    'errors': {
+        'drift': float(os.environ.get('CHANGE_POINT_ERRORS_DRIFT', 0.75)),
+        'threshold': float(os.environ.get('CHANGE_POINT_ERRORS_THRESHOLD', 10.0)),
+        'direction': 'increase'
+    }
+}
+
+# Sessions to observe before a change point may be raised
+MIN_SAMPLES = 5
+
+class PageHinkley:
+    """
+    Page-Hinkley test for a sustained shift in the mean of a series.
+
+    Runs in O(1) time and memory per observation, so the same detector serves
+    batch scans over a full history and incremental updates per session. The
+    detector restarts after each alarm so later shifts are found as well.
+
+    Args:
+        drift (float): Magnitude of change tolerated without an alarm
+        threshold (float): Cumulative deviation that raises an alarm
+        direction (str): 'decrease' or 'increase'
+        state (sequence): Optional state from a previous `state()` call
+    """
+
+    STATE_SIZE = 5
+
+    def __init__(self, drift=2.0, threshold=40.0, direction='decrease', state=None):
+        if direction not in ('decrease', 'increase'):
+            raise ValueError(f"Unknown direction: {direction}")
+        self.drift = drift
+        self.threshold = threshold
+        self.sign = -1.0 if direction == 'decrease' else 1.0
+
+        # Samples seen, running mean, cumulative deviation, its minimum, and
+        # the sample count at which that minimum was reached
+        if state is None:
+            state = (0.0, 0.0, 0.0, 0.0, 0.0)
+        self.count, self.mean, self.cumulative, self.minimum, self.minimum_at = (float(v) for v in state)
+
+    def state(self):
+        """Serializable detector state (fixed length, all floats)."""
+        return (self.count, self.mean, self.cumulative, self.minimum, self.minimum_at)
+
+    def reset(self):
+        """Start over, as after an alarm."""
+        self.count = self.mean = self.cumulative = self.minimum = self.minimum_at = 0.0
+
+    def update(self, value):
+        """
+        Add one observation.
+
+        Returns:
+            dict or None: On alarm, the number of samples back to the estimated
+            onset of the change and its magnitude in series units
+        """
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+
+        # Deviations in the watched direction accumulate upward
+        self.cumulative += self.sign * (value - self.mean) - self.drift
+        if self.cumulative < self.minimum:
+            self.minimum = self.cumulative
+            self.minimum_at = self.count
+
+        if self.count >= MIN_SAMPLES and self.cumulative - self.minimum > self.threshold:
+            sessions_since_onset = int(self.count - self.minimum_at)
+            magnitude = (self.cumulative - self.minimum) / max(sessions_since_onset, 1)
+            self.reset()
+            return {
+                "sessions_since_onset": sessions_since_onset,
+                "magnitude": round(magnitude, 2)
+            }
+        return None
+
+def detect_change_points(values, drift=2.0, threshold=40.0, direction='decrease'):
+    """
+    Scan a series for change points in a single O(n) pass.
+
+    Args:
+        values (array-like): Observations in chronological order
+        drift (float): Magnitude of change tolerated without an alarm
+        threshold (float): Cumulative deviation that raises an alarm
+        direction (str): 'decrease' or 'increase'
+
+    Returns:
+        list: One dict per change point with the detection index, the
+        estimated onset index and the per-session magnitude
+    """
+    detector = PageHinkley(drift, threshold, direction)
+    change_points = []
+    for index, value in enumerate(values):
+        alarm = detector.update(float(value))
+        if alarm:
+            change_points.append({
+                "index": index,
+                "onset_index": index - alarm["sessions_since_onset"] + 1,
+                "magnitude": alarm["magnitude"]
+            })
+    return change_points
+
+def detect_decline_change_points(df, params=None):
+    """
+    Find score drops and error increases for each game type in a history.
+
+    Args:
+        df (DataFrame): Game score data with created_at, score and errors
+        params (dict): Optional per-series overrides of DEFAULT_PARAMS
+
+    Returns:
+        list: Change points tagged with game, metric and onset/detection dates
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    if 'created_at' not in df.columns:
+        return []
+
+    df = df.sort_values('created_at')
+    groups = df.groupby('game_id', sort=False) if 'game_id' in df.columns else [(None, df)]
+
+    change_points = []
+    for game_id, game_data in groups:
+        dates = game_data['created_at']
+        for metric in ('score', 'errors'):
+            if metric not in game_data.columns:
+                continue
+            values = game_data[metric].fillna(0).to_numpy()
+            for point in detect_change_points(values, **params[metric]):
+                change_points.append({
+                    "game_id": game_id,
+                    "metric": metric,
+                    "direction": params[metric]['direction'],
+                    "onset": str(dates.iloc[point["onset_index"]]),
+                    "detected": str(dates.iloc[point["index"]]),
+                    "magnitude": point["magnitude"]
+                })
+    return change_points
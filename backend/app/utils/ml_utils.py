@@ -1,8 +1,8 @@
 import numpy as np
 import pandas as pd
-import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
+from app.utils.change_detection import detect_decline_change_points
 
 def detect_cognitive_trends(df):
     """
@@ -60,25 +60,103 @@ def detect_cognitive_trends(df):
             
             # Calculate the slope of recent values
             slope = np.polyfit(range(len(recent_values)), recent_values, 1)[0]
-            
-            # Determine trend direction
-            if feature == 'score':
-                # For score, higher is better
-                if slope > 0.05:
-                    trends[feature] = "improving"
-                elif slope < -0.05:
-                    trends[feature] = "declining"
-                else:
-                    trends[feature] = "stable"
-            else:
-                # For duration and errors, lower is better
-                if slope > 0.05:
-                    trends[feature] = "declining"
-                elif slope < -0.05:
-                    trends[feature] = "improving"
-                else:
-                    trends[feature] = "stable"
+            trends[feature] = _classify_slope(feature, slope)
+    
+    return _summarize_trends(trends)
+
+def detect_cognitive_trends_fast(score=None, duration=None, errors=None):
+    """
+    NumPy-only equivalent of detect_cognitive_trends for plain arrays.
+    
+    Avoids DataFrame construction and the rolling/diff/dropna machinery, which
+    dominate the runtime for the short histories seen per request. Moving
+    averages come from a cumulative sum and slopes from the closed-form
+    least-squares solution. Missing values (NaN) are handled as pandas does:
+    only the windows and rates of change that include them are dropped.
+    
+    Args:
+        score (array-like): Scores in chronological order, or None if absent
+        duration (array-like): Durations in chronological order, or None
+        errors (array-like): Error counts in chronological order, or None
+        
+    Returns:
+        dict: Trend analysis results, identical to detect_cognitive_trends
+    """
+    series = {}
+    for feature, values in (('score', score), ('duration', duration), ('errors', errors)):
+        if values is not None:
+            series[feature] = np.asarray(values, dtype=float)
+    
+    length = len(next(iter(series.values()))) if series else 0
+    
+    # Check if we have enough data points
+    if length < 5:
+        return {
+            "trend": "insufficient_data",
+            "details": "Need at least 5 game sessions for trend analysis"
+        }
+    
+    window_size = min(5, length // 2)
+    valid = np.ones(length, dtype=bool)
+    moving_averages = {}
+    
+    for feature, values in series.items():
+        # Moving average via cumulative sums of the present values; windows that
+        # are not full (the first window-1, or any holding a NaN) are undefined
+        present = ~np.isnan(values)
+        cumulative = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+        counts = np.concatenate(([0], np.cumsum(present)))
+        full = counts[window_size:] - counts[:-window_size] == window_size
+        moving_average = np.full(length, np.nan)
+        moving_average[window_size - 1:] = np.where(
+            full, (cumulative[window_size:] - cumulative[:-window_size]) / window_size, np.nan
+        )
+        
+        # Rate of change; 0/0 yields NaN and drops the row, as with pandas
+        rate_of_change = np.full(length, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate_of_change[1:] = np.diff(values) / values[:-1]
+        
+        valid &= ~np.isnan(moving_average) & ~np.isnan(rate_of_change)
+        moving_averages[feature] = moving_average
+    
+    if not series or np.count_nonzero(valid) < 3:
+        return {
+            "trend": "insufficient_data",
+            "details": "Not enough data points after processing"
+        }
+    
+    trends = {}
+    for feature, moving_average in moving_averages.items():
+        recent_values = moving_average[valid][-3:]
+        trends[feature] = _classify_slope(feature, _least_squares_slope(recent_values))
+    
+    return _summarize_trends(trends)
+
+def _least_squares_slope(values):
+    """Closed-form least-squares slope of values against 0..n-1."""
+    x = np.arange(len(values)) - (len(values) - 1) / 2
+    return float(np.dot(x, values) / np.dot(x, x))
+
+def _classify_slope(feature, slope):
+    """Map a moving-average slope to improving/declining/stable for a feature."""
+    if feature == 'score':
+        # For score, higher is better
+        if slope > 0.05:
+            return "improving"
+        elif slope < -0.05:
+            return "declining"
+        return "stable"
     
+    # For duration and errors, lower is better
+    if slope > 0.05:
+        return "declining"
+    elif slope < -0.05:
+        return "improving"
+    return "stable"
+
+def _summarize_trends(trends):
+    """Build the overall trend and human-readable details from per-feature trends."""
     # Determine overall trend
     if 'score' in trends:
         overall_trend = trends['score']
@@ -163,6 +241,9 @@ def predict_cognitive_decline(patient_id, game_history):
     # Calculate a simple risk score
     risk_score = -score_trend + error_trend
     
+    # Head/tail means miss gradual or mid-history drops; change points catch them
+    change_points = detect_decline_change_points(game_history)
+    
     # Map to risk levels
     if risk_score > 5:
         risk_level = "high"
@@ -172,6 +253,10 @@ def predict_cognitive_decline(patient_id, game_history):
         risk_level = "moderate"
         confidence = 0.6
         message = "Some indicators of potential cognitive changes. Continue monitoring."
+    elif change_points:
+        risk_level = "moderate"
+        confidence = 0.6
+        message = "A sustained drop in performance was detected during the history. Continue monitoring."
     else:
         risk_level = "low"
         confidence = 0.7
@@ -180,9 +265,17 @@ def predict_cognitive_decline(patient_id, game_history):
     return {
         "risk_level": risk_level,
         "confidence": confidence,
-        "message": message
+        "message": message,
+        "change_points": change_points
     }
 
+def _detect_trends_for_frame(df):
+    """Run the NumPy trend fast path on a game history DataFrame."""
+    df = df.sort_values('created_at')
+    columns = [df[feature].to_numpy() if feature in df.columns else None
+               for feature in ('score', 'duration', 'errors')]
+    return detect_cognitive_trends_fast(*columns)
+
 def generate_cognitive_report(patient_id, game_history, time_period='30d'):
     """
     Generate a comprehensive cognitive report for a patient.
@@ -204,6 +297,7 @@ def generate_cognitive_report(patient_id, game_history, time_period='30d'):
         "time_period": time_period,
         "overall_trend": None,
         "game_analysis": {},
+        "change_points": [],
         "recommendations": []
     }
     
@@ -212,7 +306,7 @@ def generate_cognitive_report(patient_id, game_history, time_period='30d'):
         game_data = game_history[game_history['game_id'] == game_type]
         
         if len(game_data) >= 3:
-            trend_data = detect_cognitive_trends(game_data)
+            trend_data = _detect_trends_for_frame(game_data)
             
             report["game_analysis"][game_type] = {
                 "sessions": len(game_data),
@@ -221,6 +315,12 @@ def generate_cognitive_report(patient_id, game_history, time_period='30d'):
                 "details": trend_data["details"]
             }
     
+    # Flag sustained drops in score or rises in errors per game type
+    report["change_points"] = detect_decline_change_points(game_history)
+    for point in report["change_points"]:
+        if point["game_id"] in report["game_analysis"]:
+            report["game_analysis"][point["game_id"]].setdefault("change_points", []).append(point)
+    
     # Determine overall trend
     trends = [analysis["trend"] for analysis in report["game_analysis"].values() 
               if analysis["trend"] != "insufficient_data"]
@@ -248,4 +348,10 @@ def generate_cognitive_report(patient_id, game_history, time_period='30d'):
     else:
         report["recommendations"].append("Continue playing games to generate more data for analysis")
     
+    if report["change_points"]:
+        games = sorted({str(point["game_id"]) for point in report["change_points"]})
+        report["recommendations"].append(
+            f"Review recent sessions of {', '.join(games)}: a sustained change in performance was detected"
+        )
+    
     return report 
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, List, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tokens a chat API adds around each message for role and separators
+MESSAGE_OVERHEAD = 4
+
+# Encoding used for models tiktoken doesn't know (Claude, local models);
+# close enough for budgeting
+FALLBACK_ENCODING = "cl100k_base"
+
+def default_budget() -> int:
+    """Prompt token budget from LLM_PROMPT_TOKEN_BUDGET."""
+    return int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", 3000))
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    """tiktoken encoding for a model, or None if tiktoken is unavailable.
+
+    tiktoken downloads encodings on first use; a failure is cached so later
+    calls fall back to the estimate instead of retrying the download.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken not installed; estimating prompt tokens from length")
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(FALLBACK_ENCODING)
+    except KeyError:
+        return _encoding(None)
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model or FALLBACK_ENCODING}: {str(e)}; estimating from length")
+        return None
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Number of tokens in `text` for `model` (about 4 characters per token without tiktoken)."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = None) -> int:
+    """Tokens a list of chat messages occupies in the prompt."""
+    return sum(count_tokens(m.get("content", ""), model) + MESSAGE_OVERHEAD for m in messages)
+
+def fit_messages(messages: List[Dict[str, str]], budget: int = None, model: str = None) -> List[Dict[str, str]]:
+    """
+    Drop the oldest conversation history until the messages fit the budget.
+
+    System messages and the final message (the new query) are always kept;
+    history is kept from the newest message backwards while it fits.
+    """
+    budget = budget or default_budget()
+    if len(messages) <= 1:
+        return messages
+
+    pinned = [m for m in messages[:-1] if m["role"] == "system"]
+    history = [m for m in messages[:-1] if m["role"] != "system"]
+    remaining = budget - count_message_tokens(pinned + messages[-1:], model)
+
+    kept = []
+    for message in reversed(history):
+        cost = count_tokens(message.get("content", ""), model) + MESSAGE_OVERHEAD
+        if cost > remaining:
+            break
+        kept.append(message)
+        remaining -= cost
+
+    if len(kept) < len(history):
+        logger.info(f"Trimmed {len(history) - len(kept)} history messages to fit {budget} prompt tokens")
+    return pinned + kept[::-1] + messages[-1:]
+
+class PromptBuilder:
+    """
+    Assemble a prompt from sections that are trimmed by priority to fit a
+    token budget.
+
+    Required sections (instructions, the question) are always included.
+    Optional sections are filled from the highest priority down: a text
+    section is included whole or not at all, an item section keeps as many
+    of its leading items as fit. Sections appear in the order they were
+    added regardless of priority.
+
+    Args:
+        budget (int): Token budget for the whole prompt (LLM_PROMPT_TOKEN_BUDGET)
+        model (str): Model whose tokenizer is used for counting
+    """
+
+    def __init__(self, budget: int = None, model: str = None):
+        self.budget = budget or default_budget()
+        self.model = model
+        self.sections = []
+        self.dropped = {}
+
+    def add(self, text: str, priority: int = 0, required: bool = False) -> "PromptBuilder":
+        """Add a block of text."""
+        self.sections.append({"header": "", "items": [text], "priority": priority,
+                              "required": required, "whole": True})
+        return self
+
+    def add_items(self, header: str, items: List[str], priority: int = 0) -> "PromptBuilder":
+        """Add a header followed by items, most important first; trailing items are trimmed."""
+        if items:
+            self.sections.append({"header": header, "items": list(items), "priority": priority,
+                                  "required": False, "whole": False})
+        return self
+
+    def build(self) -> str:
+        """Render the prompt within the budget; `dropped` records what was cut."""
+        remaining = self.budget
+        kept = {}
+        for index, section in enumerate(self.sections):
+            if section["required"]:
+                kept[index] = section["items"]
+                remaining -= self._cost(section["header"], section["items"])
+
+        optional = [i for i, s in enumerate(self.sections) if not s["required"]]
+        for index in sorted(optional, key=lambda i: -self.sections[i]["priority"]):
+            section = self.sections[index]
+            if section["whole"]:
+                cost = self._cost("", section["items"])
+                if cost <= remaining:
+                    kept[index] = section["items"]
+                    remaining -= cost
+                continue
+
+            header_cost = count_tokens(section["header"], self.model)
+            items = []
+            for item in section["items"]:
+                cost = count_tokens(item, self.model)
+                if header_cost + cost > remaining:
+                    break
+                items.append(item)
+                remaining -= header_cost + cost
+                header_cost = 0
+            if items:
+                kept[index] = items
+
+        self.dropped = {}
+        for index, section in enumerate(self.sections):
+            cut = len(section["items"]) - len(kept.get(index, []))
+            if cut:
+                self.dropped[section["header"].strip() or f"section {index}"] = cut
+        if self.dropped:
+            logger.info(f"Trimmed prompt to {self.budget} tokens, dropped: {self.dropped}")
+
+        return "".join(
+            self.sections[i]["header"] + "".join(kept[i])
+            for i in range(len(self.sections)) if i in kept
+        )
+
+    def _cost(self, header: str, items: List[str]) -> int:
+        return count_tokens(header, self.model) + sum(count_tokens(item, self.model) for item in items)
@@ -0,0 +1,233 @@
+import re
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, List, Any, Tuple
+
+from app.services.llm_metrics import get_metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+
+def _object(properties: Dict[str, Any], required=None) -> Dict[str, Any]:
+    return {"type": "object", "properties": properties, "required": list(required or properties)}
+
+# JSON schemas for the structured responses the agents request. Providers
+# constrain generation to them (see LLMProvider._chat_payload) and responses
+# are validated against them. Top-level arrays are wrapped in an object, as
+# OpenAI and Anthropic tool schemas require.
+SCHEMAS = {
+    "exercise": _object({
+        "title": {"type": "string"},
+        "instructions": {"type": "string"},
+        "content": {"type": ["string", "array", "object"]},
+        "hints": _STRINGS,
+        "solution": {"type": ["string", "array", "object"]},
+        "validation_criteria": {"type": ["string", "array", "object"]}
+    }),
+    "evaluation": _object({
+        "correct": {"type": "boolean"},
+        "score": {"type": "number", "minimum": 0, "maximum": 100},
+        "feedback": {"type": "string"},
+        "suggestion": {"type": "string"},
+        "encouragement": {"type": "string"}
+    }, required=["correct", "score", "feedback"]),
+    "sound_recommendations": _object({
+        "recommendations": {
+            "type": "array",
+            "items": _object({
+                "title": {"type": "string"},
+                "category": {"type": "string"},
+                "duration": {"type": "number"},
+                "description": {"type": "string"},
+                "instructions": {"type": "string"}
+            })
+        }
+    }),
+    "patient_analysis": _object({
+        "progress_summary": {"type": "string"},
+        "cognitive_strengths": _STRINGS,
+        "improvement_areas": _STRINGS,
+        "recommendations": _STRINGS,
+        "caregiver_tips": _STRINGS,
+        "follow_up": _STRINGS
+    }),
+    "daily_plan": _object({
+        name: _STRINGS for name in (
+            "morning_routine", "cognitive_exercises", "physical_activities", "meals",
+            "therapy_sessions", "social_engagement", "evening_routine", "caregiver_breaks"
+        )
+    }),
+    "game_analytics": _object({
+        "strengths": _STRINGS,
+        "areas_for_improvement": _STRINGS,
+        "recommendations": _STRINGS,
+        "cognitive_pattern": {"type": "string"},
+        "progress_projection": {"type": "string"}
+    }, required=["strengths", "areas_for_improvement", "recommendations"])
+}
+
+# A fenced ```json block, for models that ignore the JSON mode
+_FENCED = re.compile(r'```(?:json)?\s*([\s\S]+?)\s*```')
+
+class StructuredOutputError(ValueError):
+    """A response that isn't JSON or doesn't match its schema."""
+
+def response_schema(name: str) -> Dict[str, Any]:
+    """The options["response_schema"] value that asks a provider for JSON matching a schema"""
+    return {"name": name, "schema": SCHEMAS[name]}
+
+@lru_cache(maxsize=None)
+def _validator(name: str):
+    """Precompiled validator for a schema, or None if jsonschema is unavailable"""
+    try:
+        from jsonschema import Draft202012Validator
+    except ImportError:
+        logger.warning("jsonschema not installed; structured responses are parsed but not validated")
+        return None
+    schema = SCHEMAS[name]
+    Draft202012Validator.check_schema(schema)
+    return Draft202012Validator(schema)
+
+def extract_json(text: str) -> Any:
+    """Decode JSON from a response, tolerating a code fence or text around the object."""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    match = _FENCED.search(text)
+    if match:
+        text = match.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise StructuredOutputError("No JSON found in response")
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text[min(starts):])
+    except ValueError as e:
+        raise StructuredOutputError(f"Invalid JSON in response: {str(e)}")
+    return value
+
+class JSONStreamExtractor:
+    """
+    Incremental parser for a JSON object arriving in chunks.
+
+    Text before the first "{" (prose, a code fence) is skipped. Each
+    top-level field is decoded and returned by `feed` as soon as its value
+    closes, so the first fields of a response can be shown while the rest
+    is still being generated. `value` holds the fields seen so far.
+    """
+
+    def __init__(self):
+        self.value = {}
+        self.done = False
+        self._text = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"
+        self._key = None
+        self._start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk; returns the (field, value) pairs completed by it"""
+        completed = []
+        for ch in chunk:
+            if self.done:
+                break
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._text = ["{"]
+                continue
+
+            pos = len(self._text)
+            self._text.append(ch)
+            top = self._depth == 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if top and self._expect == "key_string":
+                        self._key = json.loads("".join(self._text[self._start:pos + 1]))
+                        self._expect = "colon"
+                continue
+
+            if top and self._expect == "key" and ch == '"':
+                self._start, self._expect = pos, "key_string"
+            elif top and self._expect == "colon" and ch == ":":
+                self._expect = "value_start"
+                continue
+            elif top and self._expect == "value_start" and not ch.isspace():
+                self._start, self._expect = pos, "value"
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+
+            if (self._depth == 1 and ch == ",") or self._depth == 0:
+                if self._expect == "value":
+                    field = self._close_field(pos)
+                    if field is not None:
+                        completed.append(field)
+                self._expect = "key"
+                self.done = self._depth == 0
+        return completed
+
+    def _close_field(self, end: int):
+        try:
+            value = json.loads("".join(self._text[self._start:end]))
+        except ValueError:
+            return None
+        self.value[self._key] = value
+        return self._key, value
+
+def validate(value: Any, name: str):
+    """Check a decoded value against the named schema.
+
+    Raises:
+        StructuredOutputError: If it doesn't match
+    """
+    validator = _validator(name)
+    if validator is None:
+        return
+    error = next(iter(validator.iter_errors(value)), None)
+    if error is not None:
+        location = "/".join(str(p) for p in error.absolute_path) or "response"
+        raise StructuredOutputError(f"{location}: {error.message}")
+
+def parse_structured(text: str, name: str) -> Any:
+    """
+    Decode a response and validate it against the named schema.
+
+    Outcomes are counted per schema in the LLM metrics (ok, invalid_json,
+    schema_mismatch) so parse failures stay visible.
+
+    Raises:
+        StructuredOutputError: If the response isn't JSON or doesn't match
+    """
+    metrics = get_metrics()
+    try:
+        value = extract_json(text)
+    except StructuredOutputError:
+        metrics.record_structured_output(name, "invalid_json")
+        raise
+
+    try:
+        validate(value, name)
+    except StructuredOutputError:
+        metrics.record_structured_output(name, "schema_mismatch")
+        raise
+
+    metrics.record_structured_output(name, "ok")
+    return value
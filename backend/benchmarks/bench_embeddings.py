@@ -0,0 +1,60 @@
+"""
+Embedding many texts: one request per text versus embed_many.
+
+Embeds a set of caregiver-note-like texts (with repeats) against the local
+fake provider three ways: the per-text `embedding` call, a cold
+`LLMService.embed_many` (batched, deduplicated), and a warm one where every
+text is already in the vector cache.
+
+Run from the backend directory:
+    python benchmarks/bench_embeddings.py
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.services.llm_cache import EmbeddingCache
+from app.services.llm_service import LLMService, OpenAIProvider
+from fake_llm_server import start_fake_server
+
+TEXTS = 1000
+UNIQUE = 600
+
+def notes():
+    return [f"Patient seemed {['calm', 'restless', 'tired'][i % 3]} after session {i % UNIQUE}" for i in range(TEXTS)]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    process, base_url, _ = start_fake_server()
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            provider = OpenAIProvider("test")
+            provider.base_url = f"{base_url}/v1"
+            service = LLMService(providers={"openai": provider},
+                                 embedding_cache=EmbeddingCache(os.path.join(tmpdir, "cache.sqlite3")))
+            texts = notes()
+
+            _, single = timed(lambda: [provider.embedding(text) for text in texts])
+            matrix, cold = timed(lambda: service.embed_many(texts, provider))
+            _, warm = timed(lambda: service.embed_many(texts, provider))
+
+            print(f"{TEXTS} texts ({UNIQUE} unique), {matrix.shape[1]} dims, batch size {provider.embedding_batch_size}")
+            print(f"{'mode':<28} {'seconds':>8} {'speedup':>8}")
+            for name, elapsed in (("embedding() per text", single), ("embed_many, cold cache", cold), ("embed_many, warm cache", warm)):
+                print(f"{name:<28} {elapsed:>8.3f} {single / elapsed:>7.1f}x")
+            print(f"cache matrix: {service.embedding_cache.stats()['memory_bytes'] / 1e6:.1f} MB float32")
+    finally:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Wall time of a batch of chat prompts issued serially versus concurrently.
+
+Each prompt takes about as long as the fake provider's simulated generation
+(~200 ms). With agenerate_chat the batch finishes in roughly
+ceil(prompts / LLM_MAX_CONCURRENCY) generation times.
+
+Run from the backend directory:
+    python benchmarks/bench_llm_concurrency.py
+"""
+import os
+import sys
+import time
+import asyncio
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.services.llm_service import OpenAIProvider
+from fake_llm_server import start_fake_server
+
+PROMPTS = 16
+
+def prompts():
+    return [[{"role": "user", "content": f"Suggest activity {i} for today."}] for i in range(PROMPTS)]
+
+def serial(provider):
+    for messages in prompts():
+        provider.generate_chat(messages)
+
+async def concurrent(provider):
+    await asyncio.gather(*(provider.agenerate_chat(messages) for messages in prompts()))
+
+def main():
+    process, base_url, _ = start_fake_server()
+    try:
+        provider = OpenAIProvider("test")
+        provider.base_url = f"{base_url}/v1"
+        provider.session.headers["X-Simulate-Generation"] = "1"
+
+        start = time.perf_counter()
+        serial(provider)
+        baseline = time.perf_counter() - start
+        print(f"{'mode':<24} {'wall s':>8} {'speedup':>8}")
+        print(f"{'serial':<24} {baseline:>8.2f} {1.0:>7.1f}x")
+
+        for limit in (2, 4, 8, 16):
+            os.environ["LLM_MAX_CONCURRENCY"] = str(limit)
+            provider = OpenAIProvider("test")
+            provider.base_url = f"{base_url}/v1"
+            provider.session.headers["X-Simulate-Generation"] = "1"
+            start = time.perf_counter()
+            asyncio.run(concurrent(provider))
+            elapsed = time.perf_counter() - start
+            print(f"{f'async, limit {limit}':<24} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x")
+    finally:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Tail latency of chat calls with and without hedging.
+
+Simulates a primary provider whose latency is usually ~50 ms but 5% of the
+time stalls for 1 s, and a backup provider that steadily answers in ~80 ms.
+Reports p50/p95/p99 through LLMService with hedging off and at the p90.
+
+Run from the backend directory:
+    python benchmarks/bench_llm_hedging.py
+"""
+import os
+import sys
+import time
+import random
+import logging
+
+import numpy as np
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+
+from app.services.llm_service import LLMService, LocalLLMProvider
+
+CALLS = 400
+MESSAGES = [{"role": "user", "content": "Suggest a short breathing exercise."}]
+
+class SimulatedProvider(LocalLLMProvider):
+    """Sleeps for a sampled latency instead of calling an API."""
+
+    def __init__(self, name, latency):
+        super().__init__()
+        self.name = name
+        self.latency = latency
+
+    def _chat(self, messages, options=None):
+        time.sleep(self.latency())
+        return f"answer from {self.name}"
+
+def run(service):
+    latencies = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        service.generate_chat(MESSAGES)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 95, 99])
+
+def main():
+    logging.getLogger("app.services.llm_service").setLevel(logging.WARNING)
+    rng = random.Random(7)
+    primary = SimulatedProvider("openai", lambda: 1.0 if rng.random() < 0.05 else rng.uniform(0.04, 0.06))
+    backup = SimulatedProvider("anthropic", lambda: rng.uniform(0.07, 0.09))
+
+    print(f"{'mode':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, percentile in (("no hedging", 0), ("hedge at p90", 90)):
+        service = LLMService(providers={"openai": primary, "anthropic": backup})
+        service.fallback_order = ["openai", "anthropic"]
+        service.cache = None
+        service.hedge_percentile = percentile
+        service.hedge_min_delay = 0.0
+        p50, p95, p99 = run(service)
+        print(f"{name:<20} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Per-call overhead of the LLM providers against a local fake provider.
+
+Compares the previous pattern (headers rebuilt and a fresh connection per
+requests.post) with the providers' pooled keep-alive sessions.
+
+Run from the backend directory:
+    python benchmarks/bench_llm_providers.py
+"""
+import os
+import sys
+import time
+import statistics
+
+import requests
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.services.llm_service import OpenAIProvider, AnthropicProvider, LocalLLMProvider
+from fake_llm_server import start_fake_server
+
+CALLS = 300
+MESSAGES = [{"role": "user", "content": "Suggest a short breathing exercise."}]
+
+def unpooled_openai_call(base_url):
+    """The request pattern used before pooling: new headers, new connection."""
+    headers = {"Authorization": "Bearer test", "Content-Type": "application/json"}
+    data = {"model": "gpt-3.5-turbo", "messages": MESSAGES, "max_tokens": 500, "temperature": 0.7}
+    response = requests.post(f"{base_url}/v1/chat/completions", headers=headers, json=data)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"].strip()
+
+def per_call_ms(fn, calls=CALLS, rounds=5):
+    """Median over several rounds of the mean per-call latency."""
+    fn()  # warm up (first connection, imports)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - start) / calls * 1000)
+    return statistics.median(timings)
+
+def main():
+    process, base_url, connections = start_fake_server()
+    try:
+        openai = OpenAIProvider("test")
+        openai.base_url = f"{base_url}/v1"
+        anthropic = AnthropicProvider("test")
+        anthropic.base_url = f"{base_url}/v1"
+        local = LocalLLMProvider(base_url)
+
+        clients = [
+            ("unpooled requests.post", lambda: unpooled_openai_call(base_url)),
+            ("OpenAIProvider (pooled)", lambda: openai.generate_chat(MESSAGES)),
+            ("AnthropicProvider (pooled)", lambda: anthropic.generate_chat(MESSAGES)),
+            ("LocalLLMProvider (pooled)", lambda: local.generate_chat(MESSAGES)),
+        ]
+
+        rows = []
+        for name, fn in clients:
+            opened = connections.value
+            ms = per_call_ms(fn)
+            rows.append((name, ms, connections.value - opened))
+
+        baseline = rows[0][1]
+        print(f"{'client':<28} {'ms/call':>8} {'vs unpooled':>12} {'connections':>12}")
+        for name, ms, opened in rows:
+            print(f"{name:<28} {ms:>8.3f} {baseline / ms:>11.1f}x {opened:>12}")
+    finally:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
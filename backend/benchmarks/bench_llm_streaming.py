@@ -0,0 +1,65 @@
+"""
+Time-to-first-token of streamed versus blocking chat responses.
+
+Runs each provider against the local fake provider, which emits one word
+every TOKEN_DELAY seconds, and reports when the first text reached the
+caller and when the full response was complete.
+
+Run from the backend directory:
+    python benchmarks/bench_llm_streaming.py
+"""
+import os
+import sys
+import time
+import statistics
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.services.llm_service import OpenAIProvider, AnthropicProvider, LocalLLMProvider
+from fake_llm_server import start_fake_server
+
+ROUNDS = 10
+MESSAGES = [{"role": "user", "content": "Suggest a short breathing exercise."}]
+
+def blocking_ms(provider):
+    """Blocking call: the first text arrives with the last."""
+    start = time.perf_counter()
+    provider.generate_chat(MESSAGES)
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, elapsed
+
+def streaming_ms(provider):
+    """Streamed call: (time to first chunk, time to last chunk)."""
+    start = time.perf_counter()
+    first = None
+    for _ in provider.generate_chat_stream(MESSAGES):
+        if first is None:
+            first = (time.perf_counter() - start) * 1000
+    return first, (time.perf_counter() - start) * 1000
+
+def main():
+    process, base_url, _ = start_fake_server()
+    try:
+        openai = OpenAIProvider("test")
+        openai.base_url = f"{base_url}/v1"
+        anthropic = AnthropicProvider("test")
+        anthropic.base_url = f"{base_url}/v1"
+        local = LocalLLMProvider(base_url)
+
+        print(f"{'provider':<20} {'mode':<10} {'first text ms':>14} {'complete ms':>12}")
+        for provider in (openai, anthropic, local):
+            provider.session.headers["X-Simulate-Generation"] = "1"
+            name = type(provider).__name__
+            for mode, call in (("blocking", blocking_ms), ("stream", streaming_ms)):
+                timings = [call(provider) for _ in range(ROUNDS)]
+                first = statistics.median(ttft for ttft, _ in timings)
+                complete = statistics.median(total for _, total in timings)
+                print(f"{name:<20} {mode:<10} {first:>14.1f} {complete:>12.1f}")
+    finally:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark suite for app.utils.ml_utils on synthetic histories.
+
+Times detect_cognitive_trends, predict_cognitive_decline and
+generate_cognitive_report at 10, 1k, 100k and 1M sessions, writes the results
+to a JSON file and compares them with a stored baseline.
+
+Run from the backend directory:
+    python benchmarks/bench_ml_utils.py                    # compare with baseline
+    python benchmarks/bench_ml_utils.py --update-baseline  # record a new baseline
+    python benchmarks/bench_ml_utils.py --sizes 10 1000    # quick run
+
+Exits with status 1 when any timing is slower than the baseline by more than
+the threshold (default 25%).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.utils.ml_utils import detect_cognitive_trends, predict_cognitive_decline, generate_cognitive_report
+from synthetic import make_history
+
+SIZES = (10, 1_000, 100_000, 1_000_000)
+
+BENCHMARKS = {
+    "detect_cognitive_trends": lambda df: detect_cognitive_trends(df),
+    "predict_cognitive_decline": lambda df: predict_cognitive_decline("patient-1", df),
+    "generate_cognitive_report": lambda df: generate_cognitive_report("patient-1", df),
+}
+
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results", "ml_utils.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline_ml_utils.json")
+
+# Timings below this are dominated by noise and never count as regressions
+NOISE_FLOOR_SECONDS = 0.001
+
+def time_call(fn, df, min_time=0.2, max_repeats=50):
+    """Best wall time in seconds over repeated calls, within a time budget."""
+    best = float("inf")
+    spent = 0.0
+    repeats = 0
+    while repeats < 3 or (spent < min_time and repeats < max_repeats):
+        start = time.perf_counter()
+        fn(df)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        repeats += 1
+    return best
+
+def run(sizes):
+    """Run every benchmark at every size and return the result records."""
+    results = []
+    for rows in sizes:
+        df = make_history(rows)
+        for name, fn in BENCHMARKS.items():
+            seconds = time_call(fn, df)
+            results.append({"name": name, "rows": rows, "seconds": seconds})
+            print(f"{name:<28} {rows:>9} rows {seconds * 1000:>10.3f} ms")
+    return results
+
+def compare(results, baseline, threshold):
+    """Return (name, rows, baseline, current) for every regression past the threshold."""
+    previous = {(r["name"], r["rows"]): r["seconds"] for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result["name"], result["rows"]))
+        if before is None:
+            continue
+        if result["seconds"] > NOISE_FLOOR_SECONDS and result["seconds"] > before * (1 + threshold):
+            regressions.append((result["name"], result["rows"], before, result["seconds"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ml_utils on synthetic histories")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="History sizes to run")
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    args = parser.parse_args()
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": run(args.sizes)
+    }
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --update-baseline to record one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(report["results"], baseline, args.threshold)
+    for name, rows, before, after in regressions:
+        print(f"REGRESSION {name} @ {rows} rows: {before * 1000:.3f} ms -> {after * 1000:.3f} ms "
+              f"(+{(after / before - 1) * 100:.0f}%)")
+    if regressions:
+        return 1
+
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Microbenchmark: pandas detect_cognitive_trends vs the NumPy fast path.
+
+Run from the backend directory:
+    python benchmarks/bench_trends.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+# Add parent directory to path to import app modules
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from app.utils.ml_utils import detect_cognitive_trends, detect_cognitive_trends_fast
+from synthetic import make_history
+
+SESSION_COUNTS = (5, 10, 25, 50, 100, 250, 500)
+
+def make_rows(sessions, seed=0):
+    """Score rows as they arrive from Supabase (list of dicts)."""
+    history = make_history(sessions, seed=seed)
+    history["created_at"] = history["created_at"].dt.strftime("%Y-%m-%dT%H:%M:%S")
+    return history.to_dict("records")
+
+def run_pandas(rows):
+    return detect_cognitive_trends(pd.DataFrame(rows))
+
+def run_numpy(rows):
+    return detect_cognitive_trends_fast(
+        [r["score"] for r in rows],
+        [r["duration"] for r in rows],
+        [r["errors"] for r in rows]
+    )
+
+def best_of(fn, rows, repeat=5):
+    """Best per-call time in microseconds."""
+    timer = timeit.Timer(lambda: fn(rows))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def main():
+    print(f"{'sessions':>8} {'pandas (us)':>12} {'numpy (us)':>11} {'speedup':>8}")
+    for sessions in SESSION_COUNTS:
+        rows = make_rows(sessions)
+        assert run_pandas(rows) == run_numpy(rows)
+        pandas_us = best_of(run_pandas, rows)
+        numpy_us = best_of(run_numpy, rows)
+        print(f"{sessions:>8} {pandas_us:>12.1f} {numpy_us:>11.1f} {pandas_us / numpy_us:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
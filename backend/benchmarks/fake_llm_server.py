@@ -0,0 +1,129 @@
+"""
+A minimal fake of the OpenAI, Anthropic and local chat APIs.
+
+Speaks HTTP/1.1 with keep-alive so pooled clients can reuse connections, and
+streams server-sent events (one word per TOKEN_DELAY) when a request sets
+"stream". Blocking replies take as long as the stream would when the
+X-Simulate-Generation header is set. Used by the provider benchmarks; never contacts a real provider.
+"""
+import json
+import time
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Take a slow breath in, and let it go."
+
+# Seconds between streamed tokens, roughly a hosted model's output rate
+TOKEN_DELAY = 0.02
+
+# Dimension of fake embeddings (text-embedding-ada-002 uses 1536)
+EMBEDDING_DIM = 1536
+
+def _embed(text):
+    """Deterministic pseudo-embedding of a text."""
+    seed = sum(ord(c) for c in str(text))
+    return [((seed * (i + 1)) % 1000) / 1000 for i in range(EMBEDDING_DIM)]
+
+def _stream_events(path, tokens):
+    """Server-sent event payloads in the provider's own streaming format."""
+    if path.endswith("/messages"):
+        yield {"type": "message_start", "message": {"usage": {"input_tokens": 12}}}
+        for token in tokens:
+            yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}
+        yield {"type": "message_delta", "usage": {"output_tokens": len(tokens)}}
+        yield {"type": "message_stop"}
+    else:
+        for token in tokens:
+            yield {"choices": [{"index": 0, "delta": {"content": token}}]}
+        yield "[DONE]"
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        # One handler instance per TCP connection
+        super().setup()
+        with self.server.connections.get_lock():
+            self.server.connections.value += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if request.get("stream"):
+            self._send_stream()
+            return
+
+        if self.headers.get("X-Simulate-Generation"):
+            # Take as long as streaming the reply would
+            time.sleep(TOKEN_DELAY * (len(REPLY.split(" ")) + 2))
+
+        if self.path.endswith("/messages"):
+            body = {
+                "content": [{"type": "text", "text": REPLY}],
+                "usage": {"input_tokens": 12, "output_tokens": 9}
+            }
+        elif self.path.endswith("/embeddings"):
+            inputs = request.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            body = {"data": [{"index": i, "embedding": _embed(text)} for i, text in enumerate(inputs)]}
+        else:
+            body = {
+                "choices": [{"message": {"role": "assistant", "content": REPLY}}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 9}
+            }
+
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self):
+        """Send the reply word by word as chunked server-sent events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        words = REPLY.split(" ")
+        tokens = [words[0]] + [" " + word for word in words[1:]]
+        try:
+            for event in _stream_events(self.path, tokens):
+                data = event if isinstance(event, str) else json.dumps(event)
+                chunk = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+                time.sleep(TOKEN_DELAY)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+def _serve(port, connections):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    server.daemon_threads = True
+    server.connections = connections
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+def start_fake_server():
+    """Start the fake server in its own process so it doesn't share the GIL.
+
+    Returns:
+        tuple: (process, base_url, connections) where connections is a shared
+        counter of TCP connections accepted so far
+    """
+    port = multiprocessing.Value("i", 0)
+    connections = multiprocessing.Value("i", 0)
+    process = multiprocessing.Process(target=_serve, args=(port, connections), daemon=True)
+    process.start()
+    while not port.value:
+        pass
+    return process, f"http://127.0.0.1:{port.value}", connections
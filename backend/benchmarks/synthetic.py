@@ -0,0 +1,46 @@
+"""
+Synthetic game histories for benchmarks.
+
+Histories look like game_scores rows: a few game types per patient, scores
+with a slow drift plus noise, durations and error counts that move against
+the score, and one session per few hours.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+GAME_IDS = ("memory", "attention", "problem_solving")
+
+def make_history(rows, patient_id="patient-1", games=GAME_IDS, drift=-0.001, seed=0):
+    """
+    Build a synthetic game history.
+
+    Args:
+        rows (int): Number of game sessions
+        patient_id (str): Patient the sessions belong to
+        games (tuple): Game ids to spread the sessions over
+        drift (float): Average score change per session
+        seed (int): Random seed, so every run sees identical data
+
+    Returns:
+        DataFrame: Sessions with created_at, game_id, score, duration and errors
+    """
+    rng = np.random.default_rng(seed)
+    index = np.arange(rows)
+
+    score = np.clip(80 + drift * index + rng.normal(0, 6, rows), 0, 100).round()
+    duration = np.clip(60 - (score - 80) * 0.5 + rng.normal(0, 5, rows), 5, None).round()
+    errors = rng.poisson(np.clip((100 - score) / 8, 0.1, None))
+
+    start = np.datetime64(datetime(2020, 1, 1))
+    created_at = start + (index * 4 * 3600 + rng.integers(0, 3600, rows)).astype("timedelta64[s]")
+
+    return pd.DataFrame({
+        "patient_id": patient_id,
+        "created_at": created_at,
+        "game_id": np.asarray(games)[rng.integers(0, len(games), rows)],
+        "score": score.astype(int),
+        "duration": duration.astype(int),
+        "errors": errors.astype(int)
+    })
@@ -0,0 +1,16 @@
+-- Stored summaries of earlier messages, loaded with the recent tail when a conversation resumes
+ALTER TABLE caregiver_conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE caregiver_conversations ADD COLUMN IF NOT EXISTS summary_updated_at TIMESTAMP WITH TIME ZONE;
+
+-- Keyset pagination of messages walks (conversation_id, timestamp, id) newest first;
+-- the id breaks ties between messages stored by different workers
+CREATE INDEX IF NOT EXISTS conversation_messages_conversation_timestamp_id_idx
+    ON conversation_messages(conversation_id, timestamp DESC, id DESC);
+
+-- Superseded by the composite index above
+DROP INDEX IF EXISTS conversation_messages_conversation_id_idx;
+DROP INDEX IF EXISTS conversation_messages_conversation_timestamp_idx;
+
+-- Conversation lists are ordered by last activity
+CREATE INDEX IF NOT EXISTS caregiver_conversations_caregiver_updated_idx
+    ON caregiver_conversations(caregiver_id, updated_at DESC);
@@ -0,0 +1,44 @@
+-- Enable UUID extension if not already enabled
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+-- Precomputed cognitive reports, one row per patient (written by the nightly batch job)
+CREATE TABLE IF NOT EXISTS cognitive_reports (
+    patient_id UUID PRIMARY KEY,
+    report JSONB NOT NULL,
+    prediction JSONB NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_cognitive_reports_generated_at ON cognitive_reports(generated_at);
+
+-- Throughput statistics for each batch run
+CREATE TABLE IF NOT EXISTS report_batch_runs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    finished_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    patients INTEGER NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    workers INTEGER NOT NULL DEFAULT 1,
+    elapsed_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    patients_per_second DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+-- Enable Row Level Security
+ALTER TABLE cognitive_reports ENABLE ROW LEVEL SECURITY;
+
+-- Caregivers can read reports for their patients
+CREATE POLICY cognitive_reports_select_policy ON cognitive_reports
+    FOR SELECT
+    USING (
+        auth.uid()::text = patient_id::text OR
+        EXISTS (
+            SELECT 1 FROM caregiver_patients
+            WHERE caregiver_id = auth.uid()
+            AND patient_id = cognitive_reports.patient_id
+        )
+    );
+
+-- Grant appropriate permissions
+GRANT SELECT ON cognitive_reports TO authenticated;
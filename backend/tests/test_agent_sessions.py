@@ -0,0 +1,64 @@
+import unittest
+import time
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.agent_sessions import AgentSession, AgentSessionStore
+from app.services.agent_service import get_game_agent, get_therapy_agent
+from app.utils.prompt_builder import count_message_tokens
+
+class TestAgentSessions(unittest.TestCase):
+
+    def test_sessions_are_per_user_and_conversation_and_evicted_lru(self):
+        """Each (user, conversation) has its own history; the least recently used is evicted."""
+        store = AgentSessionStore(max_sessions=2)
+        store.get("ann", "c1").append({"role": "user", "content": "Hi"})
+        self.assertEqual(store.get("bob", "c1").messages, [])
+        self.assertEqual(len(store.get("ann", "c1").messages), 1)
+
+        store.get("bob", "c2")
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get("ann", "c1").messages[0]["content"], "Hi")
+        self.assertEqual(store.get("bob", "c1").messages, [])
+
+    def test_history_is_token_bounded(self):
+        """The oldest exchanges are dropped whole once the history exceeds its token budget."""
+        session = AgentSession(max_tokens=60)
+        for n in range(10):
+            session.append({"role": "user", "content": f"Question {n} " * 3},
+                           {"role": "assistant", "content": f"Answer {n} " * 4})
+        messages = session.messages
+        self.assertLess(len(messages), 20)
+        self.assertEqual(messages[0]["role"], "user")
+        self.assertEqual(messages[-1]["content"], "Answer 9 " * 4)
+
+    def test_older_turns_are_folded_into_a_running_summary(self):
+        """History stays under the summary threshold without losing any question."""
+        def summarize(summary, messages):
+            return (summary or "Asked about") + "".join(f" {m['content'].split()[1]}" for m in messages
+                                                        if m["role"] == "user")
+
+        session = AgentSession(max_tokens=200, summarizer=summarize, summarize_at=100, keep_tokens=40)
+        for n in range(20):
+            session.append({"role": "user", "content": f"Question {n} " * 3},
+                           {"role": "assistant", "content": f"Answer {n} " * 4})
+            while session._summarizing:
+                time.sleep(0.01)
+            self.assertLessEqual(count_message_tokens(session.messages), 100)
+
+        recent = [m["content"].split()[1] for m in session.messages if m["role"] == "user"]
+        self.assertEqual(session.summary.split()[2:] + recent, [str(n) for n in range(20)])
+
+    def test_agents_are_views_over_the_conversation(self):
+        """Agents for the same conversation share its history; one-off agents start empty."""
+        agent = get_game_agent("local", "ann", "test-views")
+        agent._record_exchange("Hello", "Hi there")
+        self.assertEqual(get_game_agent("local", "ann", "test-views").history, agent.history)
+        self.assertEqual(get_game_agent("local").history, [])
+        self.assertIsNot(get_therapy_agent("local"), get_therapy_agent("local"))
+
+if __name__ == '__main__':
+    unittest.main()
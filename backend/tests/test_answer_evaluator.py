@@ -0,0 +1,66 @@
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.answer_evaluator import evaluate_locally, edit_distance
+from app.utils.structured_output import validate
+from app.services.agent_service import GameAgent
+from app.services.llm_metrics import get_metrics
+
+def exercise(solution, criteria=""):
+    return {"title": "Test", "instructions": "", "content": "", "solution": solution, "validation_criteria": criteria}
+
+class TestLocalEvaluation(unittest.TestCase):
+
+    def test_checkable_answers_are_scored_locally(self):
+        """Exact, normalized, misspelled, numeric, set and sequence answers get a score without the LLM."""
+        cases = [
+            (exercise("Elephant"), "elephant!", (True, 100, "normalized")),
+            (exercise("elephant", "Minor misspellings are accepted"), "elefant", (True, 90, "fuzzy")),
+            (exercise("42"), "42.0", (True, 100, "numeric")),
+            (exercise("42"), "41", (False, 0, "numeric")),
+            (exercise("cat", "Must match the solution exactly"), "dog", (False, 0, "exact")),
+            (exercise("Paris", "Case-sensitive"), "paris", (False, 0, "exact")),
+            (exercise("Paris", "Exact spelling"), " Paris ", (True, 100, "exact")),
+            (exercise(["red", "green", "blue"]), "Blue, red and green", (True, 100, "set")),
+            (exercise(["red", "green", "blue", "pink"]), "red, blue", (True, 50, "set")),
+            (exercise("1, 2, 3, 4", "Numbers in the correct order"), "1 3 2 4", (True, 50, "sequence")),
+        ]
+        for case, answer, expected in cases:
+            with self.subTest(answer=answer):
+                evaluation = evaluate_locally(case, answer)
+                validate(evaluation, "evaluation")
+                self.assertEqual((evaluation["correct"], evaluation["score"], evaluation["method"]), expected)
+
+    def test_free_form_and_ambiguous_answers_escalate(self):
+        """Open-ended criteria, long or structured solutions and unruled mismatches go to the LLM."""
+        cases = [
+            (exercise("Paris", "Accept any reasonable capital city"), "Lyon"),
+            (exercise("Birds migrate to find food and warmer weather"), "For food"),
+            (exercise({"steps": ["a", "b"]}), "a then b"),
+            (exercise("cat"), "kitten"),
+            (exercise("house"), "horse"),
+            (exercise("cat", "The answer must be a valid English word using all the letters"), "act"),
+            (exercise("listen", "Answer must be an anagram of the given word"), "silent"),
+            (exercise("blue", "Any colour of the sky counts"), "grey"),
+        ]
+        for case, answer in cases:
+            with self.subTest(answer=answer):
+                self.assertIsNone(evaluate_locally(case, answer))
+
+    def test_edit_distance_stops_at_limit(self):
+        self.assertEqual(edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(edit_distance("kitten", "sitting", limit=1), 2)
+
+    def test_local_fraction_is_reported(self):
+        """Evaluations handled locally are counted against those that needed the LLM."""
+        get_metrics().clear()
+        GameAgent("local").evaluate_answer(exercise("seven"), "Seven")
+        get_metrics().record_evaluation("llm")
+        self.assertEqual(get_metrics().snapshot()["evaluations"]["local_fraction"], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.change_detection import PageHinkley, detect_change_points, detect_decline_change_points
+from app.utils.ml_utils import generate_cognitive_report, predict_cognitive_decline
+
+class TestChangeDetection(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up a history with a mid-history drop in memory scores."""
+        rng = np.random.default_rng(1)
+        self.drop_scores = np.r_[rng.normal(80, 4, 30), rng.normal(62, 4, 10)].round()
+        self.stable_scores = np.array([80, 82, 79, 81, 80, 78, 81, 79, 80, 81] * 4)
+        
+        dates = [datetime(2024, 1, 1) + timedelta(days=i) for i in range(40)]
+        self.history = pd.DataFrame({
+            'created_at': dates * 2,
+            'game_id': ['memory'] * 40 + ['attention'] * 40,
+            'score': np.r_[self.drop_scores, self.stable_scores],
+            'duration': [50] * 80,
+            'errors': [2] * 80
+        })
+    
+    def test_detects_mid_history_drop(self):
+        """A drop after 30 sessions is found shortly after it happens."""
+        points = detect_change_points(self.drop_scores)
+        self.assertEqual(len(points), 1)
+        self.assertGreaterEqual(points[0]["index"], 30)
+        self.assertLess(points[0]["index"], 36)
+    
+    def test_stable_series_has_no_change_points(self):
+        """Normal session-to-session noise does not raise alarms."""
+        self.assertEqual(detect_change_points(self.stable_scores), [])
+    
+    def test_incremental_matches_batch(self):
+        """Feeding sessions one by one through saved state matches a batch scan."""
+        state = None
+        alarms = []
+        for index, value in enumerate(self.drop_scores):
+            detector = PageHinkley(state=state)
+            if detector.update(value):
+                alarms.append(index)
+            state = detector.state()
+        self.assertEqual(alarms, [p["index"] for p in detect_change_points(self.drop_scores)])
+    
+    def test_errors_increase(self):
+        """Error counts are watched for increases."""
+        errors = np.r_[[2] * 20, [6] * 10]
+        points = detect_change_points(errors, drift=0.75, threshold=10.0, direction='increase')
+        self.assertEqual(len(points), 1)
+        self.assertEqual(detect_change_points(errors[::-1], drift=0.75, threshold=10.0, direction='increase'), [])
+    
+    def test_per_game_change_points_in_report(self):
+        """Change points are reported per game type with dates."""
+        points = detect_decline_change_points(self.history)
+        self.assertEqual({p["game_id"] for p in points}, {"memory"})
+        
+        report = generate_cognitive_report("patient-1", self.history)
+        self.assertEqual(report["change_points"], points)
+        self.assertIn("change_points", report["game_analysis"]["memory"])
+        self.assertNotIn("change_points", report["game_analysis"]["attention"])
+        self.assertTrue(any("memory" in r for r in report["recommendations"]))
+    
+    def test_prediction_flags_mid_history_drop(self):
+        """A drop in the middle of the history raises the risk level even when head and tail agree."""
+        history = self.history[self.history['game_id'] == 'memory'].copy()
+        history['score'] = np.r_[history['score'].to_numpy()[:35], [80] * 5]
+        prediction = predict_cognitive_decline("patient-1", history)
+        self.assertTrue(prediction["change_points"])
+        self.assertNotEqual(prediction["risk_level"], "low")
+
+if __name__ == '__main__':
+    unittest.main()
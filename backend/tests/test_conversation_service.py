@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+import threading
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The Supabase client needs credentials to import; requests never leave the test
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+from app.services.conversation_service import ConversationWriter, get_messages
+from app.services.agent_service import Agent
+
+def exchange(n):
+    return [{"role": "user", "content": f"Question {n}"}, {"role": "assistant", "content": f"Answer {n}"}]
+
+class TestConversationWriter(unittest.TestCase):
+
+    def test_messages_are_written_in_batches_with_increasing_timestamps(self):
+        """A full batch is written in one call, in order, with strictly increasing timestamps."""
+        batches = []
+        written = threading.Event()
+        writer = ConversationWriter(write_rows=lambda rows: batches.append(rows) or written.set(),
+                                    batch_size=4, flush_interval=60)
+        writer.append("c1", exchange(1))
+        writer.append("c2", [{"role": "system", "content": "Not stored"}] + exchange(2))
+
+        self.assertTrue(written.wait(5))
+        self.assertEqual(len(batches), 1)
+        rows = batches[0]
+        self.assertEqual([row["message"] for row in rows], ["Question 1", "Answer 1", "Question 2", "Answer 2"])
+        timestamps = [row["timestamp"] for row in rows]
+        self.assertEqual(sorted(set(timestamps)), timestamps)
+
+    def test_failed_write_keeps_messages_pending(self):
+        """Messages stay readable and are retried after a failed write."""
+        def fail(rows):
+            raise ConnectionError("offline")
+
+        writer = ConversationWriter(write_rows=fail, batch_size=100, flush_interval=60)
+        writer.append("c1", exchange(1))
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(len(writer.pending("c1")), 2)
+
+        batches = []
+        writer._write_rows = batches.append
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.pending("c1"), [])
+
+class TestMessagePaging(unittest.TestCase):
+
+    def test_cursor_breaks_timestamp_ties_on_id(self):
+        """Pages continue after the last (timestamp, id), so messages sharing a timestamp aren't skipped."""
+        timestamp = "2026-10-19T10:00:00.000001+00:00"
+        a1, b2, c3 = (f"{n}0000000-0000-4000-8000-000000000000" for n in "abc")
+        response = mock.Mock(status_code=200)
+        response.json.return_value = [
+            {"id": b2, "sender": "assistant", "message": "Answer", "timestamp": timestamp},
+            {"id": a1, "sender": "user", "message": "Question", "timestamp": timestamp}
+        ]
+        with mock.patch("app.services.supabase_client.requests.get", return_value=response) as get:
+            page = get_messages("c1", before=f"{timestamp},{c3}", limit=2)
+
+        url = get.call_args.args[0]
+        self.assertIn("or=(timestamp.lt.%22", url)
+        self.assertIn(f"id.lt.{c3}))", url)
+        self.assertIn("order=timestamp.desc,id.desc", url)
+        self.assertEqual([m["id"] for m in page["messages"]], [a1, b2])
+        self.assertEqual(page["next_cursor"], f"{timestamp},{a1}")
+
+    def test_malformed_cursor_is_rejected(self):
+        """Only a timestamp and a UUID are accepted, so a cursor can't add filter terms."""
+        cursors = [
+            "2026-10-19T10:00:00+00:00,x),id.gt.0,or(id.eq.1",
+            "2026-10-19T10:00:00+00:00),conversation_id.neq.(c1",
+            "not a timestamp",
+        ]
+        with mock.patch("app.services.supabase_client.requests.get") as get:
+            for cursor in cursors:
+                with self.subTest(cursor=cursor):
+                    with self.assertRaises(ValueError):
+                        get_messages("c1", before=cursor)
+        get.assert_not_called()
+
+class TestResumedConversation(unittest.TestCase):
+
+    def test_summary_and_tail_precede_the_query(self):
+        """A resumed session sends the stored summary and recent messages, loaded once."""
+        agent = Agent("local")
+        loads = []
+        load = lambda: loads.append(1) or ("Discussed sleep problems.", exchange(9))
+        agent.session.hydrate(load)
+        agent.session.hydrate(load)
+
+        messages = agent._build_messages("And tonight?", "System prompt")
+        self.assertEqual(len(loads), 1)
+        self.assertEqual([m["role"] for m in messages], ["system", "system", "user", "assistant", "user"])
+        self.assertIn("Discussed sleep problems.", messages[1]["content"])
+
+    def test_session_reloads_when_another_worker_stored_turns(self):
+        """A newer stored version replaces the session's summary and tail; an unchanged one is not reloaded."""
+        agent = Agent("local")
+        stored = {"version": ("t1", None), "messages": exchange(1)}
+        loads = []
+        load = lambda: loads.append(1) or (None, stored["messages"])
+
+        agent.session.hydrate(load, stored["version"])
+        agent.session.hydrate(load, stored["version"])
+        self.assertEqual(len(loads), 1)
+
+        stored.update(version=("t2", None), messages=exchange(1) + exchange(2))
+        agent.session.hydrate(load, stored["version"])
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(agent.history[-1]["content"], "Answer 2")
+
+if __name__ == '__main__':
+    unittest.main()
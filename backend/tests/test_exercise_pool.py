@@ -0,0 +1,59 @@
+import unittest
+import fcntl
+import itertools
+import sys
+import os
+import tempfile
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.exercise_pool import ExercisePool
+
+def exercise(n):
+    return {"title": f"Exercise {n}", "instructions": "Unscramble", "content": "tac", "hints": ["animal"],
+            "solution": "cat", "validation_criteria": "exact match"}
+
+class TestExercisePool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "pool.sqlite3")
+        counter = itertools.count()
+
+        def generate(game_type, difficulty):
+            n = next(counter)
+            # Every third response is malformed and must never be served
+            return {"title": "Broken"} if n % 3 == 2 else exercise(n)
+
+        self.pool = ExercisePool(self.path, size=4, low_water=1, generate=generate,
+                                 seed_keys=[("word puzzle", "easy")],
+                                 known_keys=[("word puzzle", "easy"), ("memory", "hard")])
+        self.pool.start = lambda: None
+        self.pool.concurrency = 1
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_refill_stores_only_valid_exercises_and_take_serves_each_once(self):
+        """Bulk refill discards schema mismatches; requested known pairs are kept warm, made-up ones never."""
+        self.assertEqual(self.pool.refill(), 3)
+        self.assertEqual(self.pool.counts(), {("word puzzle", "easy"): 3})
+
+        served = [self.pool.take("word puzzle", "easy")["title"] for _ in range(3)]
+        self.assertEqual(served, ["Exercise 0", "Exercise 1", "Exercise 3"])
+        self.assertIsNone(self.pool.take("word puzzle", "easy"))
+        self.assertIsNone(self.pool.take("memory", "hard"))
+        self.assertIn(("memory", "hard"), self.pool.counts())
+        self.assertIsNone(self.pool.take("made up", "impossible"))
+        self.assertNotIn(("made up", "impossible"), self.pool.counts())
+
+    def test_only_one_worker_refills_at_a_time(self):
+        """A worker finding the fill lock held skips its pass."""
+        with open(self.path + ".fill", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.assertEqual(ExercisePool(self.path, size=4, low_water=1, seed_keys=[]).refill(), 0)
+        self.assertGreater(self.pool.refill(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
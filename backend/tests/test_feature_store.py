@@ -0,0 +1,62 @@
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.feature_store import FeatureStore
+
+class TestFeatureStore(unittest.TestCase):
+    
+    def setUp(self):
+        """Create a small store in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "features.bin")
+        self.store = FeatureStore(path=self.path, capacity=8)
+        self.sessions = [
+            {"score": s, "duration": 60 - i, "errors": e, "created_at": f"2024-01-{i + 1:02d}T10:00:00"}
+            for i, (s, e) in enumerate([(70, 5), (72, 5), (75, 4), (73, 4), (78, 3), (80, 3), (82, 2)])
+        ]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_incremental_features_match_full_aggregation(self):
+        """Incremental ingestion produces the same numbers as aggregating raw rows."""
+        for session in self.sessions:
+            self.store.ingest("patient-1", session)
+        
+        features = self.store.get("patient-1")
+        scores = [s["score"] for s in self.sessions]
+        errors = [s["errors"] for s in self.sessions]
+        
+        self.assertEqual(features["sessions"], len(scores))
+        self.assertAlmostEqual(features["mean_score"], np.mean(scores))
+        self.assertAlmostEqual(features["rolling_score"], np.mean(scores[-5:]))
+        self.assertAlmostEqual(features["rolling_errors"], np.mean(errors[-5:]))
+        self.assertAlmostEqual(features["score_slope"], np.polyfit(range(len(scores)), scores, 1)[0])
+        self.assertAlmostEqual(features["errors_slope"], np.polyfit(range(len(errors)), errors, 1)[0])
+        self.assertEqual(features["last_score"], 82)
+    
+    def test_shared_between_instances(self):
+        """A second mapping of the same file sees writes from the first."""
+        self.store.ingest("patient-1", self.sessions[0])
+        other = FeatureStore(path=self.path, capacity=8)
+        self.assertEqual(other.get("patient-1"), self.store.get("patient-1"))
+        self.assertIsNone(other.get("patient-2"))
+    
+    def test_rebuild_orders_sessions_by_date(self):
+        """A full rebuild replaces incremental state and sorts each history."""
+        self.store.ingest("stale-patient", self.sessions[0])
+        rows = [dict(s, patient_id="patient-1") for s in reversed(self.sessions)]
+        self.store.rebuild(rows)
+        
+        self.assertIsNone(self.store.get("stale-patient"))
+        self.assertEqual(self.store.get("patient-1")["last_score"], 82)
+        self.assertFalse(self.store.needs_rebuild())
+
+if __name__ == '__main__':
+    unittest.main()
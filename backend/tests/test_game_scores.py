@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The Supabase client needs credentials to import; requests never leave the test
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+from app.services import game_service
+
+class TestLogGameScore(unittest.TestCase):
+
+    def setUp(self):
+        self.game = game_service.MOCK_GAMES[0]
+        patcher = mock.patch.object(game_service, "get_game_by_id", return_value=self.game)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def log(self, response):
+        with mock.patch("app.services.supabase_client.requests.post", return_value=response), \
+                mock.patch.object(game_service, "record_session", return_value=["score"]) as record, \
+                mock.patch.object(game_service, "MOCK_SCORES", []):
+            result = game_service.log_game_score("patient-1", self.game["id"], 70, 120, 2)
+        return result, record
+
+    def test_stored_score_records_session(self):
+        """A stored score is folded into the patient's features and reports change points."""
+        response = mock.Mock(status_code=201)
+        response.json.return_value = [{"id": "score-1", "score": 70}]
+        result, record = self.log(response)
+
+        record.assert_called_once()
+        self.assertEqual(result["id"], "score-1")
+        self.assertEqual(result["change_points"], ["score"])
+
+    def test_failed_insert_records_nothing(self):
+        """A score that never reached Supabase does not count as a session."""
+        response = mock.Mock(status_code=500, text="unavailable")
+        result, record = self.log(response)
+
+        record.assert_not_called()
+        self.assertNotIn("change_points", result)
+
+if __name__ == '__main__':
+    unittest.main()
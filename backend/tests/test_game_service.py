@@ -8,8 +8,7 @@ import os
 # Add parent directory to path to import app modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.utils.ml_utils import detect_cognitive_trends
-from app.services.game_service import generate_recommendations
+from app.utils.ml_utils import detect_cognitive_trends, generate_cognitive_report
 
 class TestGameService(unittest.TestCase):
     
@@ -75,25 +74,17 @@ class TestGameService(unittest.TestCase):
     
     def test_generate_recommendations_improving(self):
         """Test recommendation generation for improving trend."""
-        stats = {
-            "total_games": 10,
-            "avg_score": 80,
-            "avg_duration": 50,
-            "avg_errors": 2
-        }
-        recommendations = generate_recommendations('improving', stats)
+        report = generate_cognitive_report('patient-1', self.improving_data)
+        recommendations = report["recommendations"]
+        self.assertEqual(report["overall_trend"], 'improving')
         self.assertTrue(len(recommendations) > 0)
         self.assertTrue(any('challenge' in r.lower() for r in recommendations))
     
     def test_generate_recommendations_declining(self):
         """Test recommendation generation for declining trend."""
-        stats = {
-            "total_games": 10,
-            "avg_score": 70,
-            "avg_duration": 60,
-            "avg_errors": 5
-        }
-        recommendations = generate_recommendations('declining', stats)
+        report = generate_cognitive_report('patient-1', self.declining_data)
+        recommendations = report["recommendations"]
+        self.assertEqual(report["overall_trend"], 'declining')
         self.assertTrue(len(recommendations) > 0)
         self.assertTrue(any('focus' in r.lower() for r in recommendations))
 
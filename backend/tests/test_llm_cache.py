@@ -0,0 +1,126 @@
+import unittest
+import time
+import numpy as np
+import tempfile
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_cache import LLMCache, EmbeddingCache, make_cache_key
+from app.services.llm_service import LLMService, LocalLLMProvider
+
+class FlakyProvider(LocalLLMProvider):
+    """Fails on the first call, then answers; counts calls."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def _chat(self, messages, options=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError("provider unavailable")
+        return "Try a short walk after lunch."
+
+class BatchEmbeddingProvider(LocalLLMProvider):
+    """Embeds texts as [length, vowels]; records each batch it is sent."""
+    embedding_batch_size = 2
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def _embed_batch(self, texts):
+        self.batches.append(list(texts))
+        return [[len(t), sum(c in "aeiou" for c in t)] for t in texts]
+
+class TestLLMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_ignores_transport_options(self):
+        """Timeouts and cache flags don't change what the model returns."""
+        messages = [{"role": "user", "content": "Plan my day"}]
+        self.assertEqual(
+            make_cache_key("openai", messages, {"temperature": 0, "deadline": 5, "cache": True}),
+            make_cache_key("openai", messages, {"temperature": 0})
+        )
+        self.assertNotEqual(
+            make_cache_key("openai", messages, {"temperature": 0}),
+            make_cache_key("anthropic", messages, {"temperature": 0})
+        )
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        """The memory tier stays within max_entries, dropping the LRU entry."""
+        cache = LLMCache(self.path, max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertEqual(list(cache._memory), ["a", "c"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disk_tier_is_shared_and_expires(self):
+        """Another worker's cache sees entries on disk until they expire."""
+        writer = LLMCache(self.path)
+        reader = LLMCache(self.path)
+        writer.set("plan", "Morning walk", ttl=1)
+        self.assertEqual(reader.get("plan"), "Morning walk")
+        self.assertEqual(reader.stats()["disk_hits"], 1)
+
+        other = LLMCache(self.path)
+        writer._memory.clear()
+        time.sleep(1.1)
+        self.assertIsNone(other.get("plan"))
+        self.assertIsNone(writer.get("plan"))
+
+    def test_service_caches_only_successful_responses(self):
+        """Failures are returned as before but never cached."""
+        provider = FlakyProvider()
+        service = LLMService(providers={"local": provider}, cache=LLMCache(self.path))
+        messages = [{"role": "user", "content": "Suggest an activity"}]
+
+        self.assertTrue(service.generate_chat(messages, {"cache": True}, provider).startswith("Error generating response"))
+        self.assertEqual(service.generate_chat(messages, {"cache": True}, provider), "Try a short walk after lunch.")
+        self.assertEqual(service.generate_chat(messages, {"cache": True}, provider), "Try a short walk after lunch.")
+        self.assertEqual(provider.calls, 2)
+
+        # Default-temperature calls bypass the cache
+        service.generate_chat(messages, {}, provider)
+        self.assertEqual(provider.calls, 3)
+
+    def test_embedding_matrix_reuses_oldest_row_when_full(self):
+        """The in-memory float32 matrix never grows past max_rows."""
+        cache = EmbeddingCache(self.path, max_rows=3)
+        cache.set_many({key: np.full(4, i) for i, key in enumerate("abcd")})
+        self.assertEqual(cache._matrices[4].shape, (3, 4))
+        self.assertEqual(cache._matrices[4].dtype, np.float32)
+        self.assertNotIn("a", cache._rows)
+
+        # The evicted vector is still on disk
+        self.assertEqual(cache.get_many(["a", "d"])["a"].tolist(), [0, 0, 0, 0])
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_embed_many_batches_and_skips_cached_text(self):
+        """Only unseen, deduplicated text goes to the provider, in batches."""
+        provider = BatchEmbeddingProvider()
+        service = LLMService(providers={"local": provider}, embedding_cache=EmbeddingCache(self.path))
+
+        matrix = service.embed_many(["calm", "walk", "calm", "tea"], provider)
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.tolist(), [[4, 1], [4, 1], [4, 1], [3, 2]])
+        self.assertEqual(provider.batches, [["calm", "walk"], ["tea"]])
+
+        service.embed_many(["tea", "walk", "nap"], provider)
+        self.assertEqual(provider.batches[-1], ["nap"])
+        self.assertEqual(len(provider.batches), 3)
+
+if __name__ == '__main__':
+    unittest.main()
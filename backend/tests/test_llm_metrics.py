@@ -0,0 +1,87 @@
+import unittest
+import json
+import threading
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_service import LocalLLMProvider
+from app.services.llm_metrics import MetricsRegistry, get_metrics, metric_tags, usage_tokens
+
+class UsageHandler(BaseHTTPRequestHandler):
+    """Answers chat requests with token usage, or 429 when asked to."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if payload["messages"][-1]["content"] == "busy":
+            body, status = b"{}", 429
+        else:
+            body, status = json.dumps({
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 3}
+            }).encode("utf-8"), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class TestLLMMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), UsageHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.provider = LocalLLMProvider(f"http://127.0.0.1:{cls.server.server_address[1]}")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        get_metrics().clear()
+
+    def test_provider_calls_record_usage_errors_and_tags(self):
+        """Each call's latency, usage and error type land in its tagged series."""
+        with metric_tags(agent="CaregiverAgent", route="GET /api/caregiver/recommendations/<patient_id>"):
+            self.provider.generate_chat([{"role": "user", "content": "Hi"}], {"model": "small"})
+            self.provider.generate_chat([{"role": "user", "content": "Hi"}], {"model": "small"})
+            self.provider.generate_chat([{"role": "user", "content": "busy"}], {"model": "small"})
+
+        calls = get_metrics().snapshot()["calls"]
+        self.assertEqual(len(calls), 1)
+        series = calls[0]
+        self.assertEqual((series["provider"], series["model"], series["endpoint"], series["agent"]),
+                         ("local", "small", "v1/chat/completions", "CaregiverAgent"))
+        self.assertEqual(series["latency"]["count"], 3)
+        self.assertEqual((series["prompt_tokens"], series["completion_tokens"]), (24, 6))
+        self.assertEqual(series["errors"], {"HTTP 429": 1})
+
+    def test_usage_counts_cached_prompt_tokens_for_both_providers(self):
+        """Prompt totals include cached tokens whether reported inside or beside input tokens."""
+        openai = {"prompt_tokens": 2000, "completion_tokens": 50, "prompt_tokens_details": {"cached_tokens": 1536}}
+        anthropic = {"input_tokens": 464, "cache_read_input_tokens": 1536, "output_tokens": 50}
+        self.assertEqual(usage_tokens(openai), (2000, 50, 1536))
+        self.assertEqual(usage_tokens(anthropic), (2000, 50, 1536))
+
+    def test_cache_hit_rate_per_tag(self):
+        """Cache lookups are counted separately for each agent and route."""
+        metrics = MetricsRegistry()
+        with metric_tags(agent="GameAgent"):
+            metrics.record_cache("response", hits=3, misses=1)
+        metrics.record_cache("response", misses=1)
+
+        rates = {c["agent"]: c["hit_rate"] for c in metrics.snapshot()["caches"]}
+        self.assertEqual(rates, {"GameAgent": 0.75, "-": 0.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,331 @@
+import unittest
+import json
+import time
+import asyncio
+import threading
+import sys
+import os
+import tempfile
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_service import LLMService, OpenAIProvider, AnthropicProvider, LocalLLMProvider
+from app.services.agent_service import Agent
+from app.services.llm_cache import LLMCache
+from app.services.llm_metrics import get_metrics
+from app.services.model_router import ModelRouter
+
+TOKENS = ["Breathe", " in", " slowly"]
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """Serves each provider's streaming format as chunked server-sent events."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/messages"):
+            events = [{"type": "message_start", "message": {}}]
+            events += [{"type": "content_block_delta", "delta": {"type": "text_delta", "text": t}} for t in TOKENS]
+            events += [{"type": "message_stop"}]
+        else:
+            events = [{"choices": [{"delta": {"role": "assistant"}}]}]
+            events += [{"choices": [{"delta": {"content": t}}]} for t in TOKENS]
+            events += ["[DONE]"]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in events:
+                data = event if isinstance(event, str) else json.dumps(event)
+                chunk = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+class TestChatStreaming(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StreamingHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def providers(self):
+        openai = OpenAIProvider("test")
+        openai.base_url = f"{self.base_url}/v1"
+        anthropic = AnthropicProvider("test")
+        anthropic.base_url = f"{self.base_url}/v1"
+        return [openai, anthropic, LocalLLMProvider(self.base_url)]
+
+    def test_stream_yields_text_deltas_for_each_provider(self):
+        """Each provider's streaming format yields just the text deltas."""
+        messages = [{"role": "user", "content": "Help me relax"}]
+        for provider in self.providers():
+            with self.subTest(provider=provider.name):
+                self.assertEqual(list(provider.generate_chat_stream(messages)), TOKENS)
+
+    def test_closing_stream_closes_upstream_response(self):
+        """Abandoning a stream, as on client disconnect, releases the response."""
+        provider = self.providers()[0]
+        responses = []
+        post = provider.session.post
+        provider.session.post = lambda *args, **kwargs: responses.append(post(*args, **kwargs)) or responses[-1]
+
+        stream = provider.generate_chat_stream([{"role": "user", "content": "Hi"}])
+        self.assertEqual(next(stream), TOKENS[0])
+        self.assertFalse(responses[0].raw.closed)
+        stream.close()
+        self.assertTrue(responses[0].raw.closed)
+
+    def test_ask_stream_records_history_only_when_complete(self):
+        """A cancelled stream leaves no partial exchange in the history."""
+        agent = Agent("local")
+        agent.provider = self.providers()[2]
+
+        stream = agent.ask_stream("Hi")
+        next(stream)
+        stream.close()
+        self.assertEqual(agent.history, [])
+
+        self.assertEqual("".join(agent.ask_stream("Hi")), "".join(TOKENS))
+        self.assertEqual(agent.history[-1], {"role": "assistant", "content": "".join(TOKENS)})
+
+class TestPromptPrefix(unittest.TestCase):
+
+    def test_stable_context_precedes_history_and_anthropic_caches_it(self):
+        """System prompt and context lead the messages and become cached Anthropic system blocks."""
+        agent = Agent("local")
+        agent.history = [{"role": "user", "content": "Earlier"}, {"role": "assistant", "content": "Reply"}]
+        messages = agent._build_messages("Now", "System prompt", context=["Instructions", None, "Patient data"])
+        self.assertEqual([m["content"] for m in messages],
+                         ["System prompt", "Instructions", "Patient data", "Earlier", "Reply", "Now"])
+
+        payload = AnthropicProvider("test")._chat_payload(messages)
+        self.assertEqual([b["text"] for b in payload["system"]], ["System prompt", "Instructions", "Patient data"])
+        self.assertEqual([("cache_control" in b) for b in payload["system"]], [True, False, True])
+        self.assertEqual([m["role"] for m in payload["messages"]], ["user", "assistant", "user"])
+
+class CountingProvider(LocalLLMProvider):
+    """Records how many chat calls are in flight at once."""
+
+    def __init__(self):
+        os.environ["LLM_MAX_CONCURRENCY"] = "3"
+        try:
+            super().__init__()
+        finally:
+            del os.environ["LLM_MAX_CONCURRENCY"]
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def generate_chat(self, messages, options=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return messages[-1]["content"]
+
+class TestAsyncProvider(unittest.TestCase):
+
+    def test_concurrency_is_bounded_per_provider(self):
+        """Concurrent async calls never exceed max_concurrency."""
+        provider = CountingProvider()
+
+        async def run():
+            prompts = [[{"role": "user", "content": str(i)}] for i in range(12)]
+            return await asyncio.gather(*(provider.agenerate_chat(m) for m in prompts))
+
+        self.assertEqual(asyncio.run(run()), [str(i) for i in range(12)])
+        self.assertEqual(provider.peak, 3)
+
+        # The limit holds for calls from a new event loop as well
+        provider.peak = 0
+        asyncio.run(run())
+        self.assertEqual(provider.peak, 3)
+
+class ScriptedProvider(LocalLLMProvider):
+    """Answers after a fixed delay, or fails; records the options it was sent."""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    def _chat(self, messages, options=None):
+        self.calls.append(options)
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.name} unavailable")
+        return f"answer from {self.name}"
+
+    def generate_chat_stream(self, messages, options=None):
+        yield self._chat(messages, options)
+
+class TestProviderRouting(unittest.TestCase):
+
+    def service(self, *providers):
+        service = LLMService(providers={p.name: p for p in providers})
+        service.fallback_order = [p.name for p in providers]
+        service.cache = None
+        return service
+
+    def test_failed_provider_falls_back_in_order(self):
+        """Errors move on to the next provider, without the primary's model."""
+        openai, anthropic, local = ScriptedProvider("openai", fail=True), ScriptedProvider("anthropic", fail=True), ScriptedProvider("local")
+        service = self.service(openai, anthropic, local)
+
+        messages = [{"role": "user", "content": "Hi"}]
+        self.assertEqual(service.generate_chat(messages, {"model": "gpt-4o"}), "answer from local")
+        self.assertEqual(openai.calls, [{"model": "gpt-4o"}])
+        self.assertEqual(local.calls, [{}])
+
+        # Without fallback the primary's error is returned as before
+        response = service.generate_chat(messages, {"fallback": False})
+        self.assertTrue(response.startswith("Error generating response: openai unavailable"))
+
+    def test_fallback_answer_is_not_cached_as_primary(self):
+        """A response from a fallback provider is never served later as the primary's."""
+        openai, local = ScriptedProvider("openai", fail=True), ScriptedProvider("local")
+        service = self.service(openai, local)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            service.cache = LLMCache(os.path.join(tmpdir, "cache.sqlite3"))
+            messages = [{"role": "user", "content": "Hi"}]
+            options = {"temperature": 0}
+            self.assertEqual(service.generate_chat(messages, options), "answer from local")
+
+            openai.fail = False
+            self.assertEqual(service.generate_chat(messages, options), "answer from openai")
+            self.assertEqual(service.generate_chat(messages, options), "answer from openai")
+            self.assertEqual(len(openai.calls), 2)
+
+    def test_failed_call_is_not_recorded_in_history(self):
+        """An error response never enters the session history, whatever way the agent asked."""
+        local = ScriptedProvider("local", fail=True)
+        agent = Agent("local")
+        agent.llm_service = self.service(local)
+        agent.provider = local
+
+        self.assertTrue(agent.ask("Hi").startswith("Error generating response"))
+        self.assertTrue(asyncio.run(agent.aask("Hi")).startswith("Error generating response"))
+        with self.assertRaises(ConnectionError):
+            list(agent.ask_stream("Hi"))
+        self.assertEqual(agent.history, [])
+
+        local.fail = False
+        agent.ask("Hi")
+        self.assertEqual(agent.history[-1], {"role": "assistant", "content": "answer from local"})
+
+    def test_task_picks_tier_model_on_each_provider(self):
+        """A task's tier selects the model per provider; an explicit model still wins on the primary."""
+        openai, local = ScriptedProvider("openai", fail=True), ScriptedProvider("local")
+        service = self.service(openai, local)
+        service.router = ModelRouter(tier_models={"openai": {"fast": "gpt-4o-mini", "deep": "gpt-4o"},
+                                                  "local": {"fast": "small", "deep": "large"}})
+
+        messages = [{"role": "user", "content": "Hi"}]
+        service.generate_chat(messages, {"task": "note_insight"})
+        self.assertEqual(openai.calls[-1]["model"], "gpt-4o-mini")
+        self.assertEqual(local.calls[-1]["model"], "small")
+
+        service.generate_chat(messages, {"task": "analysis", "model": "gpt-4.1"})
+        self.assertEqual(openai.calls[-1]["model"], "gpt-4.1")
+        self.assertEqual(local.calls[-1]["model"], "large")
+
+        tasks = {t["task"]: t for t in get_metrics().snapshot()["tasks"]}
+        self.assertEqual(tasks["note_insight"]["latency"]["count"], 1)
+        self.assertEqual(tasks["note_insight"]["target_latency"], 3.0)
+
+    def test_slow_provider_is_hedged_after_latency_percentile(self):
+        """A call slower than the recorded p90 is raced against the next provider."""
+        slow, fast = ScriptedProvider("openai"), ScriptedProvider("local", delay=0.01)
+        service = self.service(slow, fast)
+        service.hedge_percentile = 90
+        service.hedge_min_delay = 0.0
+        service._latencies["openai"] = deque([0.05] * service.hedge_min_samples, maxlen=200)
+
+        slow.delay = 1.0
+        started = time.monotonic()
+        self.assertEqual(service.generate_chat([{"role": "user", "content": "Hi"}]), "answer from local")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(slow.calls), 1)
+
+class TestSingleFlight(unittest.TestCase):
+
+    def service(self, provider, cache=None):
+        service = LLMService(providers={provider.name: provider}, cache=cache)
+        service.fallback_order = [provider.name]
+        service.cache = cache
+        return service
+
+    def concurrently(self, calls):
+        results = [None] * len(calls)
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, calls[i]())) for i in range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_concurrent_calls_share_one_upstream_call(self):
+        """Callers of an in-flight request wait for it instead of calling again."""
+        provider = ScriptedProvider("local", delay=0.1)
+        service = self.service(provider)
+
+        messages = [{"role": "user", "content": "Recommend care approaches"}]
+        results = self.concurrently([lambda: service.generate_chat(messages)] * 8)
+        self.assertEqual(results, ["answer from local"] * 8)
+        self.assertEqual(len(provider.calls), 1)
+
+        # Failures are shared too, and nothing is left in flight
+        provider.fail = True
+        results = self.concurrently([lambda: service.generate_chat(messages)] * 4)
+        self.assertTrue(all(r.startswith("Error generating response") for r in results))
+        self.assertEqual(len(provider.calls), 2)
+        self.assertEqual(service._flights, {})
+
+        # Opting out makes separate calls
+        provider.fail = False
+        self.concurrently([lambda: service.generate_chat(messages, {"coalesce": False})] * 3)
+        self.assertEqual(len(provider.calls), 5)
+
+    def test_shared_flight_coalesces_across_workers(self):
+        """With LLM_SINGLE_FLIGHT_SHARED, other workers read the leader's result from the shared cache."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            providers, services = [], []
+            for _ in range(3):
+                # One service per simulated worker, sharing only the cache file
+                provider = ScriptedProvider("local", delay=0.2)
+                service = self.service(provider, LLMCache(os.path.join(tmpdir, "cache.sqlite3")))
+                service.single_flight_shared = True
+                service.single_flight_dir = tmpdir
+                providers.append(provider)
+                services.append(service)
+
+            messages = [{"role": "user", "content": "Recommend care approaches"}]
+            results = self.concurrently([lambda s=s: s.generate_chat(messages) for s in services])
+            self.assertEqual(results, ["answer from local"] * 3)
+            self.assertEqual(sum(len(p.calls) for p in providers), 1)
+            self.assertEqual([f for f in os.listdir(tmpdir) if f.endswith(".lock")], [])
+
+if __name__ == '__main__':
+    unittest.main()
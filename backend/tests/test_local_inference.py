@@ -0,0 +1,81 @@
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.local_inference import LocalInferenceEngine
+from app.services.llm_service import InProcessLLMProvider
+from app.utils.structured_output import response_schema
+
+class EchoModel:
+    """Stands in for a loaded llama_cpp.Llama: streams the last message back word by word."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def create_chat_completion(self, messages, stream, stopping_criteria, **params):
+        self.calls.append((messages, params))
+        self.started.set()
+        self.release.wait(5)
+        for word in messages[-1]["content"].split():
+            if stopping_criteria(None, None):
+                return
+            yield {"choices": [{"delta": {"content": word + " "}}]}
+
+def chat(system, query):
+    return [{"role": "system", "content": system}, {"role": "user", "content": query}]
+
+class TestLocalInferenceEngine(unittest.TestCase):
+
+    def test_queued_jobs_run_grouped_by_system_prompt(self):
+        """Jobs that queue up behind a running one run with the cached prompt first, then by prompt."""
+        model = EchoModel()
+        engine = LocalInferenceEngine(model=model)
+        model.release.clear()
+        first = engine.submit(chat("therapy", "a"))
+        self.assertTrue(model.started.wait(5))
+
+        jobs = [engine.submit(chat(system, query))
+                for system, query in (("game", "b"), ("therapy", "c"), ("game", "d"))]
+        model.release.set()
+
+        self.assertEqual([job.result() for job in [first] + jobs], ["a ", "b ", "c ", "d "])
+        self.assertEqual([messages[-1]["content"] for messages, _ in model.calls], ["a", "c", "b", "d"])
+
+    def test_queued_job_times_out_at_its_deadline(self):
+        """A job stuck behind a long generation fails at its deadline and is skipped."""
+        model = EchoModel()
+        engine = LocalInferenceEngine(model=model)
+        model.release.clear()
+        first = engine.submit(chat("s", "a"))
+        self.assertTrue(model.started.wait(5))
+
+        queued = engine.submit(chat("s", "b"), deadline=time.monotonic() + 0.1)
+        with self.assertRaises(TimeoutError):
+            queued.result()
+        self.assertTrue(queued.cancelled.is_set())
+
+        model.release.set()
+        self.assertEqual(first.result(), "a ")
+        self.assertEqual(len(model.calls), 1)
+
+    def test_provider_streams_and_requests_schema_grammar(self):
+        """The provider streams deltas and asks llama.cpp for schema-constrained JSON."""
+        model = EchoModel()
+        provider = InProcessLLMProvider(LocalInferenceEngine(model=model))
+
+        self.assertEqual(list(provider.generate_chat_stream(chat("s", "one two"))), ["one ", "two "])
+        options = {"response_schema": response_schema("evaluation"), "max_tokens": 50}
+        self.assertEqual(provider.generate_chat(chat("s", "{}"), options), "{}")
+        self.assertEqual(model.calls[-1][1]["response_format"]["schema"], response_schema("evaluation")["schema"])
+        self.assertEqual(model.calls[-1][1]["max_tokens"], 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.ml_utils import detect_cognitive_trends, detect_cognitive_trends_fast
+
+def make_history(rng, sessions, drift=0.0, with_zeros=False):
+    """Build a random game history with an optional score drift."""
+    start = datetime(2024, 1, 1)
+    scores = np.clip(np.round(70 + drift * np.arange(sessions) + rng.normal(0, 5, sessions)), 0, 100)
+    errors = rng.integers(0, 3 if with_zeros else 8, sessions) + (0 if with_zeros else 1)
+    return pd.DataFrame({
+        'created_at': [start + timedelta(days=i) for i in range(sessions)],
+        'game_id': ['memory'] * sessions,
+        'score': scores.astype(int),
+        'duration': rng.integers(30, 90, sessions),
+        'errors': errors
+    })
+
+class TestTrendFastPathParity(unittest.TestCase):
+    """The NumPy fast path must agree with the pandas implementation."""
+    
+    def assert_parity(self, df, columns=('score', 'duration', 'errors')):
+        expected = detect_cognitive_trends(df)
+        ordered = df.sort_values('created_at')
+        arrays = {c: ordered[c].to_numpy() for c in columns}
+        self.assertEqual(detect_cognitive_trends_fast(**arrays), expected)
+    
+    def test_random_histories(self):
+        """Random histories from 5 to 500 sessions with improving, flat and declining drift."""
+        rng = np.random.default_rng(42)
+        for sessions in (5, 6, 7, 9, 10, 11, 25, 100, 500):
+            for drift in (-1.0, -0.2, 0.0, 0.2, 1.0):
+                with self.subTest(sessions=sessions, drift=drift):
+                    self.assert_parity(make_history(rng, sessions, drift))
+    
+    def test_zero_values_drop_rows(self):
+        """0/0 rates of change are dropped and x/0 rates kept, as pandas does."""
+        rng = np.random.default_rng(7)
+        for sessions in (6, 8, 12, 40):
+            with self.subTest(sessions=sessions):
+                self.assert_parity(make_history(rng, sessions, with_zeros=True))
+    
+    def test_missing_values_drop_only_their_windows(self):
+        """A NaN score drops only the windows and rates that include it, as pandas does."""
+        rng = np.random.default_rng(11)
+        for sessions, missing in ((12, [3]), (20, [2, 9]), (40, [5, 6, 30]), (10, [8])):
+            with self.subTest(sessions=sessions, missing=missing):
+                df = make_history(rng, sessions, drift=0.8)
+                df['score'] = df['score'].astype(float)
+                df.loc[missing, 'score'] = np.nan
+                self.assert_parity(df)
+    
+    def test_unsorted_input(self):
+        """The pandas version sorts by date; the fast path takes sorted arrays."""
+        df = make_history(np.random.default_rng(3), 30, drift=0.5).sample(frac=1, random_state=1)
+        self.assert_parity(df)
+    
+    def test_missing_columns(self):
+        """Features that are absent are skipped in both implementations."""
+        df = make_history(np.random.default_rng(5), 20, drift=-0.5).drop(columns=['score'])
+        self.assert_parity(df, columns=('duration', 'errors'))
+    
+    def test_insufficient_data(self):
+        """Short histories report insufficient data."""
+        df = make_history(np.random.default_rng(9), 4)
+        self.assert_parity(df)
+        self.assertEqual(detect_cognitive_trends_fast()["trend"], "insufficient_data")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.prompt_builder import PromptBuilder, count_tokens, fit_messages
+
+class TestPromptBuilder(unittest.TestCase):
+
+    def test_prompt_is_unchanged_within_budget(self):
+        """Nothing is trimmed when every section fits."""
+        builder = PromptBuilder(budget=10000)
+        builder.add("Analyze:", required=True)
+        builder.add_items("\nGames:", ["\n- Memory 80", "\n- Stroop 75"], priority=1)
+        builder.add("\nRespond in JSON.", required=True)
+        self.assertEqual(builder.build(), "Analyze:\nGames:\n- Memory 80\n- Stroop 75\nRespond in JSON.")
+        self.assertEqual(builder.dropped, {})
+
+    def test_low_priority_sections_are_trimmed_first(self):
+        """Required text stays; lower priorities lose trailing items first."""
+        symptoms = [f"\n- Symptom {i}: occasional confusion in the evening" for i in range(20)]
+        therapy = [f"\n- Session {i}: music therapy, 30 minutes, calmer afterwards" for i in range(20)]
+        required = "Analyze the patient data."
+        budget = count_tokens(required) + count_tokens("\nSymptoms:") + sum(count_tokens(s) for s in symptoms[:12])
+
+        builder = PromptBuilder(budget=budget)
+        builder.add(required, required=True)
+        builder.add_items("\nTherapy:", therapy, priority=1)
+        builder.add_items("\nSymptoms:", symptoms, priority=3)
+        prompt = builder.build()
+
+        self.assertTrue(prompt.startswith(required + "\nSymptoms:" + "".join(symptoms[:12])))
+        self.assertNotIn("Therapy", prompt)
+        self.assertEqual(builder.dropped, {"Therapy:": 20, "Symptoms:": 8})
+        self.assertLessEqual(count_tokens(prompt), budget + 2)
+
+    def test_fit_messages_keeps_system_prompt_query_and_newest_history(self):
+        """Oldest history goes first; the system prompt and query always stay."""
+        history = []
+        for i in range(30):
+            history.append({"role": "user", "content": f"Question {i} about sleep routines and evening agitation"})
+            history.append({"role": "assistant", "content": f"Answer {i} with several practical suggestions for the caregiver"})
+        messages = [{"role": "system", "content": "You support caregivers."}] + history + [{"role": "user", "content": "And tonight?"}]
+
+        fitted = fit_messages(messages, budget=200)
+        self.assertEqual(fitted[0], messages[0])
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertEqual(fitted[-2], history[-1])
+        self.assertLess(len(fitted), len(messages))
+        self.assertEqual(fit_messages(messages, budget=100000), messages)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import time
+import tempfile
+import multiprocessing
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.rate_limiter import RateLimiter, RateLimitExceeded
+from app.services.llm_service import LLMService, LocalLLMProvider
+
+class QuotaProvider(LocalLLMProvider):
+    """Streams a fixed reply and embeds every text as [1.0]; counts requests sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def generate_chat_stream(self, messages, options=None):
+        self.requests += 1
+        yield "ok"
+
+    def _embed_batch(self, texts):
+        self.requests += 1
+        return [[1.0] for _ in texts]
+
+def _acquire_in_worker(path, calls, results):
+    """Worker process: take `calls` requests from the shared limiter."""
+    limiter = RateLimiter("test", requests_per_minute=600, burst_seconds=0.5, path=path)
+    for _ in range(calls):
+        limiter.acquire()
+    results.put(time.time())
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "rate.bin")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bucket_is_shared_across_processes(self):
+        """Workers draw from one quota, so together they queue to its rate."""
+        # 10 requests/s with a burst of 5: 4 workers x 5 calls need ~1.5s
+        results = multiprocessing.Queue()
+        started = time.time()
+        workers = [multiprocessing.Process(target=_acquire_in_worker, args=(self.path, 5, results))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        finished = max(results.get(timeout=10) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        self.assertGreater(finished - started, 1.3)
+        self.assertLess(finished - started, 4.0)
+
+    def test_token_quota_queues_then_gives_up_past_max_wait(self):
+        """A call waits for token refill, and raises when the wait would be too long."""
+        limiter = RateLimiter("test", tokens_per_minute=6000, burst_seconds=1, max_wait=0.5, path=self.path)
+        self.assertLess(limiter.acquire(100), 0.05)
+
+        # Bucket is empty; 20 tokens refill in 0.2s
+        waited = limiter.acquire(20)
+        self.assertGreater(waited, 0.15)
+
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire(100)
+
+    def test_streams_and_embeddings_take_the_shared_quota(self):
+        """Streamed chats and embedding batches wait for quota like blocking calls."""
+        provider = QuotaProvider()
+        service = LLMService(providers={"local": provider})
+        service.cache = service.embedding_cache = None
+        # Room for two requests, none refilling within the test
+        service.rate_limiters["local"] = RateLimiter("test", requests_per_minute=2, burst_seconds=60,
+                                                     max_wait=0, path=self.path)
+
+        messages = [{"role": "user", "content": "Hi"}]
+        self.assertEqual(list(service.generate_chat_stream(messages)), ["ok"])
+        self.assertEqual(service.embed_many(["a"]).tolist(), [[1.0]])
+        with self.assertRaises(RateLimitExceeded):
+            list(service.generate_chat_stream(messages))
+        self.assertEqual(service.embed_many(["b"]).shape, (1, 0))
+        self.assertEqual(provider.requests, 2)
+
+if __name__ == '__main__':
+    unittest.main()
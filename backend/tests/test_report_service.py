@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The Supabase client needs credentials to import; requests never leave the test
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+from app.services import report_service
+
+class TestReportBatch(unittest.TestCase):
+
+    def test_run_stats_are_recorded(self):
+        """The batch run's throughput row is posted to report_batch_runs without errors."""
+        response = mock.Mock(status_code=201)
+        response.json.return_value = []
+        with mock.patch("app.services.supabase_client.requests.post", return_value=response) as post, \
+                mock.patch.object(report_service, "stream_patient_histories", return_value=iter([])), \
+                self.assertNoLogs(report_service.logger, "ERROR"):
+            run = report_service.run_report_batch(workers=1)
+
+        url, = post.call_args.args
+        self.assertTrue(url.endswith("/report_batch_runs"))
+        self.assertEqual(post.call_args.kwargs["json"], run)
+
+    def test_histories_page_in_a_total_order(self):
+        """Pages are ordered down to the row id, so rows sharing a date can't shift between pages."""
+        response = mock.Mock(status_code=200)
+        response.json.return_value = [{"patient_id": "p1", "created_at": "2024-01-01"}]
+        with mock.patch("app.services.supabase_client.requests.get", return_value=response) as get:
+            histories = list(report_service.stream_patient_histories(page_size=10))
+
+        self.assertEqual(histories, [("p1", response.json.return_value)])
+        self.assertIn("order=patient_id.asc,created_at.asc,id.asc", get.call_args.args[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.structured_output import JSONStreamExtractor, StructuredOutputError, parse_structured, response_schema
+from app.services.llm_metrics import get_metrics
+from app.services.llm_service import OpenAIProvider, AnthropicProvider, LocalLLMProvider
+from app.services.agent_service import GameAgent
+
+EVALUATION = '{"correct": true, "score": 90, "feedback": "Well done"}'
+
+class TestParseStructured(unittest.TestCase):
+
+    def setUp(self):
+        get_metrics().clear()
+
+    def test_valid_responses_parse_with_or_without_fences(self):
+        """Plain, fenced and surrounded JSON all decode to the same object."""
+        for response in (EVALUATION, f"```json\n{EVALUATION}\n```", f"Here you go: {EVALUATION} Good luck!"):
+            with self.subTest(response=response):
+                self.assertEqual(parse_structured(response, "evaluation")["score"], 90)
+
+    def test_failures_are_raised_and_counted(self):
+        """Non-JSON and schema mismatches raise and are counted by outcome."""
+        with self.assertRaises(StructuredOutputError):
+            parse_structured("I can't answer that", "evaluation")
+        with self.assertRaisesRegex(StructuredOutputError, "score"):
+            parse_structured('{"correct": true, "score": 150, "feedback": "?"}', "evaluation")
+        parse_structured(EVALUATION, "evaluation")
+
+        entry = get_metrics().snapshot()["structured_output"][0]
+        self.assertEqual(entry["outcomes"], {"invalid_json": 1, "schema_mismatch": 1, "ok": 1})
+        self.assertAlmostEqual(entry["failure_rate"], 0.6667)
+
+EXERCISE = ('Sure! ```json\n{"title": "Say \\"hi\\", {twice}", "instructions": "Unscramble", '
+            '"content": ["tac", {"nested": [1, 2]}], "hints": ["animal"], "solution": "cat", '
+            '"validation_criteria": "exact"}\n```')
+
+class ScriptedProvider(LocalLLMProvider):
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+
+    def generate_chat_stream(self, messages, options=None):
+        yield from self.chunks
+
+class TestStreamedJson(unittest.TestCase):
+
+    def test_fields_are_emitted_as_they_close_at_any_chunking(self):
+        """Prose and fences are skipped; each top-level field is decoded once it is complete."""
+        fields = ["title", "instructions", "content", "hints", "solution", "validation_criteria"]
+        for size in (1, 4, len(EXERCISE)):
+            with self.subTest(size=size):
+                extractor = JSONStreamExtractor()
+                emitted = []
+                for i in range(0, len(EXERCISE), size):
+                    emitted += extractor.feed(EXERCISE[i:i + size])
+                self.assertEqual([field for field, _ in emitted], fields)
+                self.assertEqual(emitted[0][1], 'Say "hi", {twice}')
+                self.assertEqual(extractor.value["content"], ["tac", {"nested": [1, 2]}])
+                self.assertTrue(extractor.done)
+
+    def test_agent_streams_fields_before_the_validated_exercise(self):
+        """The title arrives while the rest is still generating; the whole exercise comes last."""
+        agent = GameAgent("local")
+        agent.provider = ScriptedProvider([EXERCISE[:60], EXERCISE[60:]])
+        events = agent.generate_exercise_stream("word puzzle", "easy")
+        self.assertEqual(next(events), {"field": "title", "value": 'Say "hi", {twice}'})
+        self.assertEqual(list(events)[-1]["exercise"]["solution"], "cat")
+
+class TestProviderJsonModes(unittest.TestCase):
+
+    messages = [{"role": "system", "content": "Respond in JSON"}, {"role": "user", "content": "Evaluate"}]
+
+    def test_each_provider_requests_its_json_mode(self):
+        """Schemas map to response_format, a forced tool call or a grammar."""
+        options = {"response_schema": response_schema("evaluation")}
+        schema = options["response_schema"]["schema"]
+
+        openai = OpenAIProvider("test")
+        payload = openai._chat_payload(self.messages, dict(options, model="gpt-4o-mini"))
+        self.assertEqual(payload["response_format"]["json_schema"]["schema"], schema)
+        payload = openai._chat_payload(self.messages, options)
+        self.assertEqual(payload["response_format"], {"type": "json_object"})
+
+        payload = AnthropicProvider("test")._chat_payload(self.messages, options)
+        self.assertEqual(payload["tools"][0]["input_schema"], schema)
+        self.assertEqual(payload["tool_choice"], {"type": "tool", "name": "evaluation"})
+
+        local = LocalLLMProvider()
+        self.assertEqual(local._chat_payload(self.messages, options)["response_format"]["type"], "json_schema")
+        local.json_mode = "grammar"
+        self.assertEqual(local._chat_payload(self.messages, options)["json_schema"], schema)
+
+if __name__ == '__main__':
+    unittest.main()